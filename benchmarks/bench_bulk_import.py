@@ -0,0 +1,45 @@
+"""
+Times importing a movie script's worth of conversations through
+/movies/{movie_id}/conversations/bulk. This writes to the database, so point it
+at a development copy.
+
+Usage: python -m benchmarks.bench_bulk_import [conversations] [lines_per_conversation]
+"""
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from src.api.server import app
+
+MOVIE_ID = 3
+CHARACTERS = (49, 55)
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    lines_per_conversation = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+
+    body = [
+        {
+            'character_1_id': CHARACTERS[0],
+            'character_2_id': CHARACTERS[1],
+            'lines': [
+                {'character_id': CHARACTERS[n % 2], 'line_text': f'bulk import benchmark line {n} of conversation {i}'}
+                for n in range(lines_per_conversation)
+            ],
+        }
+        for i in range(conversations)
+    ]
+
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        response = client.post(f"/movies/{MOVIE_ID}/conversations/bulk", json=body)
+        elapsed = time.perf_counter() - start
+
+    response.raise_for_status()
+    print(f"imported {response.json()['created']} conversations ({conversations * lines_per_conversation} lines) in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
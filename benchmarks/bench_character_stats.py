@@ -0,0 +1,135 @@
+"""
+Compares the GROUP BY queries the character and movie endpoints used to run on
+every request against the character_stats / character_pair_stats aggregates.
+
+Usage: python -m benchmarks.bench_character_stats [iterations]
+"""
+import sys
+
+import sqlalchemy as s
+
+from benchmarks.common import measure, report
+from src import database as db
+
+CHARACTER_ID = 4
+MOVIE_ID = 0
+
+
+def legacy_listing(sort, name=""):
+    stmt = (
+        s.select(
+            db.characters.c.character_id,
+            db.characters.c.name,
+            db.movies.c.title,
+            s.func.count(db.lines.c.line_id).label('line_count'),
+        )
+        .group_by(db.characters.c.character_id, db.movies.c.title)
+        .select_from(db.characters.join(db.lines, db.lines.c.character_id == db.characters.c.character_id).join(db.movies, db.movies.c.movie_id == db.characters.c.movie_id))
+        .limit(50)
+        .order_by(sort, db.characters.c.character_id)
+    )
+    if name != "":
+        stmt = stmt.where(db.characters.c.name.ilike(f"%{name}%"))
+    return stmt
+
+
+def stats_listing(sort, name=""):
+    stmt = (
+        s.select(
+            db.characters.c.character_id,
+            db.characters.c.name,
+            db.movies.c.title,
+            db.character_stats.c.line_count,
+        )
+        .select_from(db.character_stats.join(db.characters, db.characters.c.character_id == db.character_stats.c.character_id).join(db.movies, db.movies.c.movie_id == db.character_stats.c.movie_id))
+        .where(db.character_stats.c.line_count > 0)
+        .limit(50)
+        .order_by(sort, db.characters.c.character_id)
+    )
+    if name != "":
+        stmt = stmt.where(db.characters.c.name.ilike(f"%{name}%"))
+    return stmt
+
+
+def legacy_top_characters():
+    return (
+        s.select(
+            db.characters.c.character_id,
+            db.characters.c.name,
+            s.func.count(db.lines.c.line_id).label('line_count')
+        )
+        .select_from(db.characters.join(db.lines, db.lines.c.character_id == db.characters.c.character_id).join(db.movies, db.movies.c.movie_id == db.characters.c.movie_id))
+        .where(db.movies.c.movie_id == MOVIE_ID)
+        .group_by(db.characters.c.character_id)
+        .order_by(s.desc('line_count'))
+        .limit(5)
+    )
+
+
+def stats_top_characters():
+    return (
+        s.select(
+            db.characters.c.character_id,
+            db.characters.c.name,
+            db.character_stats.c.line_count
+        )
+        .select_from(db.character_stats.join(db.characters, db.characters.c.character_id == db.character_stats.c.character_id))
+        .where(db.character_stats.c.movie_id == MOVIE_ID)
+        .where(db.character_stats.c.line_count > 0)
+        .order_by(s.desc(db.character_stats.c.line_count), db.character_stats.c.character_id)
+        .limit(5)
+    )
+
+
+def legacy_partners():
+    def side(column):
+        return (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.name,
+                db.characters.c.gender,
+                s.func.count(db.lines.c.character_id).label('line_count'),
+            )
+            .where((db.conversations.c.character2_id == CHARACTER_ID) | (db.conversations.c.character1_id == CHARACTER_ID))
+            .join(db.lines, db.lines.c.conversation_id == db.conversations.c.conversation_id).join(db.characters, db.characters.c.character_id == column)
+            .group_by(db.characters.c.character_id)
+            .filter(db.characters.c.character_id != CHARACTER_ID)
+        )
+
+    return side(db.conversations.c.character1_id).union(side(db.conversations.c.character2_id)).order_by(s.desc('line_count'))
+
+
+def stats_partners():
+    return (
+        s.select(
+            db.characters.c.character_id,
+            db.characters.c.name,
+            db.characters.c.gender,
+            db.character_pair_stats.c.line_count,
+        )
+        .select_from(db.character_pair_stats.join(db.characters, db.characters.c.character_id == db.character_pair_stats.c.partner_id))
+        .where(db.character_pair_stats.c.character_id == CHARACTER_ID)
+        .order_by(s.desc(db.character_pair_stats.c.line_count), db.character_pair_stats.c.partner_id)
+    )
+
+
+CASES = [
+    ("list_characters sort=character", legacy_listing(db.characters.c.name), stats_listing(db.characters.c.name)),
+    ("list_characters sort=number_of_lines", legacy_listing(s.desc('line_count')), stats_listing(s.desc(db.character_stats.c.line_count))),
+    ("list_characters name=amy", legacy_listing(db.characters.c.name, "amy"), stats_listing(db.characters.c.name, "amy")),
+    ("get_movie top_characters", legacy_top_characters(), stats_top_characters()),
+    ("get_character top_conversations", legacy_partners(), stats_partners()),
+]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with db.engine.connect() as conn:
+        for name, legacy, aggregated in CASES:
+            report(f"{name} (before)", measure(lambda: conn.execute(legacy).all(), iterations))
+            report(f"{name} (after)", measure(lambda: conn.execute(aggregated).all(), iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Bytes on the wire and CPU time per response for each compression setting,
+on a 1000-row /lines/ page and a long conversation. Brotli levels are only
+measured if the `brotli` package is installed.
+
+Usage: python -m benchmarks.bench_compression [iterations]
+"""
+import sys
+
+import orjson
+
+from benchmarks.bench_serialization import page
+from benchmarks.common import measure, report
+from src.api import compression
+
+
+def conversation():
+    lines = page()[:200]
+    return {
+        'conversation_id': 16484,
+        'movie': 'legally blonde',
+        'lines': [{'line_id': line['line_id'], 'character': line['character'], 'text': line['text']} for line in lines],
+    }
+
+
+def encoders():
+    for level in (1, 3, 6, 9):
+        yield f"gzip {level}", lambda level=level: compression.GzipEncoder(level)
+    if compression.brotli is not None:
+        for quality in (1, 4, 6, 11):
+            yield f"br {quality}", lambda quality=quality: compression.BrotliEncoder(quality)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    payloads = {
+        "/lines/?limit=1000": orjson.dumps(page()),
+        "/conversations/{id} (200 lines)": orjson.dumps(conversation()),
+    }
+
+    for name, body in payloads.items():
+        print(f"{name}: {len(body)} bytes uncompressed")
+        for label, encoder in encoders():
+            size = len(encoder().compress(body, finish=True))
+            stats = measure(lambda: encoder().compress(body, finish=True), iterations)
+            report(f"  {label:<8} {size:>8} bytes ({size / len(body):.1%})", stats)
+
+
+if __name__ == "__main__":
+    main()
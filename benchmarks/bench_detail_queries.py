@@ -0,0 +1,109 @@
+"""
+Compares the old two-connection, two-query versions of get_character and
+get_lines against the single query each endpoint now runs.
+
+Usage: python -m benchmarks.bench_detail_queries [iterations]
+"""
+import sys
+
+import sqlalchemy as s
+
+from benchmarks.common import measure, report
+from src import database as db
+
+CHARACTER_ID = 4
+LINE_ID = 133
+
+
+def legacy_get_character():
+    with db.engine.connect() as conn:
+        character = conn.execute(
+            s.select(db.characters.c.character_id, db.characters.c.name, db.movies.c.title, db.characters.c.gender)
+            .where(db.characters.c.character_id == CHARACTER_ID)
+            .join(db.movies, db.characters.c.movie_id == db.movies.c.movie_id)
+        ).first()
+
+    with db.engine.connect() as conn:
+        partners = conn.execute(
+            s.select(db.characters.c.character_id, db.characters.c.name, db.characters.c.gender, db.character_pair_stats.c.line_count)
+            .select_from(db.character_pair_stats.join(db.characters, db.characters.c.character_id == db.character_pair_stats.c.partner_id))
+            .where(db.character_pair_stats.c.character_id == CHARACTER_ID)
+            .order_by(s.desc(db.character_pair_stats.c.line_count), db.character_pair_stats.c.partner_id)
+        ).all()
+
+    return character, partners
+
+
+def legacy_get_line():
+    with db.engine.connect() as conn:
+        line = conn.execute(
+            s.select(db.lines.c.line_id, db.lines.c.conversation_id, db.movies.c.title, db.characters.c.character_id, db.characters.c.name, db.lines.c.line_text)
+            .select_from(db.lines.join(db.characters, db.lines.c.character_id == db.characters.c.character_id).join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id))
+            .where(db.lines.c.line_id == LINE_ID)
+        ).first()
+
+    def side(column):
+        return (
+            s.select(db.lines.c.line_id, db.conversations.c.character1_id, db.conversations.c.character2_id, db.characters.c.character_id, db.characters.c.name)
+            .where(db.lines.c.line_id == LINE_ID)
+            .join(db.conversations, db.lines.c.conversation_id == db.conversations.c.conversation_id).join(db.characters, column == db.characters.c.character_id)
+            .filter(column != line.character_id)
+        )
+
+    with db.engine.connect() as conn:
+        recipient = conn.execute(side(db.conversations.c.character1_id).union(side(db.conversations.c.character2_id))).first()
+
+    return line, recipient
+
+
+def single_get_character():
+    partner = db.characters.alias('partner')
+    with db.engine.connect() as conn:
+        return conn.execute(
+            s.select(
+                db.characters.c.character_id, db.characters.c.name, db.movies.c.title, db.characters.c.gender,
+                partner.c.character_id.label('partner_id'), partner.c.name.label('partner_name'),
+                partner.c.gender.label('partner_gender'), db.character_pair_stats.c.line_count,
+            )
+            .select_from(
+                db.characters
+                .join(db.movies, db.characters.c.movie_id == db.movies.c.movie_id)
+                .outerjoin(db.character_pair_stats, db.character_pair_stats.c.character_id == db.characters.c.character_id)
+                .outerjoin(partner, partner.c.character_id == db.character_pair_stats.c.partner_id)
+            )
+            .where(db.characters.c.character_id == CHARACTER_ID)
+            .order_by(s.desc(db.character_pair_stats.c.line_count), db.character_pair_stats.c.partner_id)
+        ).all()
+
+
+def single_get_line():
+    recipient = db.characters.alias('recipient')
+    recipient_id = s.case(
+        (db.conversations.c.character1_id == db.lines.c.character_id, db.conversations.c.character2_id),
+        else_=db.conversations.c.character1_id,
+    )
+    with db.engine.connect() as conn:
+        return conn.execute(
+            s.select(db.lines.c.line_id, db.lines.c.conversation_id, db.movies.c.title, db.characters.c.name, recipient.c.name.label('recipient'), db.lines.c.line_text)
+            .select_from(
+                db.lines
+                .join(db.characters, db.lines.c.character_id == db.characters.c.character_id)
+                .join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id)
+                .outerjoin(db.conversations, db.lines.c.conversation_id == db.conversations.c.conversation_id)
+                .outerjoin(recipient, recipient.c.character_id == recipient_id)
+            )
+            .where(db.lines.c.line_id == LINE_ID)
+        ).first()
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    report("get_character (two queries)", measure(legacy_get_character, iterations))
+    report("get_character (one query)", measure(single_get_character, iterations))
+    report("get_lines (two queries)", measure(legacy_get_line, iterations))
+    report("get_lines (one query)", measure(single_get_line, iterations))
+
+
+if __name__ == "__main__":
+    main()
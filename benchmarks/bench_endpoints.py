@@ -0,0 +1,156 @@
+"""
+Times every endpoint variant (each sort option, the filters, deep offsets and
+the cursors that replace them, the detail, batch and stats endpoints) through
+the app, against whatever database the environment points at. The response
+cache is turned off so every call runs its queries.
+
+To see how each one scales with the data, seed a local database at 1x, 10x
+and 100x with scripts/seed.py and run once per scale:
+
+    python -m scripts.seed --scale 10 --reset
+    python -m benchmarks.bench_endpoints --label 10x --output endpoints-10x.json
+
+With pytest-benchmark installed, the same cases run as benchmarks (they're
+named bench_* so the regular test run doesn't pick them up):
+
+    python -m pytest benchmarks/bench_endpoints.py -o python_files=bench_*.py \
+        -o python_functions=bench_* --benchmark-json=endpoints-10x.json
+"""
+import argparse
+import json
+import os
+
+# Before the app, and so the cache, is imported.
+os.environ["CACHE_MAX_ENTRIES"] = "0"
+os.environ.setdefault("COMPRESSION", "off")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.common import measure, report
+from src.api import characters, lines, movies
+from src.api.server import app
+
+MOVIE_ID = 0
+CHARACTER_ID = 4
+PARTNER_ID = 9
+LINE_ID = 133
+CONVERSATION_ID = 0
+
+# Offsets deep enough to show the cost of skipping rows, but within the
+# bundled corpus at 1x with a full page after them.
+DEEP_OFFSETS = {"/characters/": 4000, "/movies/": 200, "/lines/": 100000}
+
+
+def listing_cases(path, sort_options, filters):
+    for sort in sort_options:
+        yield f"{path} sort={sort.value}", f"{path}?sort={sort.value}"
+        yield f"{path} sort={sort.value} deep offset", f"{path}?sort={sort.value}&offset={DEEP_OFFSETS[path]}"
+        # The page after the same deep offset, reached with a cursor instead.
+        yield (
+            f"{path} sort={sort.value} deep cursor",
+            f"{path}?sort={sort.value}&cursor={{cursor}}",
+            f"{path}?sort={sort.value}&offset={DEEP_OFFSETS[path]}",
+        )
+    for query in filters:
+        yield f"{path} {query}", f"{path}?{query}"
+
+
+CASES = [
+    ("get_movie", f"/movies/{MOVIE_ID}"),
+    ("get_movie_graph", f"/movies/{MOVIE_ID}/graph"),
+    ("get_movie_stats", f"/movies/{MOVIE_ID}/stats"),
+    ("get_stats", "/stats"),
+    ("get_character", f"/characters/{CHARACTER_ID}"),
+    ("get_partners", f"/characters/{CHARACTER_ID}/partners"),
+    ("get_path", f"/characters/{CHARACTER_ID}/path/{PARTNER_ID}"),
+    ("get_line", f"/lines/{LINE_ID}"),
+    ("get_conversation", f"/conversations/{CONVERSATION_ID}"),
+    *listing_cases("/characters/", characters.character_sort_options, ["name=amy", "name=amy&sort=number_of_lines"]),
+    *listing_cases("/movies/", movies.movie_sort_options, ["name=star", "name=star&sort=rating"]),
+    *listing_cases(
+        "/lines/",
+        # Relevance only means something with a search.
+        [sort for sort in lines.line_sort_options if sort is not lines.line_sort_options.relevance],
+        [
+            "text=love",
+            "name=amy",
+            "search=love",
+            "search=love%20-money&sort=relevance",
+            'search="tell%20me"',
+            "text=love&name=amy&sort=character",
+        ],
+    ),
+    ("lines_batch", "POST /lines/batch", {"ids": list(range(LINE_ID, LINE_ID + 100))}),
+    ("characters_batch", "POST /characters/batch", {"ids": list(range(CHARACTER_ID, CHARACTER_ID + 100))}),
+    ("conversations_batch", "POST /conversations/batch", {"ids": list(range(CONVERSATION_ID, CONVERSATION_ID + 100))}),
+    ("export_lines", "/lines/export?name=amy"),
+    ("export_movie_conversations", f"/conversations/export?movie_id={MOVIE_ID}"),
+    ("export_conversations", "/conversations/export?name=amy"),
+]
+
+
+def prepare(client, case):
+    """
+    Returns (name, method, path, json) for a case, resolving a cursor case's
+    `{cursor}` from the page it follows.
+    """
+
+    name, target, *extra = case
+    method, _, path = target.rpartition(" ")
+    body = None
+
+    if "{cursor}" in path:
+        previous, = extra
+        response = client.get(previous)
+        response.raise_for_status()
+        path = path.format(cursor=response.headers["X-Next-Cursor"])
+    elif extra:
+        body, = extra
+
+    return name, method or "GET", path, body
+
+
+def call(client, method, path, body):
+    response = client.request(method, path, json=body)
+    assert response.status_code == 200, f"{method} {path}: {response.status_code}"
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--label", default="", help="e.g. the scale seeded, recorded in the output")
+    parser.add_argument("--output", help="also write the results to this file, as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    with TestClient(app) as client:
+        for case in CASES:
+            name, method, path, body = prepare(client, case)
+            stats = measure(lambda: call(client, method, path, body), iterations=args.iterations, warmup=3)
+            report(name, stats)
+            results[name] = stats
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"label": args.label, "results": results}, f, indent=2)
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case[0] for case in CASES])
+def bench_endpoint(request, client, case):
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+
+    name, method, path, body = prepare(client, case)
+    benchmark(call, client, method, path, body)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Hot-id lookups on the detail endpoints with the response cache disabled and
+enabled (whichever backend CACHE_URL selects).
+
+Usage: python -m benchmarks.bench_entity_cache [iterations]
+"""
+import sys
+
+from fastapi.testclient import TestClient
+
+from benchmarks.common import measure, report
+from src import cache
+from src.api.server import app
+
+PATHS = ["/movies/44", "/characters/4", "/conversations/16484", "/lines/133"]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    backend = cache.backend
+    disabled = cache.MemoryBackend(maxsize=0, ttl=0)
+
+    with TestClient(app) as client:
+        for path in PATHS:
+            cache.backend = disabled
+            report(f"{path} (no cache)", measure(lambda: client.get(path), iterations))
+
+            cache.backend = backend
+            backend.clear()
+            report(f"{path} (cached)", measure(lambda: client.get(path), iterations))
+
+    print(backend.stats())
+
+
+if __name__ == "__main__":
+    main()
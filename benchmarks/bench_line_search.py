@@ -0,0 +1,58 @@
+"""
+Compares searching the full lines corpus with the unindexed ILIKE scan the
+/lines/?text= filter used to do, the same ILIKE served by the trigram index,
+and the tsvector full-text search behind /lines/?search=.
+
+Usage: python -m benchmarks.bench_line_search [iterations]
+"""
+import sys
+
+import sqlalchemy as s
+from sqlalchemy.dialects.postgresql import REGCONFIG
+
+from benchmarks.common import measure, report
+from src import database as db
+
+TERMS = ["said", "shakespeare", "money", "goodbye"]
+
+
+def ilike(term):
+    return (
+        s.select(db.lines.c.line_id, db.lines.c.line_text)
+        .where(db.lines.c.line_text.ilike(f"%{term}%"))
+        .order_by(db.lines.c.line_id)
+        .limit(50)
+    )
+
+
+def fulltext(term, ranked):
+    query = s.func.websearch_to_tsquery(s.literal('english', REGCONFIG), term)
+    stmt = s.select(db.lines.c.line_id, db.lines.c.line_text).where(db.lines.c.line_text_tsv.op('@@')(query)).limit(50)
+    if ranked:
+        return stmt.order_by(s.desc(s.func.ts_rank_cd(db.lines.c.line_text_tsv, query)), db.lines.c.line_id)
+    return stmt.order_by(db.lines.c.line_id)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    with db.engine.connect() as conn:
+        total = conn.execute(s.select(s.func.count()).select_from(db.lines)).scalar_one()
+        conn.rollback()
+        print(f"searching {total} lines")
+
+        for term in TERMS:
+            with conn.begin():
+                # What ILIKE cost before the trigram index existed.
+                conn.exec_driver_sql("set local enable_bitmapscan = off")
+                conn.exec_driver_sql("set local enable_indexscan = off")
+                report(f"{term!r} ilike (sequential scan)", measure(lambda: conn.execute(ilike(term)).all(), iterations))
+
+            with conn.begin():
+                report(f"{term!r} ilike (trigram index)", measure(lambda: conn.execute(ilike(term)).all(), iterations))
+                report(f"{term!r} full-text", measure(lambda: conn.execute(fulltext(term, False)).all(), iterations))
+                report(f"{term!r} full-text ranked", measure(lambda: conn.execute(fulltext(term, True)).all(), iterations))
+
+
+if __name__ == "__main__":
+    main()
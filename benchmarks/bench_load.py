@@ -0,0 +1,254 @@
+"""
+Load test: keeps `--concurrency` requests in flight against a running server
+for `--duration` seconds and reports throughput, latency and errors, overall
+and per route, as one JSON object per target.
+
+To compare the sync and async builds, serve each one (e.g. the commit before
+the async change checked out in a worktree on port 3001, and this one on 3000)
+with a single uvicorn worker and pass both URLs:
+
+    python -m benchmarks.bench_load http://127.0.0.1:3000 http://127.0.0.1:3001 --concurrency 200
+
+`--in-process` drives the ASGI app directly instead, with no server or
+network in between (set MOVIE_API_BACKEND=memory to leave Postgres out too):
+
+    MOVIE_API_BACKEND=memory python -m benchmarks.bench_load --in-process --output load.json
+
+Requests are drawn at random, in proportion to their weights, from:
+* `--requests FILE`: recorded requests to replay. Either JSON lines, one
+  object per request with a `path` and optionally `method`, `json` and
+  `weight`, or an HTTP client file like test_index.http (requests separated by
+  `###` lines, each a request line, headers, a blank line and a body).
+* otherwise DEFAULT_MIX, a spread over the endpoints.
+
+Each distinct request is sent once before the timed run. Responses are cached,
+so with the default mix the run mostly measures cache hits; serve with
+CACHE_MAX_ENTRIES=0 to measure the queries instead.
+
+`--weight ROUTE=WEIGHT` (repeatable) multiplies the weights of the requests for
+a route, e.g. `--weight /lines/=5` or `--weight "/characters/{id}=0"`. Routes
+are paths with the query dropped and numeric segments replaced by `{id}`.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+import httpx
+
+from benchmarks.common import percentile
+
+DEFAULT_MIX = [
+    {"path": "/characters/4", "weight": 2},
+    {"path": "/characters/7421", "weight": 2},
+    {"path": "/characters/4/partners"},
+    {"path": "/characters/"},
+    {"path": "/characters/?name=amy&limit=50&offset=0&sort=number_of_lines"},
+    {"path": "/movies/0", "weight": 2},
+    {"path": "/movies/44", "weight": 2},
+    {"path": "/movies/0/stats"},
+    {"path": "/movies/?offset=30&limit=10&sort=rating"},
+    {"path": "/stats", "weight": 0.5},
+    {"path": "/lines/133", "weight": 2},
+    {"path": "/lines/?text=said&offset=30&limit=10&sort=conversation"},
+    {"path": "/lines/?search=love&limit=10"},
+    {"path": "/lines/batch", "method": "POST", "json": {"ids": [133, 19757, 6337]}},
+    {"path": "/conversations/16484", "weight": 2},
+]
+
+NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def route_of(path):
+    return NUMERIC_SEGMENT.sub("/{id}", urlsplit(path).path)
+
+
+def load_jsonl(f):
+    return [json.loads(line) for line in f if line.strip()]
+
+
+def load_http_file(f):
+    """Parses the requests of an HTTP client file (e.g. test_index.http)."""
+
+    requests = []
+    for block in re.split(r"^###.*$", f.read(), flags=re.MULTILINE):
+        lines = [line.strip() for line in block.splitlines() if not line.lstrip().startswith(("#", "//"))]
+        while lines and not lines[0]:
+            del lines[0]
+        if not lines:
+            continue
+
+        method, url, *_ = lines[0].split()
+        split = urlsplit(url)
+        request = {"method": method.upper(), "path": split.path + (f"?{split.query}" if split.query else "")}
+
+        if "" in lines:
+            body = "\n".join(lines[lines.index("") + 1:]).strip()
+            if body:
+                request["json"] = json.loads(body)
+        requests.append(request)
+    return requests
+
+
+def load_requests(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".http"):
+            return load_http_file(f)
+        return load_jsonl(f)
+
+
+def apply_weights(requests, weights):
+    """Returns (requests, weights) for random.choices(), with the `--weight` multipliers applied."""
+
+    weighted = [
+        (request, request.get("weight", 1) * weights.get(route_of(request["path"]), 1))
+        for request in requests
+    ]
+    weighted = [(request, weight) for request, weight in weighted if weight > 0]
+    if not weighted:
+        raise SystemExit("every request has a weight of 0.")
+    return [request for request, _ in weighted], [weight for _, weight in weighted]
+
+
+def summarize(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+@contextlib.asynccontextmanager
+async def make_client(target, concurrency):
+    if target != "in-process":
+        async with httpx.AsyncClient(base_url=target, timeout=60, limits=httpx.Limits(max_connections=concurrency)) as client:
+            yield client
+        return
+
+    # Imported here so load tests against a server don't need the app's
+    # configuration.
+    from src.api.server import app
+
+    # httpx doesn't run the app's startup (loading the memory backend's
+    # dataset, say), which would otherwise land on the first requests.
+    await app.router.startup()
+    try:
+        # Exceptions become 500 responses, as they would behind a server.
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://in-process", timeout=60) as client:
+            yield client
+    finally:
+        await app.router.shutdown()
+
+
+async def run(target, requests, weights, concurrency, duration, seed=0, warmup=True):
+    rng = random.Random(seed)
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+
+    async with make_client(target, concurrency) as client:
+        if warmup:
+            # One untimed pass, so lazily built state (pools, caches, the
+            # memory backend's orderings) isn't measured.
+            for request in requests:
+                try:
+                    await client.request(request.get("method", "GET"), request["path"], json=request.get("json"))
+                except httpx.HTTPError:
+                    pass
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                request, = rng.choices(requests, weights)
+                route = route_of(request["path"])
+                start = time.perf_counter()
+                try:
+                    response = await client.request(request.get("method", "GET"), request["path"], json=request.get("json"))
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies[route].append((time.perf_counter() - start) * 1000)
+                statuses[route][status] += 1
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    def errors(counts):
+        # Server errors and failed requests; 4xx responses are answers too.
+        return sum(count for status, count in counts.items() if not status.isdigit() or int(status) >= 500)
+
+    routes = {}
+    for route in sorted(latencies):
+        total = len(latencies[route])
+        routes[route] = {
+            "requests": total,
+            "errors": errors(statuses[route]),
+            "error_rate": round(errors(statuses[route]) / total, 4),
+            "throughput_rps": round(total / elapsed, 1),
+            **summarize(latencies[route]),
+            "statuses": dict(sorted(statuses[route].items())),
+        }
+
+    every_latency = [latency for route_latencies in latencies.values() for latency in route_latencies]
+    total = len(every_latency)
+    total_errors = sum(route["errors"] for route in routes.values())
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "errors": total_errors,
+        "error_rate": round(total_errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 1),
+        **(summarize(every_latency) if total else {}),
+        "routes": routes,
+    }
+
+
+def parse_weight(value):
+    route, _, weight = value.rpartition("=")
+    if not route:
+        raise argparse.ArgumentTypeError("expected ROUTE=WEIGHT")
+    return route, float(weight)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("--in-process", action="store_true", help="also drive the ASGI app in this process")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--requests", help="JSON lines or .http file of requests to replay")
+    parser.add_argument("--weight", type=parse_weight, action="append", default=[], metavar="ROUTE=WEIGHT")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-warmup", action="store_true", help="don't send each request once before timing")
+    parser.add_argument("--output", help="also write the reports to this file, as a JSON list")
+    args = parser.parse_args()
+
+    targets = args.urls + (["in-process"] if args.in_process else [])
+    if not targets:
+        parser.error("give at least one URL, or --in-process")
+
+    requests, weights = apply_weights(load_requests(args.requests) if args.requests else DEFAULT_MIX, dict(args.weight))
+
+    reports = []
+    for target in targets:
+        report = asyncio.run(
+            run(target, requests, weights, args.concurrency, args.duration, args.seed, warmup=not args.no_warmup)
+        )
+        print(json.dumps(report))
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Encoding a 1000-row /lines/ page: FastAPI's default path (jsonable_encoder,
+then the stdlib json encoder), the same with the print() the endpoint used to
+do, and the orjson path the listings use now (pagination.page_response).
+
+Usage: python -m benchmarks.bench_serialization [iterations]
+"""
+import contextlib
+import os
+import random
+import sys
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.common import measure, report
+from src.api import pagination
+
+ROWS = 1000
+
+WORDS = "i you the a to what it is that not and do have me know no we don't in just are your this".split()
+
+
+def page():
+    rng = random.Random(0)
+    return [
+        {
+            'line_id': 100000 + i,
+            'movie_title': rng.choice(["10 things i hate about you", "airplane!", "legally blonde", "the shining"]),
+            'character': rng.choice(["KAT", "DR. RUMACK", "ELLE", "JACK"]),
+            'text': " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))).capitalize() + ".",
+        }
+        for i in range(ROWS)
+    ]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    json = page()
+
+    def default():
+        return JSONResponse(jsonable_encoder(json)).body
+
+    def default_with_print():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            print(json)
+        return default()
+
+    def orjson():
+        return pagination.page_response(json, None).body
+
+    assert default() == orjson()
+    print(f"{ROWS} rows, {len(orjson())} bytes")
+
+    report("jsonable_encoder + json (with print)", measure(default_with_print, iterations))
+    report("jsonable_encoder + json", measure(default, iterations))
+    report("orjson", measure(orjson, iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Measures cold start: a fresh interpreter importing src.api.server and serving
+its first `/` response, which is what every new serverless instance pays.
+
+Usage: python -m benchmarks.bench_startup [runs]
+"""
+import subprocess
+import sys
+
+from benchmarks.common import percentile
+
+COLD_START = """
+import time
+start = time.perf_counter()
+from src.api.server import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+TestClient(app).get("/").raise_for_status()
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    imports = []
+    totals = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", COLD_START], check=True, capture_output=True, text=True).stdout
+        imported, total = (float(value) * 1000 for value in output.split())
+        imports.append(imported)
+        totals.append(total)
+
+    print(f"import src.api.server      p50={percentile(imports, 50):>9.3f}ms  p99={percentile(imports, 99):>9.3f}ms")
+    print(f"import to first / response p50={percentile(totals, 50):>9.3f}ms  p99={percentile(totals, 99):>9.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
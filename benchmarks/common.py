@@ -0,0 +1,34 @@
+import statistics
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(fn, iterations=200, warmup=10):
+    """
+    Calls `fn` repeatedly and returns its latency distribution in milliseconds.
+    """
+
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'iterations': iterations,
+    }
+
+
+def report(name, stats):
+    print(f"{name:<48} p50={stats['p50_ms']:>9.3f}ms  p99={stats['p99_ms']:>9.3f}ms  mean={stats['mean_ms']:>9.3f}ms")
@@ -0,0 +1,76 @@
+-- Per-character and per-pair line/conversation counts. These are kept in
+-- sync by src/aggregates.py whenever a conversation is added, so the listing
+-- and detail endpoints never have to GROUP BY over the whole lines table.
+
+create table if not exists character_stats (
+    character_id integer primary key references characters (character_id),
+    movie_id integer not null references movies (movie_id),
+    line_count integer not null default 0,
+    conversation_count integer not null default 0
+);
+
+create index if not exists character_stats_movie_id_line_count_idx
+    on character_stats (movie_id, line_count desc);
+
+create index if not exists character_stats_line_count_idx
+    on character_stats (line_count desc, character_id);
+
+-- Stored in both directions so a character's partners are a single range scan.
+create table if not exists character_pair_stats (
+    character_id integer not null references characters (character_id),
+    partner_id integer not null references characters (character_id),
+    movie_id integer not null references movies (movie_id),
+    line_count integer not null default 0,
+    conversation_count integer not null default 0,
+    primary key (character_id, partner_id)
+);
+
+-- Backfill from the existing data.
+insert into character_stats (character_id, movie_id, line_count, conversation_count)
+select
+    characters.character_id,
+    characters.movie_id,
+    coalesce(line_counts.line_count, 0),
+    coalesce(conversation_counts.conversation_count, 0)
+from characters
+left join (
+    select character_id, count(*) as line_count
+    from lines
+    group by character_id
+) as line_counts on line_counts.character_id = characters.character_id
+left join (
+    select character_id, count(*) as conversation_count
+    from (
+        select character1_id as character_id from conversations
+        union all
+        select character2_id as character_id from conversations
+    ) as participants
+    group by character_id
+) as conversation_counts on conversation_counts.character_id = characters.character_id
+on conflict (character_id) do update set
+    line_count = excluded.line_count,
+    conversation_count = excluded.conversation_count;
+
+insert into character_pair_stats (character_id, partner_id, movie_id, line_count, conversation_count)
+select character_id, partner_id, min(movie_id), sum(line_count), count(*)
+from (
+    select conversations.character1_id as character_id, conversations.character2_id as partner_id,
+           conversations.movie_id, conversation_lines.line_count
+    from conversations
+    join (
+        select conversation_id, count(*) as line_count from lines group by conversation_id
+    ) as conversation_lines on conversation_lines.conversation_id = conversations.conversation_id
+    where conversations.character1_id <> conversations.character2_id
+    union all
+    select conversations.character2_id, conversations.character1_id,
+           conversations.movie_id, conversation_lines.line_count
+    from conversations
+    join (
+        select conversation_id, count(*) as line_count from lines group by conversation_id
+    ) as conversation_lines on conversation_lines.conversation_id = conversations.conversation_id
+    where conversations.character1_id <> conversations.character2_id
+) as pairs
+group by character_id, partner_id
+on conflict (character_id, partner_id) do update set
+    line_count = excluded.line_count,
+    conversation_count = excluded.conversation_count;
@@ -0,0 +1,16 @@
+-- Indexes for searching line text. line_text_tsv backs the full-text `search`
+-- parameter of /lines/ and the trigram index lets the existing `text` (ILIKE
+-- contains) filter use an index instead of scanning every line.
+--
+-- Adding a stored generated column rewrites the table, which also backfills
+-- line_text_tsv for every existing row; new rows are filled in by Postgres.
+
+create extension if not exists pg_trgm;
+
+alter table lines
+    add column if not exists line_text_tsv tsvector
+    generated always as (to_tsvector('english', coalesce(line_text, ''))) stored;
+
+create index if not exists lines_line_text_tsv_idx on lines using gin (line_text_tsv);
+
+create index if not exists lines_line_text_trgm_idx on lines using gin (line_text gin_trgm_ops);
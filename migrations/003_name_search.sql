@@ -0,0 +1,8 @@
+-- Trigram indexes so the case-insensitive "name contains" filters on
+-- /characters/, /movies/ and /lines/ can use an index instead of scanning.
+
+create extension if not exists pg_trgm;
+
+create index if not exists characters_name_trgm_idx on characters using gin (name gin_trgm_ops);
+
+create index if not exists movies_title_trgm_idx on movies using gin (title gin_trgm_ops);
@@ -0,0 +1,30 @@
+-- Let the database hand out conversation and line ids. add_conversation used
+-- to compute max(id) + 1 itself, which sorted the whole table on every write
+-- and gave concurrent writers the same ids. Reuses an existing serial/identity
+-- sequence if the column already has one, and moves it past the current data.
+
+do $$
+begin
+    if pg_get_serial_sequence('conversations', 'conversation_id') is null then
+        create sequence conversations_conversation_id_seq owned by conversations.conversation_id;
+        alter table conversations alter column conversation_id set default nextval('conversations_conversation_id_seq');
+    end if;
+
+    if pg_get_serial_sequence('lines', 'line_id') is null then
+        create sequence lines_line_id_seq owned by lines.line_id;
+        alter table lines alter column line_id set default nextval('lines_line_id_seq');
+    end if;
+end
+$$;
+
+select setval(
+    pg_get_serial_sequence('conversations', 'conversation_id'),
+    coalesce((select max(conversation_id) from conversations), 0) + 1,
+    false
+);
+
+select setval(
+    pg_get_serial_sequence('lines', 'line_id'),
+    coalesce((select max(line_id) from lines), 0) + 1,
+    false
+);
@@ -0,0 +1,43 @@
+-- Per-movie dialogue totals for /movies/{movie_id}/stats and /stats, so no
+-- query has to GROUP BY over lines or conversations. They're backfilled here
+-- from the movies' character_stats rows, then src/aggregates.py adds each
+-- write's counts to them.
+
+create table if not exists movie_stats (
+    movie_id integer primary key references movies (movie_id),
+    character_count integer not null default 0,
+    line_count integer not null default 0,
+    conversation_count integer not null default 0,
+    male_line_count integer not null default 0,
+    female_line_count integer not null default 0
+);
+
+-- The most talkative pair, of a movie and of the whole corpus, is the first
+-- row of one of these.
+create index if not exists character_pair_stats_movie_id_line_count_idx
+    on character_pair_stats (movie_id, line_count desc, character_id, partner_id);
+
+create index if not exists character_pair_stats_line_count_idx
+    on character_pair_stats (line_count desc, character_id, partner_id);
+
+-- Rebuild every movie in one pass. A conversation counts towards both of its
+-- characters' conversation_count (twice towards the one character of a
+-- conversation with itself), so the movie's conversations are half the sum.
+insert into movie_stats (movie_id, character_count, line_count, conversation_count, male_line_count, female_line_count)
+select
+    movies.movie_id,
+    count(characters.character_id),
+    coalesce(sum(character_stats.line_count), 0),
+    coalesce(sum(character_stats.conversation_count), 0) / 2,
+    coalesce(sum(character_stats.line_count) filter (where characters.gender = 'M'), 0),
+    coalesce(sum(character_stats.line_count) filter (where characters.gender = 'F'), 0)
+from movies
+left join characters on characters.movie_id = movies.movie_id
+left join character_stats on character_stats.character_id = characters.character_id
+group by movies.movie_id
+on conflict (movie_id) do update set
+    character_count = excluded.character_count,
+    line_count = excluded.line_count,
+    conversation_count = excluded.conversation_count,
+    male_line_count = excluded.male_line_count,
+    female_line_count = excluded.female_line_count;
@@ -0,0 +1,60 @@
+-- B-tree indexes for the lookups, joins and orderings the routers use, which
+-- until now relied on whatever indexes the database happened to have. Each
+-- one is named after the query it serves; scripts/explain.py checks the
+-- endpoints' plans against a seeded database.
+--
+-- Building an index blocks writes to its table until it's done, and this file
+-- runs in one transaction. On a large live database, run the statements by
+-- hand first with `create index concurrently`; they're skipped here if the
+-- index already exists.
+
+-- /conversations/{id} and the conversation exports and batch lookups: a
+-- conversation's lines in order, and every conversation's lines merged with
+-- the conversations in id order without sorting the lines table.
+create index if not exists lines_conversation_id_line_sort_idx
+    on lines (conversation_id, line_sort);
+
+-- /lines/?sort=conversation orders by conversation then line id.
+create index if not exists lines_conversation_id_line_id_idx
+    on lines (conversation_id, line_id);
+
+-- /lines/?sort=character and ?name=: the lines of each character (walked in
+-- name order, or found through characters_name_trgm_idx) in line id order.
+create index if not exists lines_character_id_line_id_idx
+    on lines (character_id, line_id);
+
+-- /lines/?sort=movie: the lines of each movie, walked in title order.
+create index if not exists lines_movie_id_line_id_idx
+    on lines (movie_id, line_id);
+
+-- /conversations/export?name=: the conversations of the characters whose
+-- names match, on either side.
+create index if not exists conversations_character1_id_idx
+    on conversations (character1_id);
+
+create index if not exists conversations_character2_id_idx
+    on conversations (character2_id);
+
+-- /conversations/export?movie_id=, in conversation id order.
+create index if not exists conversations_movie_id_conversation_id_idx
+    on conversations (movie_id, conversation_id);
+
+-- A movie's characters: its graph (name and gender come from the index alone),
+-- its stats rebuild, and /characters/?sort=movie within each movie.
+create index if not exists characters_movie_id_character_id_idx
+    on characters (movie_id, character_id) include (name, gender);
+
+-- /characters/?sort=character and /lines/?sort=character.
+create index if not exists characters_name_character_id_idx
+    on characters (name, character_id);
+
+-- The /movies/ sort options, each with the id tiebreak the listing and its
+-- cursors use. Ratings are sorted highest first.
+create index if not exists movies_title_movie_id_idx
+    on movies (title, movie_id);
+
+create index if not exists movies_year_movie_id_idx
+    on movies (year, movie_id);
+
+create index if not exists movies_imdb_rating_movie_id_idx
+    on movies (imdb_rating desc, movie_id);
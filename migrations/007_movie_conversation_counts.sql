@@ -0,0 +1,11 @@
+-- 005_movie_stats.sql derived a movie's conversations from its characters'
+-- conversation_count (half their sum), which only holds while every
+-- conversation is counted exactly twice, by characters of its own movie. A
+-- conversation of a character with itself, or one whose characters belong to
+-- another movie, throws it off. Count the conversations directly instead, as
+-- src/aggregates.py now does for new ones.
+
+update movie_stats
+set conversation_count = (
+    select count(*) from conversations where conversations.movie_id = movie_stats.movie_id
+);
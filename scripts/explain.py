@@ -0,0 +1,159 @@
+"""
+Runs EXPLAIN ANALYZE on the SQL behind every endpoint and fails if any of it
+reads a large table with a sequential scan. Run it against a database seeded
+at scale, to check that the indexes in migrations/ cover what the routers ask
+for:
+
+    python -m scripts.synthetic --lines 30000000 --reset
+    python -m scripts.explain --output plans.json
+
+The endpoints are the cases in benchmarks/bench_endpoints.py. Each one is
+requested once to warm up, then again with the SELECTs it runs captured, and
+those are explained on a separate connection. A sequential scan of a table
+with fewer than --min-rows rows (going by the planner's estimate, so seed or
+ANALYZE first) is as good as an index scan and isn't reported. Each one that
+is comes with the filter it applied and the sort it fed, which are what an
+index would need to cover.
+"""
+# First, so the response cache is off before the app is imported.
+from benchmarks import bench_endpoints
+
+import argparse
+import contextlib
+import json
+
+import sqlalchemy as s
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src import graph
+from src.api.server import app
+
+# Cases whose sequential scans are expected, and why.
+SEQ_SCANS_ALLOWED = {
+    "get_stats": "sums movie_stats, which has one row per movie",
+}
+
+
+@contextlib.contextmanager
+def captured():
+    """Collects the SELECTs the endpoints run while in the block."""
+
+    statements = []
+
+    def before_execute(conn, clauseelement, multiparams, params, execution_options):
+        if isinstance(clauseelement, s.Select):
+            statements.append(clauseelement)
+
+    s.event.listen(db.async_engine.sync_engine, "before_execute", before_execute)
+    try:
+        yield statements
+    finally:
+        s.event.remove(db.async_engine.sync_engine, "before_execute", before_execute)
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect)
+    plan, = conn.exec_driver_sql(f"explain (analyze, buffers, format json) {compiled}", compiled.params).scalar_one()
+    return plan
+
+
+def seq_scans(node, sort_key=None):
+    """Yields (table, filter, sort key) for each sequential scan in a plan."""
+
+    if node["Node Type"] in ("Sort", "Incremental Sort"):
+        sort_key = node["Sort Key"]
+    if node["Node Type"] == "Seq Scan":
+        yield node["Relation Name"], node.get("Filter"), sort_key
+    for child in node.get("Plans", ()):
+        yield from seq_scans(child, sort_key)
+
+
+def table_rows(conn):
+    return dict(
+        conn.execute(
+            s.text("select relname, reltuples from pg_class where relkind = 'r' and relnamespace = 'public'::regnamespace")
+        ).all()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rows", type=int, default=10000, help="the smallest table a sequential scan fails on")
+    parser.add_argument("--allow", action="append", default=[], metavar="CASE", help="don't fail on this case's scans")
+    parser.add_argument("--output", help="also write the statements and their plans to this file, as JSON")
+    args = parser.parse_args()
+
+    if db.backend != "postgres":
+        raise SystemExit("explaining needs MOVIE_API_BACKEND=postgres.")
+
+    allowed = {**SEQ_SCANS_ALLOWED, **{name: "--allow" for name in args.allow}}
+
+    captures = {}
+    with TestClient(app) as client:
+        cases = [bench_endpoints.prepare(client, case) for case in bench_endpoints.CASES]
+        for name, method, path, body in cases:
+            bench_endpoints.call(client, method, path, body)
+
+        # The graphs are rebuilt for every case, so their queries are seen.
+        # The character -> movie map is read whole once per process, so it's
+        # kept rather than explained under whichever case loads it first.
+        warm = graph.interactions
+        for name, method, path, body in cases:
+            graph.interactions = graph.InteractionGraph()
+            graph.interactions.character_movies = warm.character_movies
+            with captured() as statements:
+                bench_endpoints.call(client, method, path, body)
+            captures[name] = statements
+        graph.interactions = warm
+
+    report = []
+    failed = []
+    with db.engine.connect() as conn:
+        rows = table_rows(conn)
+
+        for name, statements in captures.items():
+            explained = []
+            for statement in statements:
+                plan = explain(conn, statement)
+                scans = [
+                    {"table": table, "filter": filter, "sort_key": sort_key}
+                    for table, filter, sort_key in seq_scans(plan["Plan"])
+                    if rows.get(table, 0) >= args.min_rows
+                ]
+                explained.append(
+                    {
+                        "sql": str(statement.compile(dialect=conn.dialect)),
+                        "execution_ms": plan["Execution Time"],
+                        "seq_scans": scans,
+                        "plan": plan,
+                    }
+                )
+
+            print(f"{name}: {len(explained)} statements, {sum(e['execution_ms'] for e in explained):.1f}ms")
+            for scan in (scan for e in explained for scan in e["seq_scans"]):
+                detail = [f"{rows[scan['table']]:.0f} rows"]
+                if scan["filter"]:
+                    detail.append(f"filter {scan['filter']}")
+                if scan["sort_key"]:
+                    detail.append(f"sorted by {', '.join(scan['sort_key'])}")
+                print(f"  seq scan on {scan['table']} ({'; '.join(detail)})")
+
+            if any(e["seq_scans"] for e in explained):
+                if name in allowed:
+                    print(f"  allowed: {allowed[name]}")
+                else:
+                    failed.append(name)
+
+            report.append({"case": name, "statements": explained})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    if failed:
+        raise SystemExit(f"sequential scans of large tables in: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
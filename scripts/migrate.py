@@ -0,0 +1,74 @@
+"""
+Applies the SQL files in migrations/ that haven't been run against the
+database yet, in filename order. Each file runs in its own transaction and is
+recorded in the schema_migrations table.
+
+Usage: python -m scripts.migrate
+"""
+import os
+
+import sqlalchemy as s
+
+from src import database as db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+
+# The migrations that backfill the aggregate tables kept by src/aggregates.py,
+# in the order they build on each other. Each one only creates what doesn't
+# exist yet, so they can be run again.
+AGGREGATE_MIGRATIONS = [
+    "001_character_stats.sql",
+    "005_movie_stats.sql",
+    "007_movie_conversation_counts.sql",
+]
+
+
+def read(filename):
+    with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as f:
+        return f.read()
+
+
+def pending(conn):
+    applied = {row.version for row in conn.execute(s.text("select version from schema_migrations"))}
+    return [
+        filename
+        for filename in sorted(os.listdir(MIGRATIONS_DIR))
+        if filename.endswith(".sql") and filename not in applied
+    ]
+
+
+def main():
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            "create table if not exists schema_migrations ("
+            "version text primary key, applied_at timestamptz not null default now())"
+        )
+        filenames = pending(conn)
+
+    for filename in filenames:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(read(filename))
+            conn.execute(
+                s.text("insert into schema_migrations (version) values (:version)"),
+                {"version": filename},
+            )
+        print(f"applied {filename}")
+
+    if not filenames:
+        print("database is up to date")
+
+
+def rebuild_aggregates(conn):
+    """
+    Empties the aggregate tables and backfills them again from the base
+    tables, by rerunning their migrations on `conn`. For after a bulk load
+    (see scripts/seed.py), which src/aggregates.py never sees.
+    """
+
+    conn.exec_driver_sql("truncate movie_stats, character_pair_stats, character_stats")
+    for filename in AGGREGATE_MIGRATIONS:
+        conn.exec_driver_sql(read(filename))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Seeds a local Postgres for benchmarking (see benchmarks/bench_endpoints.py)
+with the movies, characters and conversations in the bundled CSVs, and
+generated lines for every conversation, since lines.csv isn't bundled.
+`--scale N` loads N copies of all of it, each with its own ids, so seeding at
+1, 10 and 100 shows how the endpoints behave as the data grows.
+
+The base tables are created if they don't exist, the rows are streamed in with
+COPY, then the migrations are applied, which builds the indexes, the
+aggregates are rebuilt from the new rows and the id sequences are moved past
+them. Refuses to touch a database that isn't on this machine unless given
+--allow-remote, or one that already has movies unless given --reset, which
+empties it first.
+
+Create the database with `createdb --locale=C`, so it sorts text the way the
+memory backend does (see src/memory.py).
+
+To load a generated corpus of any size instead, see scripts/synthetic.py.
+
+Usage: python -m scripts.seed [--scale 10] [--reset]
+"""
+import argparse
+import csv
+import io
+import os
+import random
+
+import sqlalchemy as s
+
+from scripts import migrate
+from src import database as db
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Rows sent per COPY.
+COPY_ROWS = 100000
+
+BASE_TABLES = [db.movies, db.characters, db.conversations, db.lines]
+
+# The ids the API hands out when a conversation is added (see
+# migrations/004_id_sequences.sql), which COPY writes explicitly.
+SEQUENCE_COLUMNS = [db.conversations.c.conversation_id, db.lines.c.line_id]
+
+WORDS = (
+    "i you the a to what it is that not and do have me know no we don't in just are your this "
+    "of he on was it's for get right here my be all there can with about want go think how why "
+    "love said smoking money kill tonight home never sorry please listen look tell dead okay"
+).split()
+
+
+def read_csv(filename, directory=ROOT):
+    with open(os.path.join(directory, filename), encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def copy_rows(conn, table, columns, rows):
+    """Streams `rows` into `table` with COPY. Returns how many there were."""
+
+    cursor = conn.connection.cursor()
+    statement = f"copy {table.name} ({', '.join(columns)}) from stdin with (format csv)"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    count = 0
+    for row in rows:
+        # Empty fields are loaded as nulls.
+        writer.writerow(row)
+        count += 1
+        if count % COPY_ROWS == 0:
+            flush()
+    flush()
+    return count
+
+
+def conversation_length(rng):
+    # About 3.7 lines per conversation on average, with a long tail, as in
+    # the Cornell corpus.
+    return 1 + min(int(rng.expovariate(1 / 2.7)), 88)
+
+
+def line_text(rng):
+    words = rng.choices(WORDS, k=1 + int(rng.expovariate(1 / 9)))
+    return " ".join(words).capitalize() + "."
+
+
+def span(rows, column):
+    return max(int(row[column]) for row in rows) + 1
+
+
+def seed(conn, scale, rng):
+    movies = read_csv("movies.csv")
+    characters = read_csv("characters.csv")
+    conversations = read_csv("conversations.csv")
+
+    # Copy k of each row is offset by k times the table's id span.
+    movie_span = span(movies, "movie_id")
+    character_span = span(characters, "character_id")
+    conversation_span = span(conversations, "conversation_id")
+
+    def movie_rows():
+        for k in range(scale):
+            for movie in movies:
+                yield (
+                    int(movie["movie_id"]) + k * movie_span,
+                    movie["title"] if k == 0 else f"{movie['title']} ({k + 1})",
+                    movie["year"],
+                    movie["imdb_rating"],
+                    movie["imdb_votes"],
+                    movie["raw_script_url"],
+                )
+
+    def character_rows():
+        for k in range(scale):
+            for character in characters:
+                yield (
+                    int(character["character_id"]) + k * character_span,
+                    character["name"],
+                    int(character["movie_id"]) + k * movie_span,
+                    character["gender"],
+                    character["age"],
+                )
+
+    def conversation_rows():
+        for k in range(scale):
+            for conversation in conversations:
+                yield (
+                    int(conversation["conversation_id"]) + k * conversation_span,
+                    int(conversation["character1_id"]) + k * character_span,
+                    int(conversation["character2_id"]) + k * character_span,
+                    int(conversation["movie_id"]) + k * movie_span,
+                )
+
+    def line_rows():
+        line_id = 0
+        for conversation_id, character1_id, character2_id, movie_id in conversation_rows():
+            speakers = (character1_id, character2_id) if rng.random() < 0.5 else (character2_id, character1_id)
+            for line_sort in range(1, conversation_length(rng) + 1):
+                yield line_id, speakers[(line_sort - 1) % 2], movie_id, conversation_id, line_sort, line_text(rng)
+                line_id += 1
+
+    return {
+        "movies": copy_rows(
+            conn, db.movies, ["movie_id", "title", "year", "imdb_rating", "imdb_votes", "raw_script_url"], movie_rows()
+        ),
+        "characters": copy_rows(
+            conn, db.characters, ["character_id", "name", "movie_id", "gender", "age"], character_rows()
+        ),
+        "conversations": copy_rows(
+            conn, db.conversations, ["conversation_id", "character1_id", "character2_id", "movie_id"], conversation_rows()
+        ),
+        "lines": copy_rows(
+            conn, db.lines, ["line_id", "character_id", "movie_id", "conversation_id", "line_sort", "line_text"], line_rows()
+        ),
+    }
+
+
+def reset_sequences(conn):
+    """
+    Moves the id sequences past the ids just copied in, which COPY doesn't
+    advance them for, so adding a conversation doesn't reuse one. A reset
+    only empties the tables, so the sequences can be behind or ahead.
+    """
+
+    for column in SEQUENCE_COLUMNS:
+        conn.execute(
+            s.select(
+                s.func.setval(
+                    s.func.pg_get_serial_sequence(column.table.name, column.name),
+                    s.func.coalesce(s.select(s.func.max(column)).scalar_subquery(), 0) + 1,
+                    False,
+                )
+            )
+        )
+
+
+def load(fill, reset=False, allow_remote=False):
+    """
+    Creates the base tables if they don't exist, streams the rows in with
+    `fill(conn)`, which returns how many it loaded of each table, then applies
+    the migrations, rebuilds the aggregates, moves the id sequences past the
+    new rows and analyzes. Refuses a database that isn't on this machine
+    unless `allow_remote`, and one that already has movies unless `reset`.
+    """
+
+    if db.backend != "postgres":
+        raise SystemExit("seeding needs MOVIE_API_BACKEND=postgres.")
+    if os.environ.get("POSTGRES_SERVER") not in LOCAL_HOSTS and not allow_remote:
+        raise SystemExit(f"POSTGRES_SERVER is {os.environ.get('POSTGRES_SERVER')!r}, not this machine; pass --allow-remote to seed it anyway.")
+
+    with db.engine.begin() as conn:
+        db.metadata.create_all(conn, tables=BASE_TABLES)
+
+        if conn.execute(s.select(s.func.count()).select_from(db.movies)).scalar_one() > 0:
+            if not reset:
+                raise SystemExit("the database already has movies; pass --reset to replace them.")
+            conn.exec_driver_sql("truncate movies, characters, conversations, lines cascade")
+
+        counts = fill(conn)
+
+    for table, count in counts.items():
+        print(f"loaded {count} {table}")
+
+    # The migrations create the aggregate tables (and backfill them on a new
+    # database), but the rows were copied in without going through
+    # src/aggregates.py, so they're rebuilt either way.
+    migrate.main()
+    with db.engine.begin() as conn:
+        migrate.rebuild_aggregates(conn)
+        reset_sequences(conn)
+    print("rebuilt the aggregates")
+
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("analyze")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1, help="copies of the corpus to load")
+    parser.add_argument("--reset", action="store_true", help="empty the database first")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated lines")
+    parser.add_argument("--allow-remote", action="store_true")
+    args = parser.parse_args()
+
+    load(lambda conn: seed(conn, args.scale, random.Random(args.seed)), args.reset, args.allow_remote)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Generates a corpus of any size that looks like the Cornell one, for testing
+the API well beyond it (tens of millions of lines), and loads it into a local
+Postgres with COPY like scripts/seed.py, or writes it out as CSVs for the
+memory backend (point MEMORY_DATA_DIR at the directory).
+
+Every generated movie takes its shape from a movie in the corpus, picked at
+random: the same number of characters, with the same genders and credit
+positions, and the same conversations between them, so per-movie character
+counts and who talks to whom (what the partner and pair aggregates are built
+from) follow the corpus. Character names, titles, years, ratings and votes
+are drawn from the corpus's own values. If the corpus directory has a
+lines.csv, conversation lengths, line lengths (in words) and the words
+themselves are drawn from it too; otherwise from scripts/seed.py's
+approximations.
+
+Usage:
+    python -m scripts.synthetic --lines 30000000 [--reset]
+    python -m scripts.synthetic --movies 1000 --csv /tmp/synthetic
+"""
+import argparse
+import csv
+import itertools
+import math
+import os
+import random
+import re
+import statistics
+from collections import Counter, namedtuple
+
+from scripts import seed
+from src import database as db
+
+WORD = re.compile(r"[\w']+")
+
+# A movie to copy the shape of: its characters' (gender, age) and its
+# conversations, as pairs of positions in that list.
+Template = namedtuple("Template", "characters pairs")
+
+
+def weighted(counts):
+    """(values, cum_weights) for random.choices() from a Counter."""
+
+    values = list(counts)
+    return values, list(itertools.accumulate(counts[value] for value in values))
+
+
+class Profile:
+    """The distributions a corpus is generated from, taken from the CSVs of a real one."""
+
+    def __init__(self, movies, characters, conversations, lines=None):
+        self.movies = [(movie["year"], movie["imdb_rating"], movie["imdb_votes"]) for movie in movies]
+        titles = [movie["title"].split() for movie in movies]
+        self.title_lengths = [len(title) for title in titles if title]
+        self.title_words = weighted(Counter(word for title in titles for word in title))
+
+        self.names = [character["name"] for character in characters]
+
+        positions = {}
+        templates = {movie["movie_id"]: Template([], []) for movie in movies}
+        for character in characters:
+            template = templates.get(character["movie_id"])
+            if template is not None:
+                positions[character["character_id"]] = len(template.characters)
+                template.characters.append((character["gender"], character["age"]))
+        for conversation in conversations:
+            template = templates.get(conversation["movie_id"])
+            if template is not None and {conversation["character1_id"], conversation["character2_id"]} <= positions.keys():
+                template.pairs.append(
+                    (positions[conversation["character1_id"]], positions[conversation["character2_id"]])
+                )
+        self.templates = [template for template in templates.values() if template.characters]
+
+        self.conversation_lengths = None
+        self.line_lengths = None
+        self.words = None
+        if lines:
+            self.conversation_lengths = list(Counter(line["conversation_id"] for line in lines).values())
+            words = [WORD.findall(line["line_text"].lower()) for line in lines]
+            self.line_lengths = [len(line) for line in words if line]
+            self.words = weighted(Counter(word for line in words for word in line))
+
+    @classmethod
+    def read(cls, directory):
+        """The profile of the corpus in `directory`, with lines.csv if there is one."""
+
+        has_lines = os.path.exists(os.path.join(directory, "lines.csv"))
+        return cls(
+            *(seed.read_csv(filename, directory) for filename in ("movies.csv", "characters.csv", "conversations.csv")),
+            seed.read_csv("lines.csv", directory) if has_lines else None,
+        )
+
+    def title(self, rng):
+        words, cum_weights = self.title_words
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.choice(self.title_lengths)))
+
+    def conversation_length(self, rng):
+        if self.conversation_lengths is None:
+            return seed.conversation_length(rng)
+        return rng.choice(self.conversation_lengths)
+
+    def line_text(self, rng):
+        if self.words is None:
+            return seed.line_text(rng)
+        words, cum_weights = self.words
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.choice(self.line_lengths))).capitalize() + "."
+
+    def lines_per_movie(self):
+        if self.conversation_lengths is None:
+            rng = random.Random(0)
+            conversation_length = statistics.mean(seed.conversation_length(rng) for _ in range(10000))
+        else:
+            conversation_length = statistics.mean(self.conversation_lengths)
+        return statistics.mean(len(template.pairs) for template in self.templates) * conversation_length
+
+
+def generate(profile, movies, random_seed=0):
+    """
+    The rows of a corpus of `movies` movies, as {table: (columns, rows)}
+    where rows is an iterator, so tens of millions of them never have to be
+    in memory at once. Ids start at 0. Each table draws from its own random
+    stream, so the same seed always gives the same corpus.
+    """
+
+    rng = random.Random(f"{random_seed}:templates")
+    templates = [rng.choice(profile.templates) for _ in range(movies)]
+    # The first character and conversation id of each movie.
+    character_offsets = [0, *itertools.accumulate(len(template.characters) for template in templates)]
+    conversation_offsets = [0, *itertools.accumulate(len(template.pairs) for template in templates)]
+
+    def movie_rows():
+        rng = random.Random(f"{random_seed}:movies")
+        for movie_id in range(movies):
+            year, imdb_rating, imdb_votes = rng.choice(profile.movies)
+            yield movie_id, profile.title(rng), year, imdb_rating, imdb_votes, ""
+
+    def character_rows():
+        rng = random.Random(f"{random_seed}:characters")
+        for movie_id, template in enumerate(templates):
+            for position, (gender, age) in enumerate(template.characters):
+                yield character_offsets[movie_id] + position, rng.choice(profile.names), movie_id, gender, age
+
+    def conversation_rows():
+        for movie_id, template in enumerate(templates):
+            for position, (character1, character2) in enumerate(template.pairs):
+                yield (
+                    conversation_offsets[movie_id] + position,
+                    character_offsets[movie_id] + character1,
+                    character_offsets[movie_id] + character2,
+                    movie_id,
+                )
+
+    def line_rows():
+        rng = random.Random(f"{random_seed}:lines")
+        line_id = 0
+        for conversation_id, character1_id, character2_id, movie_id in conversation_rows():
+            speakers = (character1_id, character2_id)
+            for line_sort in range(1, profile.conversation_length(rng) + 1):
+                yield line_id, speakers[(line_sort - 1) % 2], movie_id, conversation_id, line_sort, profile.line_text(rng)
+                line_id += 1
+
+    return {
+        db.movies: (["movie_id", "title", "year", "imdb_rating", "imdb_votes", "raw_script_url"], movie_rows()),
+        db.characters: (["character_id", "name", "movie_id", "gender", "age"], character_rows()),
+        db.conversations: (["conversation_id", "character1_id", "character2_id", "movie_id"], conversation_rows()),
+        db.lines: (["line_id", "character_id", "movie_id", "conversation_id", "line_sort", "line_text"], line_rows()),
+    }
+
+
+def write_csvs(directory, tables):
+    """Writes each table to `directory`/<table>.csv, as the memory backend reads them."""
+
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for table, (columns, rows) in tables.items():
+        with open(os.path.join(directory, f"{table.name}.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            counts[table.name] = 0
+            for row in rows:
+                writer.writerow(row)
+                counts[table.name] += 1
+    return counts
+
+
+def copy_tables(conn, tables):
+    return {table.name: seed.copy_rows(conn, table, columns, rows) for table, (columns, rows) in tables.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--movies", type=int, help="how many movies to generate")
+    size.add_argument("--lines", type=int, help="about how many lines to generate")
+    parser.add_argument("--corpus", default=seed.ROOT, help="directory of the CSVs to take the distributions from")
+    parser.add_argument("--csv", metavar="DIR", help="write CSVs here instead of loading Postgres")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="empty the database first")
+    parser.add_argument("--allow-remote", action="store_true")
+    args = parser.parse_args()
+
+    profile = Profile.read(args.corpus)
+    movies = args.movies if args.movies is not None else math.ceil(args.lines / profile.lines_per_movie())
+    tables = generate(profile, movies, args.seed)
+
+    if args.csv:
+        for table, count in write_csvs(args.csv, tables).items():
+            print(f"wrote {count} {table}")
+    else:
+        seed.load(lambda conn: copy_tables(conn, tables), args.reset, args.allow_remote)
+
+
+if __name__ == "__main__":
+    main()
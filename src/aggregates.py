@@ -0,0 +1,137 @@
+from collections import Counter
+from sqlalchemy.dialects.postgresql import insert
+from src import database as db
+import sqlalchemy as s
+
+# The character_stats and character_pair_stats tables are precomputed versions
+# of the GROUP BY queries the endpoints used to run on every request. They are
+# backfilled by migrations/001_character_stats.sql and kept current here, inside
+# the same transaction that writes the conversation, so they can never drift.
+# movie_stats (see migrations/005_movie_stats.sql) is kept current the same
+# way. Every table is updated by adding the write's counts to the stored ones,
+# never by recomputing a total: two concurrent writes to a movie each see a
+# snapshot without the other's rows, so a recomputed total would lose one.
+# scripts/migrate.py's rebuild_aggregates() recomputes them whole, for after a
+# bulk load that bypassed this module.
+
+
+async def record_conversation(conn, movie_id, character1_id, character2_id, line_character_ids):
+    """
+    Adds a newly inserted conversation to the aggregates. `line_character_ids`
+    is the speaker of each line in the conversation, in any order.
+    """
+
+    await record_conversations(conn, movie_id, [(character1_id, character2_id, line_character_ids)])
+
+
+async def record_conversations(conn, movie_id, conversations):
+    """
+    Adds a batch of newly inserted conversations, each a
+    `(character1_id, character2_id, line_character_ids)` tuple, to the
+    aggregates with one upsert per table. The rows of each upsert are sorted
+    by primary key, so concurrent writes lock them in the same order instead
+    of deadlocking when they name a pair the other way round.
+    """
+
+    line_counts = Counter()
+    conversation_counts = Counter()
+    pair_line_counts = Counter()
+    pair_conversation_counts = Counter()
+
+    for character1_id, character2_id, line_character_ids in conversations:
+        spoken = Counter(line_character_ids)
+        for character_id, partner_id in ((character1_id, character2_id), (character2_id, character1_id)):
+            line_counts[character_id] += spoken[character_id]
+            conversation_counts[character_id] += 1
+            pair_line_counts[(character_id, partner_id)] += len(line_character_ids)
+            pair_conversation_counts[(character_id, partner_id)] += 1
+
+    if not conversation_counts:
+        return
+
+    stmt = insert(db.character_stats).values(
+        [
+            {
+                'character_id': character_id,
+                'movie_id': movie_id,
+                'line_count': line_counts[character_id],
+                'conversation_count': conversation_count,
+            }
+            for character_id, conversation_count in sorted(conversation_counts.items())
+        ]
+    )
+    await conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[db.character_stats.c.character_id],
+            set_={
+                'line_count': db.character_stats.c.line_count + stmt.excluded.line_count,
+                'conversation_count': db.character_stats.c.conversation_count + stmt.excluded.conversation_count,
+            },
+        )
+    )
+
+    stmt = insert(db.character_pair_stats).values(
+        [
+            {
+                'character_id': character_id,
+                'partner_id': partner_id,
+                'movie_id': movie_id,
+                'line_count': pair_line_counts[(character_id, partner_id)],
+                'conversation_count': conversation_count,
+            }
+            for (character_id, partner_id), conversation_count in sorted(pair_conversation_counts.items())
+        ]
+    )
+    await conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[db.character_pair_stats.c.character_id, db.character_pair_stats.c.partner_id],
+            set_={
+                'line_count': db.character_pair_stats.c.line_count + stmt.excluded.line_count,
+                'conversation_count': db.character_pair_stats.c.conversation_count + stmt.excluded.conversation_count,
+            },
+        )
+    )
+
+    await record_movie_stats(conn, movie_id, conversations)
+
+
+async def record_movie_stats(conn, movie_id, conversations):
+    """
+    Adds a batch of conversations to the movie's movie_stats row, counting
+    the conversations and lines directly. The row exists for every movie
+    (migrations/005_movie_stats.sql backfills them, and movies are never
+    added), so the insert only covers a database that skipped the backfill.
+    """
+
+    speakers = Counter(character_id for _, _, line_character_ids in conversations for character_id in line_character_ids)
+    genders = {}
+    if speakers:
+        genders = dict(
+            (
+                await conn.execute(
+                    s.select(db.characters.c.character_id, db.characters.c.gender)
+                    .where(db.characters.c.character_id.in_(list(speakers)))
+                )
+            ).all()
+        )
+
+    stmt = insert(db.movie_stats).values(
+        movie_id=movie_id,
+        character_count=(
+            s.select(s.func.count()).select_from(db.characters).where(db.characters.c.movie_id == movie_id).scalar_subquery()
+        ),
+        line_count=sum(speakers.values()),
+        conversation_count=len(conversations),
+        male_line_count=sum(count for character_id, count in speakers.items() if genders.get(character_id) == 'M'),
+        female_line_count=sum(count for character_id, count in speakers.items() if genders.get(character_id) == 'F'),
+    )
+    await conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[db.movie_stats.c.movie_id],
+            set_={
+                column: db.movie_stats.c[column] + stmt.excluded[column]
+                for column in ['line_count', 'conversation_count', 'male_line_count', 'female_line_count']
+            },
+        )
+    )
+
@@ -0,0 +1,51 @@
+from fastapi import HTTPException
+from pydantic import BaseModel
+from typing import List
+from src import cache
+import sqlalchemy as s
+from sqlalchemy.dialects.postgresql import ARRAY
+
+# Batch lookups: the POST /.../batch endpoints resolve a list of ids at once.
+# Each id is answered from the same cache entry its detail endpoint uses if it
+# can be, and the rest are fetched together with one `= ANY(array)` query.
+
+MAX_IDS = 1000
+
+
+class BatchJson(BaseModel):
+    ids: List[int]
+
+
+def any_id(column, ids):
+    """`column = ANY(ids)`, with the ids bound as a single array parameter."""
+
+    return column == s.any_(s.literal(list(ids), ARRAY(s.Integer)))
+
+
+async def lookup(ids, cache_key, fetch, detail):
+    """
+    Returns the result for each of `ids`, in order, or a
+    `{"status_code": 404, "detail": detail}` marker for ids that don't exist.
+    `cache_key(id)` is awaited for each id's cache key (see cache.key()), and
+    `fetch` is awaited once with the ids that weren't cached and returns a
+    dict of the results it found, by id.
+    """
+
+    if len(ids) > MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"at most {MAX_IDS} ids per request.")
+
+    results = {}
+    missing = []
+    for id in dict.fromkeys(ids):
+        cached = await cache.get(await cache_key(id))
+        if cached is cache.MISSING:
+            missing.append(id)
+        else:
+            results[id] = cached
+
+    if missing:
+        for id, result in (await fetch(missing)).items():
+            await cache.put(await cache_key(id), result)
+            results[id] = result
+
+    return [results.get(id, {'status_code': 404, 'detail': detail}) for id in ids]
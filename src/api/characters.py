@@ -1,89 +1,57 @@
 from fastapi import APIRouter, HTTPException
 from enum import Enum
+from itertools import groupby
+from src import cache
 from src import database as db
+from src import graph
+from src import memory
+from src.api import batch, filters, pagination
 import sqlalchemy as s
 
 router = APIRouter()
 
 
-@router.get("/characters/{id}", tags=["characters"])
-def get_character(id: str):
-    """
-    This endpoint returns a single character by its identifier. For each character
-    it returns:
-    * `character_id`: the internal id of the character. Can be used to query the
-      `/characters/{character_id}` endpoint.
-    * `character`: The name of the character.
-    * `movie`: The movie the character is from.
-    * `gender`: The gender of the character.
-    * `top_conversations`: A list of characters that the character has the most
-      conversations with. The characters are listed in order of the number of
-      lines together. These conversations are described below.
+def character_details():
+    """The query behind `/characters/{id}`, for any number of characters."""
 
-    Each conversation is represented by a dictionary with the following keys:
-    * `character_id`: the internal id of the character.
-    * `character`: The name of the character.
-    * `gender`: The gender of the character.
-    * `number_of_lines_together`: The number of lines the character has with the
-      originally queried character.
-    """
+    # The header and the partner list come back together: one row per partner
+    # (or a single row with null partner columns if the character has none).
+    partner = db.characters.alias('partner')
 
-    stmt = (
+    return (
         s.select(
             db.characters.c.character_id,
             db.characters.c.name,
             db.movies.c.title,
-            db.characters.c.gender
-        )
-        .where(db.characters.c.character_id == id)
-        .join(db.movies, db.characters.c.movie_id == db.movies.c.movie_id)
-    )
-
-    with db.engine.connect() as conn:
-        characters_result = conn.execute(stmt)
-
-    character = characters_result.first()
-
-    if character is None:
-         raise HTTPException(status_code=404, detail="character not found.")
-
-    stmt = (
-        s.select(
-            db.characters.c.character_id,
-            db.characters.c.name,
             db.characters.c.gender,
-            s.func.count(db.lines.c.character_id).label('line_count'),
+            partner.c.character_id.label('partner_id'),
+            partner.c.name.label('partner_name'),
+            partner.c.gender.label('partner_gender'),
+            db.character_pair_stats.c.line_count,
         )
-        .where((db.conversations.c.character2_id == id) | (db.conversations.c.character1_id == id))
-        .join(db.lines, db.lines.c.conversation_id == db.conversations.c.conversation_id).join(db.characters, (db.characters.c.character_id == db.conversations.c.character1_id))
-        .group_by(db.characters.c.character_id)
-        .filter(db.characters.c.character_id != id)
-        .union(
-            s.select(
-                db.characters.c.character_id,
-                db.characters.c.name,
-                db.characters.c.gender,
-                s.func.count(db.lines.c.character_id).label('line_count'),
-            )
-            .where((db.conversations.c.character2_id == id) | (db.conversations.c.character1_id == id))
-            .join(db.lines, db.lines.c.conversation_id == db.conversations.c.conversation_id).join(db.characters, (db.characters.c.character_id == db.conversations.c.character2_id))
-            .group_by(db.characters.c.character_id)
-            .filter(db.characters.c.character_id != id)
+        .select_from(
+            db.characters
+            .join(db.movies, db.characters.c.movie_id == db.movies.c.movie_id)
+            .outerjoin(db.character_pair_stats, db.character_pair_stats.c.character_id == db.characters.c.character_id)
+            .outerjoin(partner, partner.c.character_id == db.character_pair_stats.c.partner_id)
         )
-        .order_by(s.desc('line_count'))
     )
 
-    with db.engine.connect() as conn:
-        conversations_result = conn.execute(stmt)
 
+def character_json(rows):
+    """Formats one character's rows of `character_details()`, partners in order."""
+
+    character = rows[0]
     top_conversations = []
 
-    for recipient in conversations_result:
+    for recipient in rows:
+        if recipient.partner_id is None:
+            continue
         top_conversations.append(
             {
-                'character_id': recipient.character_id,
-                'character': recipient.name,
-                'gender': recipient.gender,
+                'character_id': recipient.partner_id,
+                'character': recipient.partner_name,
+                'gender': recipient.partner_gender,
                 'number_of_lines_together': recipient.line_count
             }
         )
@@ -97,6 +65,54 @@ def get_character(id: str):
     }
 
 
+@router.get("/characters/{id}", tags=["characters"])
+async def get_character(id: int):
+    """
+    This endpoint returns a single character by its identifier. For each character
+    it returns:
+    * `character_id`: the internal id of the character. Can be used to query the
+      `/characters/{character_id}` endpoint.
+    * `character`: The name of the character.
+    * `movie`: The movie the character is from.
+    * `gender`: The gender of the character.
+    * `top_conversations`: A list of characters that the character has the most
+      conversations with. The characters are listed in order of the number of
+      lines together. These conversations are described below.
+
+    Each conversation is represented by a dictionary with the following keys:
+    * `character_id`: the internal id of the character.
+    * `character`: The name of the character.
+    * `gender`: The gender of the character.
+    * `number_of_lines_together`: The number of lines the character has with the
+      originally queried character.
+    """
+
+    key = await cache.key('character', id, scope=f'character:{id}')
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    if db.backend == "memory":
+        rows = memory.dataset().character(id)
+    else:
+        stmt = (
+            character_details()
+            .where(db.characters.c.character_id == id)
+            .order_by(s.desc(db.character_pair_stats.c.line_count), db.character_pair_stats.c.partner_id)
+        )
+
+        async with db.async_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+
+    if len(rows) == 0:
+         raise HTTPException(status_code=404, detail="character not found.")
+
+    result = character_json(rows)
+
+    await cache.put(key, result)
+    return result
+
+
     #
     # gender = None
     # if character['gender'] != '':
@@ -146,18 +162,142 @@ def get_character(id: str):
     #     'top_conversations': top_conversations,
     # }
 
+
+@router.post("/characters/batch", tags=["characters"])
+async def get_characters_batch(body: batch.BatchJson):
+    """
+    This endpoint looks up many characters at once. The request body is
+    `{"ids": [...]}` with at most 1000 character ids. It returns a list with
+    one entry per id, in the same order: the character, as
+    `/characters/{id}` returns it, or
+    `{"status_code": 404, "detail": "character not found."}`.
+    """
+
+    async def fetch(ids):
+        if db.backend == "memory":
+            dataset = memory.dataset()
+            characters = (dataset.character(id) for id in ids)
+        else:
+            stmt = (
+                character_details()
+                .where(batch.any_id(db.characters.c.character_id, ids))
+                .order_by(
+                    db.characters.c.character_id,
+                    s.desc(db.character_pair_stats.c.line_count),
+                    db.character_pair_stats.c.partner_id,
+                )
+            )
+            async with db.async_engine.connect() as conn:
+                rows = (await conn.execute(stmt)).all()
+            characters = (list(group) for _, group in groupby(rows, key=lambda row: row.character_id))
+        return {rows[0].character_id: character_json(rows) for rows in characters if len(rows) > 0}
+
+    return await batch.lookup(
+        body.ids, lambda id: cache.key('character', id, scope=f'character:{id}'), fetch, "character not found."
+    )
+
+
+@router.get("/characters/{id}/partners", tags=["characters"])
+async def get_partners(id: int, limit: int = 5):
+    """
+    This endpoint returns the characters a character talks to the most. For
+    each partner it returns:
+    * `character_id`: the internal id of the character.
+    * `character`: The name of the character.
+    * `gender`: The gender of the character.
+    * `number_of_lines_together`: The number of lines in the conversations
+      between the two characters.
+
+    The partners are ordered by the number of lines together. The `limit`
+    query parameter specifies how many to return.
+    """
+
+    movie_id = await graph.interactions.movie_of(id)
+    if movie_id is None:
+        raise HTTPException(status_code=404, detail="character not found.")
+
+    movie_graph = await graph.interactions.movie(movie_id)
+
+    json = []
+    for partner_id, line_count in movie_graph.top_partners(id, limit):
+        name, gender = movie_graph.characters[partner_id]
+        json.append(
+            {
+                'character_id': partner_id,
+                'character': name,
+                'gender': gender,
+                'number_of_lines_together': line_count,
+            }
+        )
+
+    return json
+
+
+@router.get("/characters/{id}/path/{other_id}", tags=["characters"])
+async def get_path(id: int, other_id: int):
+    """
+    This endpoint returns the shortest chain of conversations linking two
+    characters: a list of characters, starting with the first and ending with
+    the second, in which each character talks to the next. For each character
+    it returns:
+    * `character_id`: the internal id of the character.
+    * `character`: The name of the character.
+
+    Characters only talk within their own movie, so there is no path between
+    characters from different movies.
+    """
+
+    movie_id = await graph.interactions.movie_of(id)
+    other_movie_id = await graph.interactions.movie_of(other_id)
+    if movie_id is None or other_movie_id is None:
+        raise HTTPException(status_code=404, detail="character not found.")
+
+    path = None
+    if movie_id == other_movie_id:
+        movie_graph = await graph.interactions.movie(movie_id)
+        path = movie_graph.shortest_path(id, other_id)
+
+    if path is None:
+        raise HTTPException(status_code=404, detail="no path between the characters.")
+
+    return [
+        {
+            'character_id': character_id,
+            'character': movie_graph.characters[character_id][0],
+        }
+        for character_id in path
+    ]
+
+
 class character_sort_options(str, Enum):
     character = "character"
     movie = "movie"
     number_of_lines = "number_of_lines"
 
 
+# The row attribute each sort option orders by: what a cursor records, and what
+# src/memory.py sorts on.
+SORT_KEYS = {
+    character_sort_options.character: "name",
+    character_sort_options.movie: "title",
+    character_sort_options.number_of_lines: "line_count",
+}
+
+# The type of each sort key, which a cursor passed back in must match.
+SORT_TYPES = {
+    character_sort_options.character: str,
+    character_sort_options.movie: str,
+    character_sort_options.number_of_lines: int,
+}
+
+
 @router.get("/characters/", tags=["characters"])
-def list_characters(
+async def list_characters(
     name: str = "",
     limit: int = 50,
     offset: int = 0,
     sort: character_sort_options = character_sort_options.character,
+    cursor: str = "",
 ):
     """
     This endpoint returns a list of characters. For each character it returns:
@@ -179,48 +319,76 @@ def list_characters(
     parameters are used for pagination. The `limit` query parameter specifies the
     maximum number of results to return. The `offset` query parameter specifies the
     number of results to skip before returning results.
+
+    For deep pagination, pass the `X-Next-Cursor` response header back as the
+    `cursor` query parameter instead of increasing `offset`. A cursor continues
+    directly after the last row of the page that issued it (`offset` is ignored)
+    and is only valid with the same `sort`. The header is absent on the last page.
     """
 
-    if sort is character_sort_options.character:
-        order_by = db.characters.c.name
-    elif sort is character_sort_options.movie:
-        order_by = db.movies.c.title
-    elif sort is character_sort_options.number_of_lines:
-        order_by = s.desc('line_count')
-    else:
-        assert False
+    key = await cache.key('characters', name, limit, offset, sort.value, cursor, scope='corpus')
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        json, next_cursor = cached
+        return pagination.page_response(json, next_cursor)
 
-    stmt = (
-        s.select(
-            db.characters.c.character_id,
-            db.characters.c.name,
-            db.movies.c.title,
-            s.func.count(db.lines.c.line_id).label('line_count'),
+    if db.backend == "memory":
+        rows = memory.dataset().characters(
+            name, limit, offset, SORT_KEYS[sort],
+            pagination.decode_cursor(cursor, sort.value, SORT_TYPES[sort]) if cursor != "" else None,
         )
-        .group_by(db.characters.c.character_id, db.movies.c.title)
-        .select_from(db.characters.join(db.lines, db.lines.c.character_id == db.characters.c.character_id).join(db.movies, db.movies.c.movie_id == db.characters.c.movie_id))
-        .limit(limit)
-        .offset(offset)
-        .order_by(order_by, db.characters.c.character_id)
-    )
+    else:
+        descending = False
+        if sort is character_sort_options.character:
+            sort_column = db.characters.c.name
+        elif sort is character_sort_options.movie:
+            sort_column = db.movies.c.title
+        elif sort is character_sort_options.number_of_lines:
+            sort_column = db.character_stats.c.line_count
+            descending = True
+        else:
+            assert False
 
-    if name != "":
-        stmt = stmt.where(db.characters.c.name.ilike(f"%{name}%"))
-
-    with db.engine.connect() as conn:
-        result = conn.execute(stmt)
-        json = []
-        for row in result:
-            json.append(
-                {
-                    'character_id': row.character_id,
-                    'character': row.name,
-                    'movie': row.title,
-                    'number_of_lines': row.line_count
-                }
+        order_by = s.desc(sort_column) if descending else sort_column
+
+        stmt = (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.name,
+                db.movies.c.title,
+                db.character_stats.c.line_count,
             )
+            .select_from(db.character_stats.join(db.characters, db.characters.c.character_id == db.character_stats.c.character_id).join(db.movies, db.movies.c.movie_id == db.character_stats.c.movie_id))
+            .where(db.character_stats.c.line_count > 0)
+            .limit(limit)
+            .order_by(order_by, db.characters.c.character_id)
+        )
 
-    return json
+        if cursor != "":
+            stmt = stmt.where(pagination.after_cursor(cursor, sort.value, SORT_TYPES[sort], sort_column, db.characters.c.character_id, descending))
+        else:
+            stmt = stmt.offset(offset)
+
+        if name != "":
+            stmt = stmt.where(filters.contains(db.characters.c.name, name))
+
+        async with db.async_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+
+    json = []
+    for row in rows:
+        json.append(
+            {
+                'character_id': row.character_id,
+                'character': row.name,
+                'movie': row.title,
+                'number_of_lines': row.line_count
+            }
+        )
+
+    next_cursor = pagination.next_cursor(rows, limit, sort.value, SORT_KEYS[sort], 'character_id')
+    await cache.put(key, [json, next_cursor])
+    return pagination.page_response(json, next_cursor)
 
     # line_counts = {}
     #
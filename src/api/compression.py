@@ -0,0 +1,187 @@
+from starlette.datastructures import Headers, MutableHeaders
+import os
+import zlib
+
+# Response compression. Listing pages and long conversations are large and
+# repetitive (the same titles and names on every row), so they shrink a lot.
+# Brotli is used when the client accepts it and the optional `brotli` package
+# is installed, gzip otherwise. Configured from environment variables:
+# * `COMPRESSION`: set to off to disable it, e.g. when a CDN in front already
+#   compresses (default on).
+# * `COMPRESSION_MIN_SIZE`: bodies smaller than this many bytes are sent as is
+#   (default 1024).
+# * `COMPRESSION_GZIP_LEVEL`: 1 (fastest) to 9 (smallest) (default 3).
+# * `COMPRESSION_BROTLI_QUALITY`: 0 (fastest) to 11 (smallest) (default 4).
+# benchmarks/bench_compression.py measures the trade-off between levels.
+
+MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 3))
+BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level=GZIP_LEVEL):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, finish):
+        """
+        Compresses the next chunk of the body. Unless it's the last, the output
+        is flushed so a streamed chunk reaches the client right away.
+        """
+
+        output = self.compressor.compress(data)
+        return output + self.compressor.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality=BROTLI_QUALITY):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data, finish):
+        output = self.compressor.process(data)
+        return output + (self.compressor.finish() if finish else self.compressor.flush())
+
+
+def accepted_encodings(accept_encoding):
+    """The codings an Accept-Encoding header allows, ignoring q=0 ones."""
+
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and float(params[2:] or 0) == 0:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoder(accept_encoding):
+    try:
+        accepted = accepted_encodings(accept_encoding)
+    except ValueError:
+        return None
+    if brotli is not None and "br" in accepted:
+        return BrotliEncoder
+    if "gzip" in accepted or "*" in accepted:
+        return GzipEncoder
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Responses still go through the responder when the client accepts no
+        # encoding we have, so they carry the same Vary header.
+        encoder = choose_encoder(Headers(scope=scope).get("accept-encoding", ""))
+        await CompressionResponder(self.app, self.minimum_size, encoder)(scope, receive, send)
+
+
+class CompressionResponder:
+    """
+    Compresses one response. A response that is already encoded or not text
+    is passed through as soon as its headers are seen. Otherwise the body is
+    held back until it reaches `minimum_size`, and only compressed if it
+    does: a body can arrive in any number of chunks (BaseHTTPMiddleware sends
+    every response as a stream), so the first one says little about its size.
+    """
+
+    def __init__(self, app, minimum_size, encoder):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoder = encoder
+        self.start = None
+        self.buffered = []
+        self.buffered_size = 0
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def compressible(self):
+        headers = Headers(raw=self.start["headers"])
+        if "content-encoding" in headers or self.start["status"] in (204, 304):
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            if not self.compressible():
+                self.passthrough = True
+                await self.send(message)
+                return
+            # Whether or not this one is compressed, the same URL may be for
+            # another client or a larger body.
+            MutableHeaders(raw=self.start["headers"]).add_vary_header("Accept-Encoding")
+            if self.encoder is None:
+                self.passthrough = True
+                await self.send(message)
+            # Otherwise held back until the body shows whether to compress.
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            self.buffered.append(body)
+            self.buffered_size += len(body)
+            if self.buffered_size < self.minimum_size:
+                if more_body:
+                    return
+                # The whole body, and it's small: send it as it was.
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": b"".join(self.buffered), "more_body": False})
+                return
+
+            self.compressor = self.encoder()
+            headers = MutableHeaders(raw=self.start["headers"])
+            headers["Content-Encoding"] = self.compressor.name
+            # The compressed bytes differ from the ones a strong ETag vouches
+            # for; they're still semantically the same, so it's made weak.
+            # (src/api/http_cache.py's ETags are weak to begin with.)
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            if "content-length" in headers:
+                del headers["Content-Length"]
+
+            body = self.compressor.compress(b"".join(self.buffered), finish=not more_body)
+            self.buffered = None
+            if not more_body:
+                headers["Content-Length"] = str(len(body))
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        await self.send(
+            {
+                "type": "http.response.body",
+                "body": self.compressor.compress(body, finish=not more_body),
+                "more_body": more_body,
+            }
+        )
@@ -1,14 +1,154 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from src import cache
 from src import database as db
-from pydantic import BaseModel
-from typing import List
+from src import graph
+from src import memory
+from src import aggregates
+from src.api import batch, export, filters
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
 from datetime import datetime
+from itertools import groupby
+import json
 import sqlalchemy as s
+from sqlalchemy.dialects.postgresql import ARRAY
 
 router = APIRouter()
 
+# Registered before /conversations/{conversation_id}, which would otherwise
+# match it.
+@router.get("/conversations/export", tags=["conversations"])
+async def export_conversations(
+    movie_id: Optional[int] = None,
+    name: str = "",
+    format: export.export_format = export.export_format.ndjson,
+):
+    """
+    This endpoint streams every conversation, ordered by id. As NDJSON (the
+    default `format`) each conversation is one JSON object in the same form
+    `/conversations/{conversation_id}` returns it:
+    * `conversation_id`: the internal id of the conversation.
+    * `movie`: The movie the conversation is from.
+    * `lines`: The lines of the conversation in the order they are said, each
+      with its `line_id`, `character` and `text`.
+
+    As CSV there is one row per line instead, with the columns
+    `conversation_id`, `movie`, `line_id`, `character` and `text`.
+
+    The `movie_id` query parameter only exports the conversations of one
+    movie, and `name` only those involving a character whose name contains it.
+    """
+
+    if db.backend == "memory":
+        rows = export.batched(memory.dataset().export_conversations(movie_id, name))
+    else:
+        character1 = db.characters.alias('character1')
+        character2 = db.characters.alias('character2')
+
+        stmt = (
+            s.select(
+                db.conversations.c.conversation_id,
+                db.movies.c.title,
+                db.lines.c.line_id,
+                db.characters.c.name,
+                db.lines.c.line_text,
+            )
+            .select_from(
+                db.conversations
+                .join(db.movies, db.conversations.c.movie_id == db.movies.c.movie_id)
+                .outerjoin(
+                    db.lines.join(db.characters, db.lines.c.character_id == db.characters.c.character_id),
+                    db.lines.c.conversation_id == db.conversations.c.conversation_id,
+                )
+            )
+            .order_by(db.conversations.c.conversation_id, db.lines.c.line_sort)
+        )
+
+        if movie_id is not None:
+            stmt = stmt.where(db.conversations.c.movie_id == movie_id)
+
+        if name != "":
+            stmt = stmt.where(
+                s.or_(
+                    s.exists().where(character1.c.character_id == db.conversations.c.character1_id).where(filters.contains(character1.c.name, name)),
+                    s.exists().where(character2.c.character_id == db.conversations.c.character2_id).where(filters.contains(character2.c.name, name)),
+                )
+            )
+
+        rows = export.stream_rows(stmt)
+
+    if format is export.export_format.csv:
+        async def records():
+            try:
+                async for batch in rows:
+                    yield [
+                        {
+                            'conversation_id': row.conversation_id,
+                            'movie': row.title,
+                            'line_id': row.line_id,
+                            'character': row.name,
+                            'text': row.line_text,
+                        }
+                        for row in batch
+                        if row.line_id is not None
+                    ]
+            finally:
+                await rows.aclose()
+
+        return export.response(records(), format, ['conversation_id', 'movie', 'line_id', 'character', 'text'], 'conversations')
+
+    async def records():
+        # Rows arrive ordered by conversation, so each conversation is sent as
+        # soon as the first row of the next one is seen.
+        conversation = None
+        try:
+            async for batch in rows:
+                complete = []
+                for row in batch:
+                    if conversation is None or conversation['conversation_id'] != row.conversation_id:
+                        if conversation is not None:
+                            complete.append(conversation)
+                        conversation = {
+                            'conversation_id': row.conversation_id,
+                            'movie': row.title,
+                            'lines': [],
+                        }
+                    if row.line_id is not None:
+                        conversation['lines'].append(
+                            {
+                                'line_id': row.line_id,
+                                'character': row.name,
+                                'text': row.line_text,
+                            }
+                        )
+                # A batch inside one long conversation completes none.
+                if complete:
+                    yield complete
+        finally:
+            await rows.aclose()
+        if conversation is not None:
+            yield [conversation]
+
+    return export.response(records(), format, [], 'conversations')
+
+
+def conversation_json(conversation, lines):
+    return {
+        'conversation_id': conversation.conversation_id,
+        'movie': conversation.title,
+        'lines': [
+            {
+                'line_id': line.line_id,
+                'character': line.name,
+                'text': line.line_text
+            }
+            for line in lines
+        ]
+    }
+
+
 @router.get("/conversations/{conversation_id}", tags=["conversations"])
-def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: int):
     """
     This endpoint returns a conversation by its identifier. For each conversation
     it returns:
@@ -24,54 +164,53 @@ def get_conversation(conversation_id: str):
     * `text`: The content of the line
     """
 
-    stmt = (
-        s.select(
-            db.conversations.c.conversation_id,
-            db.movies.c.title
+    key = await cache.key('conversation', conversation_id, scope=None)
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    if db.backend == "memory":
+        conversation = memory.dataset().conversation(conversation_id)
+    else:
+        stmt = (
+            s.select(
+                db.conversations.c.conversation_id,
+                db.movies.c.title
+            )
+            .select_from(db.conversations.join(db.movies, db.conversations.c.movie_id == db.movies.c.movie_id))
+            .where(db.conversations.c.conversation_id == conversation_id)
         )
-        .select_from(db.conversations.join(db.movies, db.conversations.c.movie_id == db.movies.c.movie_id))
-        .where(db.conversations.c.conversation_id == conversation_id)
-    )
 
-    with db.engine.connect() as conn:
-        conversations_result = conn.execute(stmt)
+        async with db.async_engine.connect() as conn:
+            conversations_result = await conn.execute(stmt)
 
-    conversation = conversations_result.first()
+        conversation = conversations_result.first()
 
     if conversation is None:
          raise HTTPException(status_code=404, detail="conversation not found.")
 
-    stmt = (
-        s.select(
-            db.lines.c.line_id,
-            db.characters.c.name,
-            db.lines.c.line_text,
-            db.lines.c.line_sort
+    if db.backend == "memory":
+        lines_result = memory.dataset().lines_of(conversation_id)
+    else:
+        stmt = (
+            s.select(
+                db.lines.c.line_id,
+                db.characters.c.name,
+                db.lines.c.line_text,
+                db.lines.c.line_sort
+            )
+            .where(db.lines.c.conversation_id == conversation_id)
+            .join(db.characters, db.lines.c.character_id == db.characters.c.character_id)
+            .order_by('line_sort')
         )
-        .where(db.lines.c.conversation_id == conversation_id)
-        .join(db.characters, db.lines.c.character_id == db.characters.c.character_id)
-        .order_by('line_sort')
-    )
 
-    with db.engine.connect() as conn:
-        lines_result = conn.execute(stmt)
+        async with db.async_engine.connect() as conn:
+            lines_result = await conn.execute(stmt)
 
-    lines = []
+    result = conversation_json(conversation, lines_result)
 
-    for line in lines_result:
-        lines.append(
-            {
-                'line_id': line.line_id,
-                'character': line.name,
-                'text': line.line_text
-            }
-        )
-
-    return {
-        'conversation_id': conversation.conversation_id,
-        'movie': conversation.title,
-        'lines': lines
-    }
+    await cache.put(key, result)
+    return result
 
     # conversation = db.conversations.get(conversation_id)
     # if conversation is None:
@@ -95,6 +234,62 @@ def get_conversation(conversation_id: str):
     #     'lines': lines
     # }
 
+
+@router.post("/conversations/batch", tags=["conversations"])
+async def get_conversations_batch(body: batch.BatchJson):
+    """
+    This endpoint looks up many conversations at once. The request body is
+    `{"ids": [...]}` with at most 1000 conversation ids. It returns a list
+    with one entry per id, in the same order: the conversation, as
+    `/conversations/{conversation_id}` returns it, or
+    `{"status_code": 404, "detail": "conversation not found."}`.
+    """
+
+    async def fetch(ids):
+        if db.backend == "memory":
+            dataset = memory.dataset()
+            return {
+                conversation.conversation_id: conversation_json(conversation, dataset.lines_of(conversation.conversation_id))
+                for conversation in map(dataset.conversation, ids)
+                if conversation is not None
+            }
+
+        # One row per line, or a single row with null line columns for a
+        # conversation without any, as in the export.
+        stmt = (
+            s.select(
+                db.conversations.c.conversation_id,
+                db.movies.c.title,
+                db.lines.c.line_id,
+                db.characters.c.name,
+                db.lines.c.line_text,
+            )
+            .select_from(
+                db.conversations
+                .join(db.movies, db.conversations.c.movie_id == db.movies.c.movie_id)
+                .outerjoin(
+                    db.lines.join(db.characters, db.lines.c.character_id == db.characters.c.character_id),
+                    db.lines.c.conversation_id == db.conversations.c.conversation_id,
+                )
+            )
+            .where(batch.any_id(db.conversations.c.conversation_id, ids))
+            .order_by(db.conversations.c.conversation_id, db.lines.c.line_sort)
+        )
+
+        async with db.async_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+
+        results = {}
+        for _, group in groupby(rows, key=lambda row: row.conversation_id):
+            lines = list(group)
+            results[lines[0].conversation_id] = conversation_json(lines[0], [line for line in lines if line.line_id is not None])
+        return results
+
+    return await batch.lookup(
+        body.ids, lambda id: cache.key('conversation', id, scope=None), fetch, "conversation not found."
+    )
+
+
 # FastAPI is inferring what the request body should look like
 # based on the following two classes.
 class LinesJson(BaseModel):
@@ -107,8 +302,28 @@ class ConversationJson(BaseModel):
     character_2_id: int
     lines: List[LinesJson]
 
+
+def check_conversation(movie_id, conversation, character_movies):
+    """
+    Raises an HTTPException if `conversation` can't be added to `movie_id`.
+    `character_movies` maps the id of each character that exists to its movie.
+    """
+
+    if conversation.character_1_id not in character_movies or conversation.character_2_id not in character_movies:
+        raise HTTPException(status_code=404, detail="character not found.")
+    if conversation.character_1_id == conversation.character_2_id:
+        raise HTTPException(status_code=422, detail="can't have a character talk to themself!")
+    if character_movies[conversation.character_1_id] != movie_id or character_movies[conversation.character_2_id] != movie_id:
+        raise HTTPException(status_code=422, detail="movie_id given does not include one or both characters.")
+    if len(conversation.lines) == 0:
+        raise HTTPException(status_code=422, detail="can't add an empty conversation!")
+
+    for line in conversation.lines:
+        if line.character_id != conversation.character_1_id and line.character_id != conversation.character_2_id:
+            raise HTTPException(status_code=422, detail="conversation/line character_id mismatch.")
+
 @router.post("/movies/{movie_id}/conversations/", tags=["movies"])
-def add_conversation(movie_id: int, conversation: ConversationJson):
+async def add_conversation(movie_id: int, conversation: ConversationJson):
     """
     This endpoint adds a conversation to a movie. The conversation is represented
     by the two characters involved in the conversation and a series of lines between
@@ -124,96 +339,83 @@ def add_conversation(movie_id: int, conversation: ConversationJson):
     The endpoint returns the id of the resulting conversation that was created.
     """
 
-    # The problem with this implementation is that there would be data lost if
-    # two writes were to happen at the same time. The most recent call would go through,
-    # but the earlier call would be overwritten as the later character_id would be computed
-    # before the earlier call was written to the database. In fact, this would have all
-    # sorts of funky implications, like how that would mean that character line counts
-    # would become desynced in this implementation. Of course, unless our api
-    # is handling a bunch of api calls per second the probability of this happening
-    # is likely pretty negligible. And besides, the "happy path" nature of this assignment
-    # means the input validation is very sub-par, which I feel is a more pressing issue...
-
-    stmt = (
-        s.select(
-            db.characters.c.character_id,
-            db.movies.c.movie_id
+    if db.backend == "memory":
+        dataset = memory.dataset()
+        check_conversation(
+            movie_id,
+            conversation,
+            dataset.character_movie_ids([conversation.character_1_id, conversation.character_2_id]),
         )
-        .select_from(db.characters.join(db.movies, db.characters.c.movie_id == db.movies.c.movie_id))
-        .where(db.characters.c.character_id == conversation.character_1_id)
-    )
-
-    with db.engine.connect() as conn:
-        characters_result = conn.execute(stmt)
-
-    character1 = characters_result.first()
-
-    stmt = (
-        s.select(
-            db.characters.c.character_id,
-            db.movies.c.movie_id
+        conversation_id, = dataset.add_conversations(
+            movie_id,
+            [
+                (
+                    conversation.character_1_id,
+                    conversation.character_2_id,
+                    [(line.character_id, line.line_text) for line in conversation.lines],
+                )
+            ],
+        )
+    else:
+        # Conversation and line ids come from sequences (see
+        # migrations/004_id_sequences.sql) rather than max(id) + 1, so concurrent
+        # writes can't be handed the same ids. Everything, including the aggregate
+        # updates, happens in one transaction on one connection.
+        stmt = (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.movie_id
+            )
+            .where(db.characters.c.character_id.in_([conversation.character_1_id, conversation.character_2_id]))
         )
-        .select_from(db.characters.join(db.movies, db.characters.c.movie_id == db.movies.c.movie_id))
-        .where(db.characters.c.character_id == conversation.character_2_id)
-    )
-
-    with db.engine.connect() as conn:
-        characters_result = conn.execute(stmt)
-
-    character2 = characters_result.first()
-
-    if character1 is None or character2 is None:
-        raise HTTPException(status_code=404, detail="character not found.")
-    if character1.character_id == character2.character_id:
-        raise HTTPException(status_code=422, detail="can't have a character talk to themself!")
-    if character1.movie_id != movie_id or character2.movie_id != movie_id:
-        raise HTTPException(status_code=422, detail="movie_id given does not include one or both characters.")
-    if character1.movie_id != character2.movie_id:
-        raise HTTPException(status_code=422, detail="characters given come from different movies.")
-    if len(conversation.lines) == 0:
-        raise HTTPException(status_code=422, detail="can't add an empty conversation!")
-
-    for line in conversation.lines:
-        if line.character_id != character1.character_id and line.character_id != character2.character_id:
-            raise HTTPException(status_code=422, detail="conversation/line character_id mismatch.")
-
-    stmt = (s.select(db.conversations.c.conversation_id).order_by(s.desc('conversation_id')))
-
-    with db.engine.connect() as conn:
-        conversations_result = conn.execute(stmt)
-
-    conversation_id = conversations_result.first().conversation_id + 1
-
-    stmt = (s.select(db.lines.c.line_id).order_by(s.desc('line_id')))
 
-    with db.engine.connect() as conn:
-        lines_result = conn.execute(stmt)
+        async with db.async_engine.begin() as conn:
+            character_movies = {row.character_id: row.movie_id for row in await conn.execute(stmt)}
 
-    line_id = lines_result.first().line_id + 1
+            check_conversation(movie_id, conversation, character_movies)
 
-    with db.engine.begin() as conn:
-        conn.execute(
-            db.conversations.insert().values(
-                conversation_id=conversation_id,
-                character1_id=conversation.character_1_id,
-                character2_id=conversation.character_2_id,
-                movie_id=movie_id,
-            )
-        )
-        sort = 1
-        for line in conversation.lines:
-            conn.execute(
-                db.lines.insert().values(
-                    line_id=line_id,
-                    character_id=line.character_id,
-                    movie_id=movie_id,
-                    conversation_id=conversation_id,
-                    line_sort=sort,
-                    line_text=line.line_text
+            conversation_id = (
+                await conn.execute(
+                    db.conversations.insert()
+                    .values(
+                        character1_id=conversation.character_1_id,
+                        character2_id=conversation.character_2_id,
+                        movie_id=movie_id,
+                    )
+                    .returning(db.conversations.c.conversation_id)
+                )
+            ).scalar_one()
+
+            # A single multi-row INSERT for all of the lines.
+            await conn.execute(
+                db.lines.insert()
+                .values(
+                    [
+                        {
+                            'character_id': line.character_id,
+                            'movie_id': movie_id,
+                            'conversation_id': conversation_id,
+                            'line_sort': sort,
+                            'line_text': line.line_text,
+                        }
+                        for sort, line in enumerate(conversation.lines, start=1)
+                    ]
                 )
             )
-            line_id += 1
-            sort += 1
+
+            await aggregates.record_conversation(
+                conn,
+                movie_id,
+                conversation.character_1_id,
+                conversation.character_2_id,
+                [line.character_id for line in conversation.lines],
+            )
+
+    await cache.invalidate_conversation(movie_id, [conversation.character_1_id, conversation.character_2_id])
+    await graph.interactions.record_conversations(
+        movie_id,
+        [(conversation.character_1_id, conversation.character_2_id, len(conversation.lines))],
+    )
 
     return {
         'conversation_id': conversation_id
@@ -277,3 +479,212 @@ def add_conversation(movie_id: int, conversation: ConversationJson):
     # return {
     #     'conversation_id': conversation_id
     # }
+
+
+MAX_BULK_CONVERSATIONS = 10000
+
+# Rows per multi-row INSERT. asyncpg allows at most 32767 bind parameters per
+# statement, and a line takes five.
+ROWS_PER_INSERT = 1000
+
+
+async def read_bulk_items(request: Request):
+    """
+    Returns the items of a bulk request body. A JSON array is parsed whole; an
+    NDJSON body (`application/x-ndjson`) is parsed line by line as it streams
+    in, and a line that isn't valid JSON becomes an HTTPException in its slot
+    so it can be reported alongside the other per-item errors.
+    """
+
+    content_type = request.headers.get("content-type", "")
+
+    if "ndjson" not in content_type and "jsonl" not in content_type:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="request body must be a JSON array or NDJSON.")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="request body must be a JSON array or NDJSON.")
+        if len(items) > MAX_BULK_CONVERSATIONS:
+            raise HTTPException(status_code=413, detail=f"at most {MAX_BULK_CONVERSATIONS} conversations per request.")
+        return items
+
+    items = []
+    buffer = b""
+
+    def parse(line):
+        if line.strip() == b"":
+            return
+        if len(items) == MAX_BULK_CONVERSATIONS:
+            raise HTTPException(status_code=413, detail=f"at most {MAX_BULK_CONVERSATIONS} conversations per request.")
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(HTTPException(status_code=400, detail="invalid JSON."))
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            parse(line)
+    parse(buffer)
+
+    return items
+
+
+def check_conversations(movie_id, conversations, character_movies):
+    """
+    Checks a bulk request's conversations, each a ConversationJson or the
+    HTTPException it failed to parse with. Returns the results list, with the
+    error of each conversation that can't be added filled in, and the
+    `(index, conversation)` pairs of the ones that can.
+    """
+
+    # Each result starts as the item's error, if it has one, and is filled
+    # in with its conversation id once it's been inserted.
+    results = [None] * len(conversations)
+    valid = []
+    for index, conversation in enumerate(conversations):
+        if isinstance(conversation, ConversationJson):
+            try:
+                check_conversation(movie_id, conversation, character_movies)
+            except HTTPException as e:
+                conversation = e
+            else:
+                valid.append((index, conversation))
+                continue
+        results[index] = {'status_code': conversation.status_code, 'detail': conversation.detail}
+
+    return results, valid
+
+
+@router.post("/movies/{movie_id}/conversations/bulk", tags=["movies"])
+async def add_conversations(movie_id: int, request: Request):
+    """
+    This endpoint adds many conversations to a movie at once. The request body
+    is either a JSON array of conversations or NDJSON (one conversation per line,
+    sent as `application/x-ndjson`), each in the same format that
+    `/movies/{movie_id}/conversations/` accepts. At most 10000 conversations can
+    be sent per request.
+
+    Each conversation is checked the same way as when adding a single one.
+    Conversations that pass are all added; ones that don't are skipped and
+    reported. The endpoint returns:
+    * `created`: The number of conversations added.
+    * `failed`: The number of conversations skipped.
+    * `results`: One entry per conversation in the request, in order: either
+      `{"conversation_id": ...}` or `{"status_code": ..., "detail": ...}`
+      explaining why it was skipped.
+    """
+
+    items = await read_bulk_items(request)
+
+    conversations = []
+    for item in items:
+        if isinstance(item, HTTPException):
+            conversations.append(item)
+            continue
+        try:
+            conversations.append(ConversationJson.parse_obj(item))
+        except ValidationError as e:
+            conversations.append(HTTPException(status_code=422, detail=e.errors()))
+
+    character_ids = {
+        character_id
+        for conversation in conversations
+        if isinstance(conversation, ConversationJson)
+        for character_id in (conversation.character_1_id, conversation.character_2_id)
+    }
+
+    if db.backend == "memory":
+        dataset = memory.dataset()
+        results, valid = check_conversations(movie_id, conversations, dataset.character_movie_ids(character_ids))
+        conversation_ids = dataset.add_conversations(
+            movie_id,
+            [
+                (
+                    conversation.character_1_id,
+                    conversation.character_2_id,
+                    [(line.character_id, line.line_text) for line in conversation.lines],
+                )
+                for index, conversation in valid
+            ],
+        )
+    else:
+        stmt = (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.movie_id
+            )
+            .where(db.characters.c.character_id == s.any_(s.literal(sorted(character_ids), ARRAY(s.Integer))))
+        )
+
+        async with db.async_engine.begin() as conn:
+            character_movies = {row.character_id: row.movie_id for row in await conn.execute(stmt)}
+
+            results, valid = check_conversations(movie_id, conversations, character_movies)
+
+            conversation_ids = []
+            if valid:
+                conversation_ids = (
+                    await conn.execute(
+                        s.select(s.func.nextval(s.func.pg_get_serial_sequence('conversations', 'conversation_id')))
+                        .select_from(s.func.generate_series(1, len(valid)))
+                    )
+                ).scalars().all()
+
+            conversation_rows = [
+                {
+                    'conversation_id': conversation_id,
+                    'character1_id': conversation.character_1_id,
+                    'character2_id': conversation.character_2_id,
+                    'movie_id': movie_id,
+                }
+                for conversation_id, (index, conversation) in zip(conversation_ids, valid)
+            ]
+            line_rows = [
+                {
+                    'character_id': line.character_id,
+                    'movie_id': movie_id,
+                    'conversation_id': conversation_id,
+                    'line_sort': sort,
+                    'line_text': line.line_text,
+                }
+                for conversation_id, (index, conversation) in zip(conversation_ids, valid)
+                for sort, line in enumerate(conversation.lines, start=1)
+            ]
+
+            for start in range(0, len(conversation_rows), ROWS_PER_INSERT):
+                await conn.execute(db.conversations.insert().values(conversation_rows[start:start + ROWS_PER_INSERT]))
+            for start in range(0, len(line_rows), ROWS_PER_INSERT):
+                await conn.execute(db.lines.insert().values(line_rows[start:start + ROWS_PER_INSERT]))
+
+            await aggregates.record_conversations(
+                conn,
+                movie_id,
+                [
+                    (conversation.character_1_id, conversation.character_2_id, [line.character_id for line in conversation.lines])
+                    for index, conversation in valid
+                ],
+            )
+
+    await cache.invalidate_conversation(
+        movie_id,
+        {character_id for index, conversation in valid for character_id in (conversation.character_1_id, conversation.character_2_id)},
+    )
+    await graph.interactions.record_conversations(
+        movie_id,
+        [
+            (conversation.character_1_id, conversation.character_2_id, len(conversation.lines))
+            for index, conversation in valid
+        ],
+    )
+
+    for conversation_id, (index, conversation) in zip(conversation_ids, valid):
+        results[index] = {'conversation_id': conversation_id}
+
+    return {
+        'created': len(valid),
+        'failed': len(conversations) - len(valid),
+        'results': results,
+    }
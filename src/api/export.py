@@ -0,0 +1,108 @@
+from fastapi.responses import StreamingResponse
+from enum import Enum
+from src import database as db
+import asyncio
+import csv
+import io
+import json
+import os
+
+# Bulk export. Rows are read through a server-side cursor in batches of
+# EXPORT_BATCH_SIZE and each batch is encoded and sent before the next is
+# fetched, so memory use doesn't grow with the size of the export. If the
+# client goes away mid-export, the response closes the chain of generators
+# feeding it, which closes the cursor and returns the connection to the pool
+# rather than leaving them until the generators are garbage collected.
+
+BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+
+class export_format(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    export_format.ndjson: "application/x-ndjson",
+    export_format.csv: "text/csv",
+}
+
+
+async def stream_rows(stmt):
+    """Yields the rows of `stmt` in batches, from a server-side cursor."""
+
+    async with db.async_engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=BATCH_SIZE))
+        try:
+            async for rows in result.partitions():
+                yield rows
+        finally:
+            await result.close()
+
+
+async def batched(rows):
+    """Yields an iterable of in-memory rows in batches, letting other requests run in between."""
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+            await asyncio.sleep(0)
+    if batch:
+        yield batch
+
+
+async def encode(records, format, columns):
+    try:
+        if format is export_format.csv:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            async for batch in records:
+                if not batch:
+                    continue
+                for record in batch:
+                    writer.writerow([record[column] for column in columns])
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell() > 0:
+                # Only the header is left: nothing matched.
+                yield buffer.getvalue().encode("utf-8")
+            return
+
+        async for batch in records:
+            if batch:
+                yield "".join(json.dumps(record) + "\n" for record in batch).encode("utf-8")
+    finally:
+        await records.aclose()
+
+
+class ExportResponse(StreamingResponse):
+    """
+    A StreamingResponse that closes its body when it's done with it, including
+    when the client disconnects or sending fails part way through, which
+    StreamingResponse leaves to the garbage collector.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+def response(records, format, columns, filename):
+    """
+    Streams `records`, an async generator of lists of dicts, as NDJSON (one
+    record per line) or CSV (with `columns` as the header). `records` is
+    closed when the response ends, and should close whatever it reads from.
+    """
+
+    return ExportResponse(
+        encode(records, format, columns),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format.value}"'},
+    )
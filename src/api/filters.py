@@ -0,0 +1,10 @@
+def contains(column, value):
+    """
+    Case-insensitive "column contains value" filter. The pattern is escaped so
+    `%` and `_` in the query are matched literally, and it's written as a plain
+    ILIKE so Postgres can answer it from the pg_trgm indexes created in
+    migrations/003_name_search.sql.
+    """
+
+    escaped = value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return column.ilike(f"%{escaped}%", escape="!")
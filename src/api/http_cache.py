@@ -0,0 +1,114 @@
+from fastapi import Request, Response
+from starlette.routing import Match
+from src import cache
+import hashlib
+import os
+
+# Conditional GET support. A GET response's ETag is derived from the request
+# and the cache version of the data behind it (see src/cache.py), not from the
+# response body, so a matching If-None-Match is answered with a 304 before the
+# endpoint, and its SQL, ever runs. Adding conversations bumps those versions,
+# which changes the ETags of everything it affects.
+#
+# The ETags are weak: they vouch for the data, not the bytes, which differ
+# between encodings (see src/api/compression.py) and JSON serializations. That
+# keeps the ETag of a 304 the same as the 200 it revalidates.
+#
+# The versions are only seen by every worker with the shared (Redis) cache
+# backend. With the in-memory backend, run a single worker.
+
+# The version scope each route's data belongs to. None means no write can
+# change it. Routes not listed here don't get ETags.
+ROUTE_SCOPES = {
+    "/movies/{movie_id}": lambda params: f"movie:{int(params['movie_id'])}",
+    "/characters/{id}": lambda params: f"character:{int(params['id'])}",
+    "/characters/{id}/partners": lambda params: f"character:{int(params['id'])}",
+    "/movies/{movie_id}/graph": lambda params: f"movie:{int(params['movie_id'])}",
+    "/movies/{movie_id}/stats": lambda params: f"movie:{int(params['movie_id'])}",
+    "/stats": lambda params: "corpus",
+    "/lines/{line_id}": lambda params: None,
+    "/conversations/{conversation_id}": lambda params: None,
+    "/movies/": lambda params: None,
+    "/characters/": lambda params: "corpus",
+    "/lines/": lambda params: "corpus",
+}
+
+# Deploying new code can change responses without changing any data.
+RELEASE = os.environ.get("VERCEL_GIT_COMMIT_SHA", "")
+
+# CDN friendly defaults. Versioned data may change with any write, so browsers
+# always revalidate (cheap, thanks to the 304s) and shared caches only hold it
+# briefly. Unversioned data only changes with a deploy.
+VERSIONED_CACHE_CONTROL = os.environ.get(
+    "HTTP_CACHE_CONTROL", "public, max-age=0, s-maxage=10, stale-while-revalidate=30"
+)
+STATIC_CACHE_CONTROL = os.environ.get(
+    "HTTP_CACHE_CONTROL_STATIC", "public, max-age=300, s-maxage=86400, stale-while-revalidate=86400"
+)
+
+
+def route_scope(request: Request):
+    """
+    Returns (True, scope) for a request to a route with ETags, otherwise
+    (False, None).
+    """
+
+    for route in request.app.router.routes:
+        match, child_scope = route.matches(request.scope)
+        if match is Match.FULL:
+            scope_for = ROUTE_SCOPES.get(route.path)
+            if scope_for is None:
+                return False, None
+            try:
+                return True, scope_for(child_scope.get("path_params", {}))
+            except ValueError:
+                # Not a valid id; let the endpoint produce its error.
+                return False, None
+    return False, None
+
+
+async def etag_for(request: Request, scope):
+    version = await cache.backend.version_token(scope) if scope is not None else "static"
+    digest = hashlib.sha1(
+        f"{RELEASE}|{request.url.path}?{request.url.query}|{version}".encode("utf-8")
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def opaque_tag(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match uses the weak comparison: the W/ prefixes are ignored."""
+
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        if opaque_tag(candidate.strip()) == opaque_tag(etag):
+            return True
+    return False
+
+
+async def conditional_get(request: Request, call_next):
+    if request.method not in ("GET", "HEAD"):
+        return await call_next(request)
+
+    has_etag, scope = route_scope(request)
+    if not has_etag:
+        return await call_next(request)
+
+    etag = await etag_for(request, scope)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": VERSIONED_CACHE_CONTROL if scope is not None else STATIC_CACHE_CONTROL,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
@@ -0,0 +1,76 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from src import cache
+from src import database as db
+from src import metrics
+import time
+
+router = APIRouter()
+
+# The HTTP side of src/metrics.py: the middleware that times each request and
+# the endpoint that exposes the results.
+
+
+def route_name(scope):
+    """
+    The path template of the route a request goes to, so requests for
+    different ids are recorded together.
+    """
+
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records each request's latency and the SQL it ran in metrics.registry, and
+    sends them back in a Server-Timing header. The header is written with the
+    response headers, so for a streamed response it only covers the time
+    before the first chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = metrics.RequestMetrics(route_name(scope))
+        token = metrics.current.set(request)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", request.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            metrics.current.reset(token)
+            metrics.registry.record_request(scope["method"], request.route, status, time.perf_counter() - start, request)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Request latency, queries and connection checkouts per request by route,
+    the slowest SQL statements, and the pool and cache status, in the
+    Prometheus text format.
+    """
+
+    return PlainTextResponse(
+        metrics.registry.render(pool=db.pool_status(), cache=cache.backend.stats()),
+        media_type="text/plain; version=0.0.4",
+    )
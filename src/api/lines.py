@@ -1,86 +1,156 @@
 from fastapi import APIRouter, HTTPException
 from enum import Enum
-from collections import Counter
-from fastapi.params import Query
+from src import cache
 from src import database as db
+from src import memory
+from src.api import batch, export, filters, pagination
 import sqlalchemy as s
+from sqlalchemy.dialects.postgresql import REGCONFIG
 
 router = APIRouter()
 
-@router.get("/lines/{line_id}", tags=["lines"])
-def get_lines(line_id: str):
+# Registered before /lines/{line_id}, which would otherwise match it.
+@router.get("/lines/export", tags=["lines"])
+async def export_lines(
+    text: str = "",
+    name: str = "",
+    format: export.export_format = export.export_format.ndjson,
+):
     """
-    This endpoint returns a single line by its identifier. For each line
+    This endpoint streams every line, ordered by id, as NDJSON (one JSON object
+    per line) or CSV depending on the `format` query parameter. For each line
     it returns:
-    * `line_id`: the internal id of the line. Can be used to query the
-      `/lines/{line_id}` endpoint.
-    * `conversation_id`: the internal id of the conversation the line is said
-      in. Can be used to query the `/convsersations/{coversation_id}` endpoint.
-    * `movie`: The movie the line is from.
+    * `line_id`: the internal id of the line.
+    * `conversation_id`: the internal id of the conversation the line is said in.
+    * `movie_title`: The movie the line is from.
     * `character`: The name of the character speaking.
-    * `recipient`: The name of the character being talked to.
     * `text`: The text of the line
+
+    The `text` and `name` query parameters filter the lines the same way as
+    for `/lines/`.
     """
 
-    stmt = (
-        s.select(
-            db.lines.c.line_id,
-            db.lines.c.conversation_id,
-            db.movies.c.title,
-            db.characters.c.character_id,
-            db.characters.c.name,
-            db.lines.c.line_text
+    if db.backend == "memory":
+        rows = export.batched(memory.dataset().export_lines(text, name))
+    else:
+        stmt = (
+            s.select(
+                db.lines.c.line_id,
+                db.lines.c.conversation_id,
+                db.movies.c.title,
+                db.characters.c.name,
+                db.lines.c.line_text,
+            )
+            .select_from(db.lines.join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id).join(db.characters, db.lines.c.character_id == db.characters.c.character_id))
+            .order_by(db.lines.c.line_id)
         )
-        .select_from(db.lines.join(db.characters, db.lines.c.character_id == db.characters.c.character_id).join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id))
-        .where(db.lines.c.line_id == line_id)
-    )
-    with db.engine.connect() as conn:
-        lines_result = conn.execute(stmt)
 
-    line = lines_result.first()
+        if name != "":
+            stmt = stmt.where(filters.contains(db.characters.c.name, name))
 
-    if line is None:
-         raise HTTPException(status_code=404, detail="line not found.")
+        if text != "":
+            stmt = stmt.where(filters.contains(db.lines.c.line_text, text))
+
+        rows = export.stream_rows(stmt)
+
+    async def records():
+        try:
+            async for batch in rows:
+                yield [
+                    {
+                        'line_id': row.line_id,
+                        'conversation_id': row.conversation_id,
+                        'movie_title': row.title,
+                        'character': row.name,
+                        'text': row.line_text
+                    }
+                    for row in batch
+                ]
+        finally:
+            await rows.aclose()
+
+    return export.response(records(), format, ['line_id', 'conversation_id', 'movie_title', 'character', 'text'], 'lines')
 
-    stmt = (
+
+def line_details():
+    """The query behind `/lines/{line_id}`, for any number of lines."""
+
+    # The recipient is whichever of the conversation's two characters isn't the
+    # speaker, so it can be joined in the same query.
+    recipient = db.characters.alias('recipient')
+    recipient_id = s.case(
+        (db.conversations.c.character1_id == db.lines.c.character_id, db.conversations.c.character2_id),
+        else_=db.conversations.c.character1_id,
+    )
+
+    return (
         s.select(
             db.lines.c.line_id,
-            db.conversations.c.character1_id,
-            db.conversations.c.character2_id,
-            db.characters.c.character_id,
-            db.characters.c.name
+            db.lines.c.conversation_id,
+            db.movies.c.title,
+            db.characters.c.name,
+            recipient.c.name.label('recipient'),
+            db.lines.c.line_text
         )
-        .where(db.lines.c.line_id == line_id)
-        .join(db.conversations, db.lines.c.conversation_id == db.conversations.c.conversation_id).join(db.characters, db.conversations.c.character1_id == db.characters.c.character_id)
-        .filter(db.conversations.c.character1_id != line.character_id)
-        .union(
-            s.select(
-                db.lines.c.line_id,
-                db.conversations.c.character1_id,
-                db.conversations.c.character2_id,
-                db.characters.c.character_id,
-                db.characters.c.name
-            )
-            .where(db.lines.c.line_id == line_id)
-            .join(db.conversations, db.lines.c.conversation_id == db.conversations.c.conversation_id).join(db.characters, db.conversations.c.character2_id == db.characters.c.character_id)
-            .filter(db.conversations.c.character2_id != line.character_id)
+        .select_from(
+            db.lines
+            .join(db.characters, db.lines.c.character_id == db.characters.c.character_id)
+            .join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id)
+            .outerjoin(db.conversations, db.lines.c.conversation_id == db.conversations.c.conversation_id)
+            .outerjoin(recipient, recipient.c.character_id == recipient_id)
         )
     )
 
-    with db.engine.connect() as conn:
-        receiving_result = conn.execute(stmt)
-
-    recipient = receiving_result.first()
 
+def line_json(line):
     return {
         'line_id': line.line_id,
         'conversation_id': line.conversation_id,
         'movie': line.title,
         'character': line.name,
-        'recipient': recipient.name,
+        'recipient': line.recipient,
         'text': line.line_text
     }
 
+
+@router.get("/lines/{line_id}", tags=["lines"])
+async def get_lines(line_id: int):
+    """
+    This endpoint returns a single line by its identifier. For each line
+    it returns:
+    * `line_id`: the internal id of the line. Can be used to query the
+      `/lines/{line_id}` endpoint.
+    * `conversation_id`: the internal id of the conversation the line is said
+      in. Can be used to query the `/convsersations/{coversation_id}` endpoint.
+    * `movie`: The movie the line is from.
+    * `character`: The name of the character speaking.
+    * `recipient`: The name of the character being talked to.
+    * `text`: The text of the line
+    """
+
+    key = await cache.key('line', line_id, scope=None)
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    if db.backend == "memory":
+        line = memory.dataset().line(line_id)
+    else:
+        stmt = line_details().where(db.lines.c.line_id == line_id)
+
+        async with db.async_engine.connect() as conn:
+            lines_result = await conn.execute(stmt)
+
+        line = lines_result.first()
+
+    if line is None:
+         raise HTTPException(status_code=404, detail="line not found.")
+
+    result = line_json(line)
+
+    await cache.put(key, result)
+    return result
+
     # line = db.lines.get(line_id)
     # if line is None:
     #     raise HTTPException(status_code=404, detail="line not found.")
@@ -99,18 +169,61 @@ def get_lines(line_id: str):
     #     'text': line['line_text']
     # }
 
+
+@router.post("/lines/batch", tags=["lines"])
+async def get_lines_batch(body: batch.BatchJson):
+    """
+    This endpoint looks up many lines at once. The request body is
+    `{"ids": [...]}` with at most 1000 line ids. It returns a list with one
+    entry per id, in the same order: the line, as `/lines/{line_id}` returns
+    it, or `{"status_code": 404, "detail": "line not found."}`.
+    """
+
+    async def fetch(ids):
+        if db.backend == "memory":
+            dataset = memory.dataset()
+            lines = [dataset.line(id) for id in ids]
+        else:
+            async with db.async_engine.connect() as conn:
+                lines = (await conn.execute(line_details().where(batch.any_id(db.lines.c.line_id, ids)))).all()
+        return {line.line_id: line_json(line) for line in lines if line is not None}
+
+    return await batch.lookup(body.ids, lambda id: cache.key('line', id, scope=None), fetch, "line not found.")
+
+
 class line_sort_options(str, Enum):
     character = "character"
     movie_title = "movie"
     conversation = "conversation"
+    relevance = "relevance"
+
+
+# The row attribute each sort option orders by: what a cursor records, and what
+# src/memory.py sorts on.
+SORT_KEYS = {
+    line_sort_options.character: "name",
+    line_sort_options.movie_title: "title",
+    line_sort_options.conversation: "conversation_id",
+    line_sort_options.relevance: "rank",
+}
+
+# The type of each sort key, which a cursor passed back in must match.
+SORT_TYPES = {
+    line_sort_options.character: str,
+    line_sort_options.movie_title: str,
+    line_sort_options.conversation: int,
+    line_sort_options.relevance: float,
+}
 
 @router.get("/lines/", tags=["lines"])
-def lines(
+async def lines(
     text: str = "",
     name: str = "",
+    search: str = "",
     limit: int = 50,
     offset: int = 0,
     sort: line_sort_options = line_sort_options.movie_title,
+    cursor: str = "",
 ):
     """
     This endpoint returns a list of lines. For each line it returns:
@@ -123,61 +236,108 @@ def lines(
     You can filter for the text of a line by using the `text` query
     parameter and/or the character speaking using the `name` query parameter
 
+    The `search` query parameter runs a full-text search over the text of the
+    lines instead. It matches words rather than substrings (so "run" also finds
+    "running") and accepts web search syntax: `"quoted phrases"`, `or`, and
+    `-excluded` words.
+
     You can also sort the results by using the `sort` query parameter:
     * `character` - Sort by character name alphabetically.
     * `movie` - Sort by movie title alphabetically.
     * `conversation` - Sort by conversation id numerically.
+    * `relevance` - Sort by how well the line matches `search`, best first.
+      Requires `search`.
 
     The `limit` and `offset` query
     parameters are used for pagination. The `limit` query parameter specifies the
     maximum number of results to return. The `offset` query parameter specifies the
     number of results to skip before returning results.
+
+    For deep pagination, pass the `X-Next-Cursor` response header back as the
+    `cursor` query parameter instead of increasing `offset`. A cursor continues
+    directly after the last row of the page that issued it (`offset` is ignored)
+    and is only valid with the same `sort`. The header is absent on the last page.
     """
 
-    if sort is line_sort_options.movie_title:
-        order_by = db.movies.c.title
-    elif sort is line_sort_options.conversation:
-        order_by = db.lines.c.conversation_id
-    elif sort is line_sort_options.character:
-        order_by = db.characters.c.name
-    else:
-        assert False
+    key = await cache.key('lines', text, name, search, limit, offset, sort.value, cursor, scope='corpus')
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        json, next_cursor = cached
+        return pagination.page_response(json, next_cursor)
 
-    stmt = (
-        s.select(
-            db.lines.c.line_id,
-            db.lines.c.conversation_id,
-            db.movies.c.title,
-            db.characters.c.name,
-            db.lines.c.line_text,
+    if sort is line_sort_options.relevance and search == "":
+        raise HTTPException(status_code=422, detail="sorting by relevance requires a search query.")
+
+    if db.backend == "memory":
+        rows = memory.dataset().lines(
+            text, name, search, limit, offset, SORT_KEYS[sort],
+            pagination.decode_cursor(cursor, sort.value, SORT_TYPES[sort]) if cursor != "" else None,
         )
-        .select_from(db.lines.join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id).join(db.characters, db.lines.c.character_id == db.characters.c.character_id))
-        .limit(limit)
-        .offset(offset)
-        .order_by(order_by, db.lines.c.line_id)
-    )
+    else:
+        search_query = s.func.websearch_to_tsquery(s.literal('english', REGCONFIG), search)
+
+        descending = False
+        if sort is line_sort_options.movie_title:
+            sort_column = db.movies.c.title
+        elif sort is line_sort_options.conversation:
+            sort_column = db.lines.c.conversation_id
+        elif sort is line_sort_options.character:
+            sort_column = db.characters.c.name
+        elif sort is line_sort_options.relevance:
+            sort_column = s.func.ts_rank_cd(db.lines.c.line_text_tsv, search_query)
+            descending = True
+        else:
+            assert False
 
-    if name != "":
-        stmt = stmt.where(db.characters.c.name.ilike(f"%{name}%"))
-
-    if text != "":
-        stmt = stmt.where(db.lines.c.line_text.ilike(f"%{text}%"))
-
-    with db.engine.connect() as conn:
-        result = conn.execute(stmt)
-        json = []
-        for row in result:
-            json.append(
-                {
-                    'line_id': row.line_id,
-                    'movie_title': row.title,
-                    'character': row.name,
-                    'text': row.line_text
-                }
+        order_by = s.desc(sort_column) if descending else sort_column
+
+        stmt = (
+            s.select(
+                db.lines.c.line_id,
+                db.lines.c.conversation_id,
+                db.movies.c.title,
+                db.characters.c.name,
+                db.lines.c.line_text,
             )
+            .select_from(db.lines.join(db.movies, db.lines.c.movie_id == db.movies.c.movie_id).join(db.characters, db.lines.c.character_id == db.characters.c.character_id))
+            .limit(limit)
+            .order_by(order_by, db.lines.c.line_id)
+        )
+
+        if sort is line_sort_options.relevance:
+            stmt = stmt.add_columns(sort_column.label('rank'))
+
+        if cursor != "":
+            stmt = stmt.where(pagination.after_cursor(cursor, sort.value, SORT_TYPES[sort], sort_column, db.lines.c.line_id, descending))
+        else:
+            stmt = stmt.offset(offset)
+
+        if name != "":
+            stmt = stmt.where(filters.contains(db.characters.c.name, name))
+
+        if text != "":
+            stmt = stmt.where(filters.contains(db.lines.c.line_text, text))
+
+        if search != "":
+            stmt = stmt.where(db.lines.c.line_text_tsv.op('@@')(search_query))
+
+        async with db.async_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+
+    json = []
+    for row in rows:
+        json.append(
+            {
+                'line_id': row.line_id,
+                'movie_title': row.title,
+                'character': row.name,
+                'text': row.line_text
+            }
+        )
 
-    print(json)
-    return json
+    next_cursor = pagination.next_cursor(rows, limit, sort.value, SORT_KEYS[sort], 'line_id')
+    await cache.put(key, [json, next_cursor])
+    return pagination.page_response(json, next_cursor)
 
     # lines = []
     #
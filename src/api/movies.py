@@ -1,12 +1,16 @@
 from fastapi import APIRouter, HTTPException
 from enum import Enum
+from src import cache
 from src import database as db
+from src import graph
+from src import memory
+from src.api import filters, pagination
 import sqlalchemy as s
 
 router = APIRouter()
 
 @router.get("/movies/{movie_id}", tags=["movies"])
-def get_movie(movie_id: str):
+async def get_movie(movie_id: int):
     """
     This endpoint returns a single movie by its identifier. For each movie it returns:
     * `movie_id`: the internal id of the movie.
@@ -22,36 +26,47 @@ def get_movie(movie_id: str):
 
     """
 
-    stmt = (
-        s.select(
-            db.movies.c.movie_id,
-            db.movies.c.title,
+    key = await cache.key('movie', movie_id, scope=f'movie:{movie_id}')
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    if db.backend == "memory":
+        movie = memory.dataset().movie(movie_id)
+    else:
+        stmt = (
+            s.select(
+                db.movies.c.movie_id,
+                db.movies.c.title,
+            )
+            .where(db.movies.c.movie_id == movie_id)
         )
-        .where(db.movies.c.movie_id == movie_id)
-    )
-    with db.engine.connect() as conn:
-        movies_result = conn.execute(stmt)
+        async with db.async_engine.connect() as conn:
+            movies_result = await conn.execute(stmt)
 
-    movie = movies_result.first()
+        movie = movies_result.first()
 
     if movie is None:
          raise HTTPException(status_code=404, detail="movie not found.")
 
-    stmt = (
-        s.select(
-            db.characters.c.character_id,
-            db.characters.c.name,
-            s.func.count(db.lines.c.line_id).label('line_count')
+    if db.backend == "memory":
+        characters_result = memory.dataset().top_characters(movie_id, 5)
+    else:
+        stmt = (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.name,
+                db.character_stats.c.line_count
+            )
+            .select_from(db.character_stats.join(db.characters, db.characters.c.character_id == db.character_stats.c.character_id))
+            .where(db.character_stats.c.movie_id == movie_id)
+            .where(db.character_stats.c.line_count > 0)
+            .order_by(s.desc(db.character_stats.c.line_count), db.character_stats.c.character_id)
+            .limit(5)
         )
-        .select_from(db.characters.join(db.lines, db.lines.c.character_id == db.characters.c.character_id).join(db.movies, db.movies.c.movie_id == db.characters.c.movie_id))
-        .where(db.movies.c.movie_id == movie_id)
-        .group_by(db.characters.c.character_id)
-        .order_by(s.desc('line_count'))
-        .limit(5)
-    )
 
-    with db.engine.connect() as conn:
-        characters_result = conn.execute(stmt)
+        async with db.async_engine.connect() as conn:
+            characters_result = await conn.execute(stmt)
 
     top_characters = []
 
@@ -64,12 +79,15 @@ def get_movie(movie_id: str):
             }
         )
 
-    return {
+    result = {
         'movie_id': movie.movie_id,
         'title': movie.title,
         'top_characters': top_characters
     }
 
+    await cache.put(key, result)
+    return result
+
     # movie = db.movies.get(movie_id)
     # if movie is None:
     #     raise HTTPException(status_code=404, detail="movie not found.")
@@ -102,19 +120,74 @@ def get_movie(movie_id: str):
     # }
 
 
+@router.get("/movies/{movie_id}/graph", tags=["movies"])
+async def get_movie_graph(movie_id: int):
+    """
+    This endpoint returns who talks to whom in a movie. It returns:
+    * `movie_id`: the internal id of the movie.
+    * `title`: The title of the movie.
+    * `characters`: Every character in the movie, each with its
+      `character_id`, `character` name and `gender`.
+    * `interactions`: One entry per pair of characters that talk to each
+      other, with `character_1_id`, `character_2_id` (the lower id first) and
+      `number_of_lines_together`, the number of lines in their conversations.
+    """
+
+    movie_graph = await graph.interactions.movie(movie_id)
+    if movie_graph.title is None:
+        raise HTTPException(status_code=404, detail="movie not found.")
+
+    return {
+        'movie_id': movie_id,
+        'title': movie_graph.title,
+        'characters': [
+            {
+                'character_id': character_id,
+                'character': name,
+                'gender': gender,
+            }
+            for character_id, (name, gender) in sorted(movie_graph.characters.items())
+        ],
+        'interactions': [
+            {
+                'character_1_id': character_id,
+                'character_2_id': partner_id,
+                'number_of_lines_together': line_count,
+            }
+            for character_id, partner_id, line_count in movie_graph.edges()
+        ],
+    }
+
+
 class movie_sort_options(str, Enum):
     movie_title = "movie_title"
     year = "year"
     rating = "rating"
 
 
+# The row attribute each sort option orders by: what a cursor records, and what
+# src/memory.py sorts on.
+SORT_KEYS = {
+    movie_sort_options.movie_title: "title",
+    movie_sort_options.year: "year",
+    movie_sort_options.rating: "imdb_rating",
+}
+
+# The type of each sort key, which a cursor passed back in must match.
+SORT_TYPES = {
+    movie_sort_options.movie_title: str,
+    movie_sort_options.year: str,
+    movie_sort_options.rating: float,
+}
+
 # Add get parameters
 @router.get("/movies/", tags=["movies"])
-def list_movies(
+async def list_movies(
     name: str = "",
     limit: int = 50,
     offset: int = 0,
     sort: movie_sort_options = movie_sort_options.movie_title,
+    cursor: str = "",
 ):
     """
     This endpoint returns a list of movies. For each movie it returns:
@@ -137,48 +210,76 @@ def list_movies(
     parameters are used for pagination. The `limit` query parameter specifies the
     maximum number of results to return. The `offset` query parameter specifies the
     number of results to skip before returning results.
+
+    For deep pagination, pass the `X-Next-Cursor` response header back as the
+    `cursor` query parameter instead of increasing `offset`. A cursor continues
+    directly after the last row of the page that issued it (`offset` is ignored)
+    and is only valid with the same `sort`. The header is absent on the last page.
     """
 
-    if sort is movie_sort_options.movie_title:
-        order_by = db.movies.c.title
-    elif sort is movie_sort_options.year:
-        order_by = db.movies.c.year
-    elif sort is movie_sort_options.rating:
-        order_by = s.desc(db.movies.c.imdb_rating)
-    else:
-        assert False
-
-    stmt = (
-        s.select(
-            db.movies.c.movie_id,
-            db.movies.c.title,
-            db.movies.c.year,
-            db.movies.c.imdb_rating,
-            db.movies.c.imdb_votes,
+    key = await cache.key('movies', name, limit, offset, sort.value, cursor, scope=None)
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        json, next_cursor = cached
+        return pagination.page_response(json, next_cursor)
+
+    if db.backend == "memory":
+        rows = memory.dataset().movies(
+            name, limit, offset, SORT_KEYS[sort],
+            pagination.decode_cursor(cursor, sort.value, SORT_TYPES[sort]) if cursor != "" else None,
         )
-        .limit(limit)
-        .offset(offset)
-        .order_by(order_by, db.movies.c.movie_id)
-    )
-
-    if name != "":
-        stmt = stmt.where(db.movies.c.title.ilike(f"%{name}%"))
-
-    with db.engine.connect() as conn:
-        result = conn.execute(stmt)
-        json = []
-        for row in result:
-            json.append(
-                {
-                    "movie_id": row.movie_id,
-                    "movie_title": row.title,
-                    "year": row.year,
-                    "imdb_rating": row.imdb_rating,
-                    "imdb_votes": row.imdb_votes,
-                }
+    else:
+        descending = False
+        if sort is movie_sort_options.movie_title:
+            sort_column = db.movies.c.title
+        elif sort is movie_sort_options.year:
+            sort_column = db.movies.c.year
+        elif sort is movie_sort_options.rating:
+            sort_column = db.movies.c.imdb_rating
+            descending = True
+        else:
+            assert False
+
+        order_by = s.desc(sort_column) if descending else sort_column
+
+        stmt = (
+            s.select(
+                db.movies.c.movie_id,
+                db.movies.c.title,
+                db.movies.c.year,
+                db.movies.c.imdb_rating,
+                db.movies.c.imdb_votes,
             )
+            .limit(limit)
+            .order_by(order_by, db.movies.c.movie_id)
+        )
+
+        if cursor != "":
+            stmt = stmt.where(pagination.after_cursor(cursor, sort.value, SORT_TYPES[sort], sort_column, db.movies.c.movie_id, descending))
+        else:
+            stmt = stmt.offset(offset)
+
+        if name != "":
+            stmt = stmt.where(filters.contains(db.movies.c.title, name))
+
+        async with db.async_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+
+    json = []
+    for row in rows:
+        json.append(
+            {
+                "movie_id": row.movie_id,
+                "movie_title": row.title,
+                "year": row.year,
+                "imdb_rating": row.imdb_rating,
+                "imdb_votes": row.imdb_votes,
+            }
+        )
 
-    return json
+    next_cursor = pagination.next_cursor(rows, limit, sort.value, SORT_KEYS[sort], 'movie_id')
+    await cache.put(key, [json, next_cursor])
+    return pagination.page_response(json, next_cursor)
 
     # movies = []
     #
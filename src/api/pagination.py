@@ -0,0 +1,114 @@
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from decimal import Decimal
+import base64
+import json
+import sqlalchemy as s
+
+# Keyset ("cursor") pagination for the listing endpoints. A cursor records the
+# sort option plus the (sort key, id) of the last row on a page, so the next
+# page can seek straight past it instead of making Postgres walk and discard
+# `offset` rows. Every listing response carries the cursor for its next page in
+# the X-Next-Cursor header; pass it back as the `cursor` query parameter.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# The range of a Postgres integer. Ids and integer sort keys outside it can't
+# have come from a row, and asyncpg refuses to send them.
+INTEGER_MIN, INTEGER_MAX = -2**31, 2**31 - 1
+
+
+def encode_cursor(sort, value, id):
+    if isinstance(value, Decimal):
+        value = float(value)
+    payload = json.dumps([sort, value, id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool) and INTEGER_MIN <= value <= INTEGER_MAX
+
+
+def cursor_value(value, value_type):
+    """
+    Returns `value` as a sort key of `value_type` (str, int or float), or
+    raises ValueError if it can't be one. Sort keys may be null.
+    """
+
+    if value is None:
+        return None
+    if value_type is str and isinstance(value, str):
+        return value
+    if value_type is int and is_integer(value):
+        return value
+    if value_type is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    raise ValueError(f"expected a {value_type.__name__} sort key")
+
+
+def decode_cursor(cursor, sort, value_type):
+    """
+    Returns the (sort key, id) recorded in `cursor`, checking that it was
+    issued for `sort` and that the sort key is a `value_type`.
+    """
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(payload, list) or len(payload) != 3:
+            raise ValueError("expected [sort, value, id]")
+        cursor_sort, value, id = payload
+        if not isinstance(cursor_sort, str) or not is_integer(id):
+            raise ValueError("expected [sort, value, id]")
+        value = cursor_value(value, value_type)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="invalid cursor.")
+
+    if cursor_sort != sort:
+        raise HTTPException(status_code=422, detail="cursor was issued for a different sort.")
+
+    return value, id
+
+
+def after_cursor(cursor, sort, value_type, sort_column, id_column, descending=False):
+    """
+    Returns the WHERE clause selecting the rows that come after `cursor` when
+    ordering by `sort_column` (ascending unless `descending`) then `id_column`.
+    """
+
+    value, id = decode_cursor(cursor, sort, value_type)
+
+    if descending:
+        return (sort_column < value) | ((sort_column == value) & (id_column > id))
+
+    return s.tuple_(sort_column, id_column) > s.tuple_(value, id)
+
+
+def next_cursor(rows, limit, sort, sort_key, id_key):
+    """
+    Returns the cursor for the page after `rows`, or None if this was the last
+    page.
+    """
+
+    if limit <= 0 or len(rows) < limit:
+        return None
+
+    last = rows[-1]
+    return encode_cursor(sort, getattr(last, sort_key), getattr(last, id_key))
+
+
+def set_next_cursor(response, cursor):
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def page_response(json, next_cursor):
+    """
+    Returns a page of a listing with the cursor for the next one. A page is
+    already plain JSON types, so it's encoded straight to bytes with orjson
+    rather than going through FastAPI's jsonable_encoder walk first.
+    """
+
+    response = ORJSONResponse(json)
+    set_next_cursor(response, next_cursor)
+    return response
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
+from src import cache
+from src import database as db
 import os
-import pkg_resources
 import sys
 
 router = APIRouter()
@@ -17,6 +18,25 @@ def calc_container(path):
     return total_size
 
 
+@router.get("/pool/")
+def get_pool():
+    """
+    Database connection pool status: connections checked out and idle, how
+    close the pool is to capacity (`saturation`), and how long requests have
+    waited to get a connection.
+    """
+    return db.pool_status()
+
+
+@router.get("/cache/")
+def get_cache():
+    """
+    Response cache status: which backend is in use, hits, misses and (for the
+    in-memory backend) entries held and evictions.
+    """
+    return cache.backend.stats()
+
+
 @router.get("/pyversion/")
 def version():
     return sys.version_info
@@ -24,6 +44,10 @@ def version():
 
 @router.get("/pkgsize/")
 def get_pkgsize():
+    # Imported here because pkg_resources is slow to import and this is the only
+    # user, so it shouldn't be paid on every cold start.
+    import pkg_resources
+
     dists = [d for d in pkg_resources.working_set]
 
     message = []
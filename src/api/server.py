@@ -1,5 +1,9 @@
 from fastapi import FastAPI
-from src.api import characters, movies, lines, conversations, pkg_util
+from fastapi.responses import ORJSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from src import database as db
+from src import memory
+from src.api import characters, movies, lines, conversations, pkg_util, http_cache, compression, stats, instrumentation
 
 description = """
 Movie API returns dialog statistics on top hollywood movies from decades past.
@@ -15,6 +19,7 @@ You can:
 You can:
 * **list movies with sorting and filtering options.**
 * **retrieve a specific movie by id**
+* **retrieve dialogue statistics for a movie, or for every movie**
 """
 tags_metadata = [
     {
@@ -40,12 +45,33 @@ app = FastAPI(
         "email": "ftucci@calpoly.edu",
     },
     openapi_tags=tags_metadata,
+    default_response_class=ORJSONResponse,
 )
 app.include_router(characters.router)
 app.include_router(movies.router)
 app.include_router(lines.router)
 app.include_router(pkg_util.router)
 app.include_router(conversations.router)
+app.include_router(stats.router)
+app.include_router(instrumentation.router)
+
+app.add_middleware(BaseHTTPMiddleware, dispatch=http_cache.conditional_get)
+
+# Outside the conditional GET handling, so 304s are timed too.
+if db.env_flag("METRICS", True):
+    app.add_middleware(instrumentation.MetricsMiddleware)
+
+# Added last so it's outermost and compresses everything the app sends.
+if db.env_flag("COMPRESSION", True):
+    app.add_middleware(compression.CompressionMiddleware)
+
+
+@app.on_event("startup")
+async def load_dataset():
+    # Load the in-memory backend's dataset before serving, rather than on the
+    # first request.
+    if db.backend == "memory":
+        memory.dataset()
 
 
 @app.get("/")
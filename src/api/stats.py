@@ -0,0 +1,250 @@
+from fastapi import APIRouter, HTTPException
+from src import cache
+from src import database as db
+from src import memory
+import sqlalchemy as s
+
+router = APIRouter()
+
+# Dialogue statistics, read from the aggregates maintained by src/aggregates.py
+# (movie_stats, character_stats and character_pair_stats): each response is a
+# handful of primary key or index range reads rather than GROUP BYs over lines.
+
+TOP_CHARACTERS = 10
+
+
+def lines_by_gender(stats):
+    return {
+        'male': stats.male_line_count,
+        'female': stats.female_line_count,
+        'unknown': stats.line_count - stats.male_line_count - stats.female_line_count,
+    }
+
+
+def average(total, count):
+    return round(total / count, 2) if count else 0
+
+
+def top_pair(movie_id=None):
+    """The pair of characters with the most lines together, lower id first."""
+
+    partner = db.characters.alias('partner')
+
+    stmt = (
+        s.select(
+            db.character_pair_stats.c.character_id,
+            db.characters.c.name,
+            db.character_pair_stats.c.partner_id,
+            partner.c.name.label('partner_name'),
+            db.movies.c.title,
+            db.character_pair_stats.c.line_count,
+        )
+        .select_from(
+            db.character_pair_stats
+            .join(db.characters, db.characters.c.character_id == db.character_pair_stats.c.character_id)
+            .join(partner, partner.c.character_id == db.character_pair_stats.c.partner_id)
+            .join(db.movies, db.movies.c.movie_id == db.character_pair_stats.c.movie_id)
+        )
+        # Each pair is stored in both directions.
+        .where(db.character_pair_stats.c.character_id < db.character_pair_stats.c.partner_id)
+        .order_by(
+            s.desc(db.character_pair_stats.c.line_count),
+            db.character_pair_stats.c.character_id,
+            db.character_pair_stats.c.partner_id,
+        )
+        .limit(1)
+    )
+
+    if movie_id is not None:
+        stmt = stmt.where(db.character_pair_stats.c.movie_id == movie_id)
+
+    return stmt
+
+
+def pair_json(pair):
+    if pair is None:
+        return None
+    return {
+        'character_1_id': pair.character_id,
+        'character_1': pair.name,
+        'character_2_id': pair.partner_id,
+        'character_2': pair.partner_name,
+        'movie': pair.title,
+        'number_of_lines_together': pair.line_count,
+    }
+
+
+@router.get("/movies/{movie_id}/stats", tags=["movies"])
+async def get_movie_stats(movie_id: int):
+    """
+    This endpoint returns dialogue statistics for a single movie. It returns:
+    * `movie_id`: the internal id of the movie.
+    * `title`: The title of the movie.
+    * `total_lines`: The number of lines in the movie.
+    * `total_conversations`: The number of conversations in the movie.
+    * `average_conversation_length`: The average number of lines per conversation.
+    * `lines_by_gender`: The number of lines spoken by `male`, `female` and
+      `unknown` gender characters.
+    * `lines_per_character`: Every character that speaks, each with its
+      `character_id`, `character` name and `num_lines`, ordered by the number
+      of lines.
+    * `most_talkative_pair`: The two characters with the most lines together,
+      as `character_1_id`, `character_1`, `character_2_id`, `character_2`,
+      `movie` and `number_of_lines_together`, or null if no one talks.
+    """
+
+    key = await cache.key('movie_stats', movie_id, scope=f'movie:{movie_id}')
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    if db.backend == "memory":
+        dataset = memory.dataset()
+        stats = dataset.movie_stats(movie_id)
+        characters = dataset.top_characters(movie_id, None)
+        pair = dataset.top_pair(movie_id)
+    else:
+        stats_stmt = (
+            s.select(
+                db.movies.c.movie_id,
+                db.movies.c.title,
+                db.movie_stats.c.character_count,
+                db.movie_stats.c.line_count,
+                db.movie_stats.c.conversation_count,
+                db.movie_stats.c.male_line_count,
+                db.movie_stats.c.female_line_count,
+            )
+            .select_from(db.movies.join(db.movie_stats, db.movie_stats.c.movie_id == db.movies.c.movie_id))
+            .where(db.movies.c.movie_id == movie_id)
+        )
+        characters_stmt = (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.name,
+                db.character_stats.c.line_count
+            )
+            .select_from(db.character_stats.join(db.characters, db.characters.c.character_id == db.character_stats.c.character_id))
+            .where(db.character_stats.c.movie_id == movie_id)
+            .where(db.character_stats.c.line_count > 0)
+            .order_by(s.desc(db.character_stats.c.line_count), db.character_stats.c.character_id)
+        )
+
+        async with db.async_engine.connect() as conn:
+            stats = (await conn.execute(stats_stmt)).first()
+            if stats is not None:
+                characters = (await conn.execute(characters_stmt)).all()
+                pair = (await conn.execute(top_pair(movie_id))).first()
+
+    if stats is None:
+         raise HTTPException(status_code=404, detail="movie not found.")
+
+    result = {
+        'movie_id': stats.movie_id,
+        'title': stats.title,
+        'total_lines': stats.line_count,
+        'total_conversations': stats.conversation_count,
+        'average_conversation_length': average(stats.line_count, stats.conversation_count),
+        'lines_by_gender': lines_by_gender(stats),
+        'lines_per_character': [
+            {
+                'character_id': character.character_id,
+                'character': character.name,
+                'num_lines': character.line_count
+            }
+            for character in characters
+        ],
+        'most_talkative_pair': pair_json(pair),
+    }
+
+    await cache.put(key, result)
+    return result
+
+
+@router.get("/stats", tags=["movies"])
+async def get_stats():
+    """
+    This endpoint returns dialogue statistics for the whole corpus. It returns:
+    * `total_movies`: The number of movies.
+    * `total_characters`: The number of characters.
+    * `total_lines`: The number of lines.
+    * `total_conversations`: The number of conversations.
+    * `average_conversation_length`: The average number of lines per conversation.
+    * `average_lines_per_character`: The average number of lines per character.
+    * `lines_by_gender`: The number of lines spoken by `male`, `female` and
+      `unknown` gender characters.
+    * `top_characters`: The ten characters with the most lines, each with its
+      `character_id`, `character` name, `movie` and `num_lines`.
+    * `most_talkative_pair`: The two characters with the most lines together,
+      as `character_1_id`, `character_1`, `character_2_id`, `character_2`,
+      `movie` and `number_of_lines_together`.
+    """
+
+    key = await cache.key('stats', scope='corpus')
+    cached = await cache.get(key)
+    if cached is not cache.MISSING:
+        return cached
+
+    if db.backend == "memory":
+        dataset = memory.dataset()
+        stats = dataset.corpus_stats()
+        characters = dataset.top_characters_overall(TOP_CHARACTERS)
+        pair = dataset.top_pair()
+    else:
+        # One row per movie, so summing them is cheap.
+        stats_stmt = s.select(
+            s.func.count().label('movie_count'),
+            *(
+                s.func.coalesce(s.func.sum(column), 0).label(column.name)
+                for column in (
+                    db.movie_stats.c.character_count,
+                    db.movie_stats.c.line_count,
+                    db.movie_stats.c.conversation_count,
+                    db.movie_stats.c.male_line_count,
+                    db.movie_stats.c.female_line_count,
+                )
+            ),
+        )
+        characters_stmt = (
+            s.select(
+                db.characters.c.character_id,
+                db.characters.c.name,
+                db.movies.c.title,
+                db.character_stats.c.line_count
+            )
+            .select_from(
+                db.character_stats
+                .join(db.characters, db.characters.c.character_id == db.character_stats.c.character_id)
+                .join(db.movies, db.movies.c.movie_id == db.character_stats.c.movie_id)
+            )
+            .where(db.character_stats.c.line_count > 0)
+            .order_by(s.desc(db.character_stats.c.line_count), db.character_stats.c.character_id)
+            .limit(TOP_CHARACTERS)
+        )
+
+        async with db.async_engine.connect() as conn:
+            stats = (await conn.execute(stats_stmt)).one()
+            characters = (await conn.execute(characters_stmt)).all()
+            pair = (await conn.execute(top_pair())).first()
+
+    result = {
+        'total_movies': stats.movie_count,
+        'total_characters': stats.character_count,
+        'total_lines': stats.line_count,
+        'total_conversations': stats.conversation_count,
+        'average_conversation_length': average(stats.line_count, stats.conversation_count),
+        'average_lines_per_character': average(stats.line_count, stats.character_count),
+        'lines_by_gender': lines_by_gender(stats),
+        'top_characters': [
+            {
+                'character_id': character.character_id,
+                'character': character.name,
+                'movie': character.title,
+                'num_lines': character.line_count
+            }
+            for character in characters
+        ],
+        'most_talkative_pair': pair_json(pair),
+    }
+
+    await cache.put(key, result)
+    return result
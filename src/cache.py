@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Almost all of the corpus is static, so the endpoints keep what they return in
+# a cache and only go back to Postgres on a miss. The cache lives behind a
+# small backend interface: in memory by default, or a Redis server shared by
+# every worker when CACHE_URL is set (which needs the `redis` package). The
+# interface is async, so a Redis round trip never blocks the event loop.
+#
+# Instead of deleting entries on writes, keys embed the version of the data
+# they were built from (see key()). A write bumps the versions of the scopes it
+# touches, which orphans every key built from the old versions at once, in all
+# workers; the orphans then age out through the TTL / LRU.
+#
+# Scopes:
+# * `corpus`: anything that changes with any write (the listing endpoints).
+# * `movie:{movie_id}`: a movie's top_characters and anything else per movie.
+# * `character:{character_id}`: a character's top_conversations.
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a per-entry time to live. Holds at most
+    `maxsize` entries; a `maxsize` of 0 disables it.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for `key`, or MISSING.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+class MemoryBackend:
+    """
+    Per-process backend. Versions are kept apart from the LRU so they're never
+    evicted: a version falling back to 0 would bring old entries back to life.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.entries = LRUCache(maxsize, ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+        # Versions restart from 0 with the process, so tokens handed out
+        # before a restart must not match the ones after it.
+        self.epoch = uuid.uuid4().hex[:12]
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, value):
+        self.entries.set(key, value)
+
+    async def version(self, scope):
+        return self._versions.get(scope, 0)
+
+    async def version_token(self, scope):
+        """
+        Identifies the current version of `scope` across restarts.
+        """
+
+        return f"{self.epoch}.{self._versions.get(scope, 0)}"
+
+    async def bump(self, scopes):
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {'backend': 'memory', **self.entries.stats()}
+
+
+class RedisBackend:
+    """
+    Backend shared by every worker through a Redis server. `client` is anything
+    with the get/mget/set/incr/pipeline methods of redis-py's asyncio client
+    (redis.asyncio.Redis). Values are stored as JSON with a TTL and versions
+    without one, so run Redis with a `volatile-*` eviction policy to keep it
+    from evicting versions.
+    """
+
+    def __init__(self, client, ttl, prefix="movie_api:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key, value):
+        await self.client.set(self.prefix + key, json.dumps(value, separators=(",", ":")), ex=max(1, int(self.ttl)))
+
+    async def version(self, scope):
+        return int(await self.client.get(self.prefix + "version:" + scope) or 0)
+
+    async def version_token(self, scope):
+        """
+        Identifies the current version of `scope`. The epoch changes whenever
+        the versions are lost (a flushed or replaced Redis), so tokens from
+        before can't match again.
+        """
+
+        epoch, version = await self.client.mget(self.prefix + "epoch", self.prefix + "version:" + scope)
+        if epoch is None:
+            await self.client.set(self.prefix + "epoch", uuid.uuid4().hex[:12], nx=True)
+            epoch = await self.client.get(self.prefix + "epoch")
+        if isinstance(epoch, bytes):
+            epoch = epoch.decode()
+        return f"{epoch}.{int(version or 0)}"
+
+    async def bump(self, scopes):
+        pipeline = self.client.pipeline()
+        for scope in scopes:
+            pipeline.incr(self.prefix + "version:" + scope)
+        await pipeline.execute()
+
+    def clear(self):
+        # Orphans every entry by moving all versions on, without a scan.
+        self.prefix = f"{self.prefix}{time.time_ns()}:"
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'redis',
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def make_backend():
+    ttl = float(os.environ.get("CACHE_TTL_SECONDS", 300))
+    url = os.environ.get("CACHE_URL")
+
+    if url:
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise Exception("CACHE_URL is set but the redis package isn't installed (pip install redis).")
+        return RedisBackend(redis.asyncio.Redis.from_url(url), ttl)
+
+    return MemoryBackend(int(os.environ.get("CACHE_MAX_ENTRIES", 10000)), ttl)
+
+
+backend = make_backend()
+
+
+async def get(key):
+    """
+    Returns the cached value for `key`, or MISSING.
+    """
+
+    return await backend.get(key)
+
+
+async def put(key, value):
+    await backend.set(key, value)
+
+
+async def key(*parts, scope):
+    """
+    Builds the cache key for `parts` (the endpoint and its parameters) as of
+    the current version of `scope`. Pass `scope=None` for data no write can
+    change.
+    """
+
+    base = json.dumps(parts, separators=(",", ":"))
+    if scope is None:
+        return base
+    return f"{base}@{scope}.{await backend.version(scope)}"
+
+
+async def invalidate_conversation(movie_id, character_ids):
+    """
+    Orphans everything a new conversation in `movie_id` between
+    `character_ids` makes stale.
+    """
+
+    await backend.bump(["corpus", f"movie:{movie_id}", *(f"character:{character_id}" for character_id in character_ids)])
@@ -1,26 +1,15 @@
-import csv
-import os
-import io
-from supabase import Client, create_client
-import dotenv
-from sqlalchemy import create_engine
 import os
 import dotenv
 import sqlalchemy
-import dotenv
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import create_async_engine
+from src import metrics
+from src import pool
 
 # DO NOT CHANGE THIS TO BE HARDCODED. ONLY PULL FROM ENVIRONMENT VARIABLES.
 dotenv.load_dotenv()
-supabase_api_key = os.environ.get("SUPABASE_API_KEY")
-supabase_url = os.environ.get("SUPABASE_URL")
 
-if supabase_api_key is None or supabase_url is None:
-    raise Exception(
-        "You must set the SUPABASE_API_KEY and SUPABASE_URL environment variables."
-    )
 
-supabase: Client = create_client(supabase_url, supabase_api_key)
-sess = supabase.auth.get_session()
 def database_connection_url():
     dotenv.load_dotenv()
     DB_USER: str = os.environ.get("POSTGRES_USER")
@@ -30,16 +19,174 @@ def database_connection_url():
     DB_NAME: str = os.environ.get("POSTGRES_DB")
     return f"postgresql://{DB_USER}:{DB_PASSWD}@{DB_SERVER}:{DB_PORT}/{DB_NAME}"
 
-# Create a new DB engine based on our connection string
-engine = sqlalchemy.create_engine(database_connection_url())
 
-movies = sqlalchemy.Table("movies", sqlalchemy.MetaData(), autoload_with=engine)
-characters = sqlalchemy.Table("characters", sqlalchemy.MetaData(), autoload_with=engine)
-conversations = sqlalchemy.Table("conversations", sqlalchemy.MetaData(), autoload_with=engine)
-lines = sqlalchemy.Table("lines", sqlalchemy.MetaData(), autoload_with=engine)
+def async_database_connection_url():
+    return database_connection_url().replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+def env_flag(name, default):
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def engine_options(asynchronous=False):
+    """
+    Pool configuration, from environment variables:
+    * `DB_SERVERLESS`: don't pool in-process at all; every checkout opens a
+      fresh connection and closes it afterwards. Use this on serverless
+      platforms (Vercel) together with an external pooler such as Supabase's
+      transaction-mode pooler, since a frozen instance would otherwise strand
+      its idle connections. asyncpg's prepared statement cache is turned off
+      too, as transaction-mode poolers can't support it.
+    * `DB_POOL_SIZE`: connections kept open (default 5).
+    * `DB_MAX_OVERFLOW`: extra connections allowed under load (default 10).
+    * `DB_POOL_TIMEOUT`: seconds to wait for a free connection before failing
+      the request (default 30).
+    * `DB_POOL_RECYCLE`: seconds after which a connection is replaced, so we
+      never use one the server side has already dropped (default 1800).
+    * `DB_POOL_PRE_PING`: test connections before handing them out (default on).
+    * `DB_POOL_SLOW_CHECKOUT_MS`: log a warning whenever getting a connection
+      takes at least this long (default 100).
+    """
+
+    if env_flag("DB_SERVERLESS", False):
+        if asynchronous:
+            return {
+                "poolclass": sqlalchemy.pool.NullPool,
+                "connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0},
+            }
+        return {"poolclass": sqlalchemy.pool.NullPool}
+
+    return {
+        "poolclass": pool.TimedAsyncAdaptedQueuePool if asynchronous else pool.TimedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+    }
+
+
+def pool_capacity(options):
+    if options["poolclass"] is sqlalchemy.pool.NullPool:
+        return None
+    return options["pool_size"] + options["max_overflow"]
+
+
+pool.SLOW_CHECKOUT_MS = float(os.environ.get("DB_POOL_SLOW_CHECKOUT_MS", 100))
+
+# Which backend the endpoints read and write:
+# * `postgres` (the default): the database configured above.
+# * `memory`: the dataset loaded from the CSVs in MEMORY_DATA_DIR into
+#   src/memory.py. No database is needed, or connected to; writes are kept in
+#   memory only.
+backend = os.environ.get("MOVIE_API_BACKEND", "postgres").strip().lower()
+
+if backend not in ("postgres", "memory"):
+    raise Exception("MOVIE_API_BACKEND must be either postgres or memory.")
+
+# Create new DB engines based on our connection string. Neither connects until
+# the first query. The endpoints all run on async_engine; the synchronous engine
+# is for scripts, benchmarks and tests.
+engine = None
+async_engine = None
+_async_engine_options = None
+
+if backend == "postgres":
+    engine = sqlalchemy.create_engine(database_connection_url(), **engine_options())
+
+    _async_engine_options = engine_options(asynchronous=True)
+    async_engine = create_async_engine(async_database_connection_url(), **_async_engine_options)
+
+    if env_flag("METRICS", True):
+        metrics.instrument(engine)
+        metrics.instrument(async_engine.sync_engine)
+
+
+def pool_status():
+    if async_engine is None:
+        return None
+    return pool.status(async_engine, pool_capacity(_async_engine_options))
+
+# The schema is declared here rather than reflected with autoload_with, which
+# cost a round trip per table before the app could serve anything. Keep these in
+# step with migrations/.
+metadata = sqlalchemy.MetaData()
+
+movies = sqlalchemy.Table(
+    "movies",
+    metadata,
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("title", sqlalchemy.Text),
+    sqlalchemy.Column("year", sqlalchemy.Text),
+    sqlalchemy.Column("imdb_rating", sqlalchemy.Float),
+    sqlalchemy.Column("imdb_votes", sqlalchemy.Integer),
+    sqlalchemy.Column("raw_script_url", sqlalchemy.Text),
+)
+
+characters = sqlalchemy.Table(
+    "characters",
+    metadata,
+    sqlalchemy.Column("character_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.Text),
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("movies.movie_id")),
+    sqlalchemy.Column("gender", sqlalchemy.Text),
+    sqlalchemy.Column("age", sqlalchemy.Integer),
+)
+
+conversations = sqlalchemy.Table(
+    "conversations",
+    metadata,
+    sqlalchemy.Column("conversation_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("character1_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("characters.character_id")),
+    sqlalchemy.Column("character2_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("characters.character_id")),
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("movies.movie_id")),
+)
+
+lines = sqlalchemy.Table(
+    "lines",
+    metadata,
+    sqlalchemy.Column("line_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("character_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("characters.character_id")),
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("movies.movie_id")),
+    sqlalchemy.Column("conversation_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("conversations.conversation_id")),
+    sqlalchemy.Column("line_sort", sqlalchemy.Integer),
+    sqlalchemy.Column("line_text", sqlalchemy.Text),
+    # Generated by Postgres, see migrations/002_line_search.sql
+    sqlalchemy.Column("line_text_tsv", TSVECTOR, sqlalchemy.Computed("to_tsvector('english', coalesce(line_text, ''))")),
+)
+
+# Aggregates maintained by src/aggregates.py (see migrations/001_character_stats.sql)
+character_stats = sqlalchemy.Table(
+    "character_stats",
+    metadata,
+    sqlalchemy.Column("character_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("characters.character_id"), primary_key=True),
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("movies.movie_id"), nullable=False),
+    sqlalchemy.Column("line_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("conversation_count", sqlalchemy.Integer, nullable=False),
+)
+
+character_pair_stats = sqlalchemy.Table(
+    "character_pair_stats",
+    metadata,
+    sqlalchemy.Column("character_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("characters.character_id"), primary_key=True),
+    sqlalchemy.Column("partner_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("characters.character_id"), primary_key=True),
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("movies.movie_id"), nullable=False),
+    sqlalchemy.Column("line_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("conversation_count", sqlalchemy.Integer, nullable=False),
+)
+
+# See migrations/005_movie_stats.sql
+movie_stats = sqlalchemy.Table(
+    "movie_stats",
+    metadata,
+    sqlalchemy.Column("movie_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("movies.movie_id"), primary_key=True),
+    sqlalchemy.Column("character_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("line_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("conversation_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("male_line_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("female_line_count", sqlalchemy.Integer, nullable=False),
+)
 
-# Create a single connection to the database. Later we will discuss pooling connections.
-# conn = engine.connect()
 
 
 # def upload(filename, content):
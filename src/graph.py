@@ -0,0 +1,193 @@
+from collections import deque
+from heapq import nsmallest
+from src import cache
+from src import database as db
+from src import memory
+import os
+import sqlalchemy as s
+
+# The character interaction graph: characters are nodes, and two characters
+# are joined by an edge weighted with the number of lines in their
+# conversations together (character_pair_stats). Conversations never cross
+# movies, so the graph is a set of per-movie subgraphs. Each is loaded the
+# first time it's needed and then answered from memory. A process keeps at most
+# GRAPH_MAX_MOVIES of them (1000 by default), dropping the least recently used.
+#
+# A subgraph remembers the cache version of its movie (see src/cache.py) it
+# was loaded at, and is reloaded once that changes, so writes made by other
+# workers are picked up. Writes made by this process are applied to it in
+# place instead (see record_conversations()).
+
+MAX_MOVIES = int(os.environ.get("GRAPH_MAX_MOVIES", 1000))
+
+
+class MovieGraph:
+    """
+    One movie's characters, as `characters` (id -> (name, gender)), and the
+    lines-together weights between them, as `adjacency` (id -> {partner id ->
+    lines}). `title` is None if the movie doesn't exist.
+    """
+
+    def __init__(self, movie_id, version, title, characters, adjacency):
+        self.movie_id = movie_id
+        self.version = version
+        self.title = title
+        self.characters = characters
+        self.adjacency = adjacency
+
+    def add_lines(self, character1_id, character2_id, line_count):
+        if character1_id == character2_id or line_count == 0:
+            return
+        for character_id, partner_id in ((character1_id, character2_id), (character2_id, character1_id)):
+            partners = self.adjacency.setdefault(character_id, {})
+            partners[partner_id] = partners.get(partner_id, 0) + line_count
+
+    def top_partners(self, character_id, limit):
+        """
+        Returns the `limit` partners of the character with the most lines
+        together, as (partner id, lines) pairs, most first.
+        """
+
+        return nsmallest(
+            limit,
+            self.adjacency.get(character_id, {}).items(),
+            key=lambda partner: (-partner[1], partner[0]),
+        )
+
+    def shortest_path(self, source_id, target_id):
+        """
+        Returns the shortest chain of characters, each of whom talks to the
+        next, from `source_id` to `target_id` (inclusive), or None if there is
+        none. Ties are broken towards lower character ids.
+        """
+
+        previous = {source_id: None}
+        queue = deque([source_id])
+        while queue:
+            character_id = queue.popleft()
+            if character_id == target_id:
+                path = []
+                while character_id is not None:
+                    path.append(character_id)
+                    character_id = previous[character_id]
+                return path[::-1]
+            for partner_id in sorted(self.adjacency.get(character_id, ())):
+                if partner_id not in previous:
+                    previous[partner_id] = character_id
+                    queue.append(partner_id)
+        return None
+
+    def edges(self):
+        """Each edge once, as (character id, partner id, lines) with the lower id first."""
+
+        return sorted(
+            (character_id, partner_id, line_count)
+            for character_id, partners in self.adjacency.items()
+            for partner_id, line_count in partners.items()
+            if character_id < partner_id
+        )
+
+
+def scope(movie_id):
+    return f"movie:{movie_id}"
+
+
+class InteractionGraph:
+    def __init__(self, max_movies=MAX_MOVIES):
+        # Subgraphs are checked against their movie's version instead of
+        # expiring.
+        self.movies = cache.LRUCache(max_movies, float("inf"))
+        self.character_movies = None
+
+    async def load_character_movies(self):
+        if db.backend == "memory":
+            dataset = memory.dataset()
+            return dict(zip(dataset.character_ids, dataset.character_movies))
+
+        async with db.async_engine.connect() as conn:
+            rows = await conn.execute(s.select(db.characters.c.character_id, db.characters.c.movie_id))
+            return {row.character_id: row.movie_id for row in rows}
+
+    async def movie_of(self, character_id):
+        """Returns the movie of a character, or None if it doesn't exist."""
+
+        # Characters are never added, so this is only loaded once.
+        if self.character_movies is None:
+            self.character_movies = await self.load_character_movies()
+        return self.character_movies.get(character_id)
+
+    async def load_movie(self, movie_id, version):
+        if db.backend == "memory":
+            dataset = memory.dataset()
+            rows = dataset.movie_characters.get(movie_id, ())
+            characters = {
+                dataset.character_ids[row]: (dataset.character_names[row], dataset.character_genders[row])
+                for row in rows
+            }
+            adjacency = {
+                character_id: dict(dataset.partner_line_counts[character_id])
+                for character_id in characters
+                if dataset.partner_line_counts.get(character_id)
+            }
+            return MovieGraph(movie_id, version, dataset.movie_title(movie_id), characters, adjacency)
+
+        async with db.async_engine.connect() as conn:
+            title = (
+                await conn.execute(s.select(db.movies.c.title).where(db.movies.c.movie_id == movie_id))
+            ).scalar_one_or_none()
+
+            character_rows = await conn.execute(
+                s.select(db.characters.c.character_id, db.characters.c.name, db.characters.c.gender)
+                .where(db.characters.c.movie_id == movie_id)
+            )
+            characters = {row.character_id: (row.name, row.gender) for row in character_rows}
+
+            pair_rows = await conn.execute(
+                s.select(
+                    db.character_pair_stats.c.character_id,
+                    db.character_pair_stats.c.partner_id,
+                    db.character_pair_stats.c.line_count,
+                )
+                .where(db.character_pair_stats.c.movie_id == movie_id)
+                .where(db.character_pair_stats.c.line_count > 0)
+            )
+            adjacency = {}
+            for row in pair_rows:
+                adjacency.setdefault(row.character_id, {})[row.partner_id] = row.line_count
+
+        return MovieGraph(movie_id, version, title, characters, adjacency)
+
+    async def movie(self, movie_id):
+        """Returns the current subgraph of a movie."""
+
+        version = await cache.backend.version_token(scope(movie_id))
+        graph = self.movies.get(movie_id)
+        if graph is cache.MISSING or graph.version != version:
+            graph = await self.load_movie(movie_id, version)
+            self.movies.set(movie_id, graph)
+        return graph
+
+    async def record_conversations(self, movie_id, conversations):
+        """
+        Applies conversations this process just added, each a
+        `(character1_id, character2_id, line_count)` tuple, to the movie's
+        subgraph. Call it after the write has invalidated the cache, which
+        bumped the movie's version by one. If it went up by more than that,
+        another worker wrote too, so the subgraph is dropped to be reloaded.
+        """
+
+        graph = self.movies.get(movie_id)
+        if graph is cache.MISSING:
+            return
+
+        epoch, version = graph.version.rsplit(".", 1)
+        if await cache.backend.version_token(scope(movie_id)) != f"{epoch}.{int(version) + 1}":
+            self.movies.delete(movie_id)
+            return
+
+        for character1_id, character2_id, line_count in conversations:
+            graph.add_lines(character1_id, character2_id, line_count)
+        graph.version = f"{epoch}.{int(version) + 1}"
+
+
+interactions = InteractionGraph()
@@ -0,0 +1,738 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict, namedtuple
+import csv
+import os
+import re
+
+# An in-memory implementation of everything the endpoints read and write,
+# selected with MOVIE_API_BACKEND=memory (see src/database.py). The dataset is
+# loaded once from the CSVs into column arrays, with the aggregates the
+# Postgres backend keeps in character_stats / character_pair_stats computed up
+# front. Nothing here talks to a database, so a memory-backed instance can serve
+# reads with no Postgres at all; writes only live as long as the process.
+#
+# The methods return rows with the same attribute names as the SELECTs in the
+# routers, so each router formats both backends' results with the same code.
+# Text is compared by code point, so the two backends only page through name
+# and title sorts in the same order when the Postgres database collates the
+# same way: create it with `LC_COLLATE 'C'` (or `--locale=C`). A default
+# en_US.UTF-8 database orders case and punctuation differently.
+# test_database_collates_by_code_point checks this against the database.
+
+MovieRow = namedtuple("MovieRow", "movie_id title year imdb_rating imdb_votes")
+CharacterRow = namedtuple("CharacterRow", "character_id name title line_count")
+CharacterDetailRow = namedtuple(
+    "CharacterDetailRow", "character_id name title gender partner_id partner_name partner_gender line_count"
+)
+TopCharacterRow = namedtuple("TopCharacterRow", "character_id name line_count")
+LineRow = namedtuple("LineRow", "line_id conversation_id title name line_text")
+RankedLineRow = namedtuple("RankedLineRow", "line_id conversation_id title name line_text rank")
+LineDetailRow = namedtuple("LineDetailRow", "line_id conversation_id title name recipient line_text")
+ConversationRow = namedtuple("ConversationRow", "conversation_id title")
+ConversationLineRow = namedtuple("ConversationLineRow", "line_id name line_text line_sort")
+ExportedConversationRow = namedtuple("ExportedConversationRow", "conversation_id title line_id name line_text")
+MovieStatsRow = namedtuple(
+    "MovieStatsRow", "movie_id title character_count line_count conversation_count male_line_count female_line_count"
+)
+CorpusStatsRow = namedtuple(
+    "CorpusStatsRow", "movie_count character_count line_count conversation_count male_line_count female_line_count"
+)
+PairRow = namedtuple("PairRow", "character_id name partner_id partner_name title line_count")
+
+DATA_FILES = ("movies.csv", "characters.csv", "conversations.csv", "lines.csv")
+
+WORD = re.compile(r"\w+")
+
+
+def data_dir():
+    """
+    Where the CSVs are read from: `MEMORY_DATA_DIR`, which must be set. The
+    repository only has movies.csv, characters.csv and conversations.csv, so
+    it needs lines.csv added before it can be used as is.
+    """
+
+    directory = os.environ.get("MEMORY_DATA_DIR")
+    if not directory:
+        raise Exception(
+            "MOVIE_API_BACKEND=memory needs MEMORY_DATA_DIR, the directory with "
+            + ", ".join(DATA_FILES) + "."
+        )
+    return directory
+
+
+def missing_files(directory):
+    return [filename for filename in DATA_FILES if not os.path.exists(os.path.join(directory, filename))]
+
+
+def read_csv(directory, filename):
+    with open(os.path.join(directory, filename), encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f, skipinitialspace=True)
+
+
+def optional_int(value):
+    return int(value) if value not in (None, "") else None
+
+
+def optional_float(value):
+    return float(value) if value not in (None, "") else None
+
+
+def optional_text(value):
+    return value if value not in (None, "") else None
+
+
+def sort_key(value, id, descending=False):
+    """
+    The position of a row ordered by `value` then `id`. Like Postgres, nulls
+    come last in ascending order and first in descending order.
+    """
+
+    if descending:
+        return (value is not None, -value if value is not None else 0, id)
+    return (value is None, value if value is not None else "", id)
+
+
+def contains(value, query):
+    """Case-insensitive substring match, like filters.contains."""
+
+    return value is not None and query in value.lower()
+
+
+def parse_search(search):
+    """
+    Parses web search syntax, like websearch_to_tsquery, into a list of
+    alternatives (split on `or`), each a list of `(negated, words)` terms where
+    a quoted phrase is a term with several words.
+    """
+
+    alternatives = [[]]
+    for match in re.finditer(r'(-?)"([^"]*)"?|(-?)(\S+)', search):
+        if match.group(4) is not None and match.group(4).lower() == "or" and not match.group(3):
+            alternatives.append([])
+            continue
+        negated = bool(match.group(1) or match.group(3))
+        words = WORD.findall((match.group(2) if match.group(4) is None else match.group(4)).lower())
+        if words:
+            alternatives[-1].append((negated, words))
+    return [terms for terms in alternatives if terms]
+
+
+class Dataset:
+    """
+    The whole dataset in column arrays, indexed by id. Each table is a set of
+    parallel columns; a row is its position in them.
+    """
+
+    def __init__(self, movies, characters, conversations, lines):
+        self.movie_ids = array("i")
+        self.movie_titles = []
+        self.movie_years = []
+        self.movie_ratings = []
+        self.movie_votes = []
+        self.movie_rows = {}
+
+        for movie in movies:
+            self.movie_rows[int(movie["movie_id"])] = len(self.movie_ids)
+            self.movie_ids.append(int(movie["movie_id"]))
+            self.movie_titles.append(optional_text(movie["title"]))
+            self.movie_years.append(optional_text(movie["year"]))
+            self.movie_ratings.append(optional_float(movie["imdb_rating"]))
+            self.movie_votes.append(optional_int(movie["imdb_votes"]))
+
+        self.character_ids = array("i")
+        self.character_names = []
+        self.character_movies = array("i")
+        self.character_genders = []
+        self.character_rows = {}
+        self.movie_characters = defaultdict(list)
+
+        for character in characters:
+            row = len(self.character_ids)
+            self.character_rows[int(character["character_id"])] = row
+            self.character_ids.append(int(character["character_id"]))
+            self.character_names.append(optional_text(character["name"]))
+            self.character_movies.append(int(character["movie_id"]))
+            self.character_genders.append(optional_text(character["gender"]))
+            self.movie_characters[int(character["movie_id"])].append(row)
+
+        self.conversation_ids = array("i")
+        self.conversation_character1s = array("i")
+        self.conversation_character2s = array("i")
+        self.conversation_movies = array("i")
+        self.conversation_rows = {}
+
+        for conversation in conversations:
+            self.conversation_rows[int(conversation["conversation_id"])] = len(self.conversation_ids)
+            self.conversation_ids.append(int(conversation["conversation_id"]))
+            self.conversation_character1s.append(int(conversation["character1_id"]))
+            self.conversation_character2s.append(int(conversation["character2_id"]))
+            self.conversation_movies.append(int(conversation["movie_id"]))
+
+        self.line_ids = array("i")
+        self.line_characters = array("i")
+        self.line_movies = array("i")
+        self.line_conversations = array("i")
+        self.line_sorts = array("i")
+        self.line_texts = []
+        self.line_rows = {}
+        self.conversation_lines = defaultdict(list)
+
+        for line in lines:
+            self.append_line(
+                int(line["line_id"]),
+                int(line["character_id"]),
+                int(line["movie_id"]),
+                int(line["conversation_id"]),
+                int(line["line_sort"]),
+                optional_text(line["line_text"]),
+            )
+
+        for rows in self.conversation_lines.values():
+            rows.sort(key=lambda row: self.line_sorts[row])
+
+        # The equivalents of character_stats and character_pair_stats.
+        self.line_counts = array("i", [0]) * len(self.character_ids)
+        self.partner_line_counts = defaultdict(Counter)
+
+        for row in range(len(self.line_ids)):
+            character_row = self.character_rows.get(self.line_characters[row])
+            if character_row is not None:
+                self.line_counts[character_row] += 1
+
+        for conversation_id, row in self.conversation_rows.items():
+            self.count_partners(row, len(self.conversation_lines.get(conversation_id, ())))
+
+        # The conversation counts behind movie_stats; the line counts are
+        # summed from line_counts when asked for.
+        self.movie_conversation_counts = Counter(self.conversation_movies)
+
+        self.next_conversation_id = max(self.conversation_ids, default=-1) + 1
+        self.next_line_id = max(self.line_ids, default=-1) + 1
+
+        # Built on first use and dropped on every write.
+        self.orders = {}
+        self.postings = None
+        self.vocabulary = None
+
+    def append_line(self, line_id, character_id, movie_id, conversation_id, line_sort, line_text):
+        row = len(self.line_ids)
+        self.line_rows[line_id] = row
+        self.line_ids.append(line_id)
+        self.line_characters.append(character_id)
+        self.line_movies.append(movie_id)
+        self.line_conversations.append(conversation_id)
+        self.line_sorts.append(line_sort)
+        self.line_texts.append(line_text)
+        self.conversation_lines[conversation_id].append(row)
+
+    def count_partners(self, conversation_row, line_count):
+        character1_id = self.conversation_character1s[conversation_row]
+        character2_id = self.conversation_character2s[conversation_row]
+        if character1_id == character2_id or line_count == 0:
+            return
+        self.partner_line_counts[character1_id][character2_id] += line_count
+        self.partner_line_counts[character2_id][character1_id] += line_count
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = directory or data_dir()
+        missing = missing_files(directory)
+        if missing:
+            raise Exception(f"MEMORY_DATA_DIR ({directory}) is missing {', '.join(missing)}.")
+        return cls(*(read_csv(directory, filename) for filename in DATA_FILES))
+
+    def movie_title(self, movie_id):
+        row = self.movie_rows.get(movie_id)
+        return self.movie_titles[row] if row is not None else None
+
+    def character_name(self, character_id):
+        row = self.character_rows.get(character_id)
+        return self.character_names[row] if row is not None else None
+
+    # Reads
+
+    def movie(self, movie_id):
+        row = self.movie_rows.get(movie_id)
+        if row is None:
+            return None
+        return MovieRow(
+            self.movie_ids[row], self.movie_titles[row], self.movie_years[row],
+            self.movie_ratings[row], self.movie_votes[row],
+        )
+
+    def top_characters(self, movie_id, limit):
+        rows = [row for row in self.movie_characters.get(movie_id, ()) if self.line_counts[row] > 0]
+        rows.sort(key=lambda row: (-self.line_counts[row], self.character_ids[row]))
+        return [
+            TopCharacterRow(self.character_ids[row], self.character_names[row], self.line_counts[row])
+            for row in rows[:limit]
+        ]
+
+    def character(self, character_id):
+        """
+        Returns one row per partner of the character, best first, or a single
+        row with null partner columns if it has none, or [] if it doesn't exist.
+        """
+
+        row = self.character_rows.get(character_id)
+        if row is None or self.character_movies[row] not in self.movie_rows:
+            return []
+
+        header = (
+            character_id,
+            self.character_names[row],
+            self.movie_title(self.character_movies[row]),
+            self.character_genders[row],
+        )
+        partners = sorted(
+            self.partner_line_counts.get(character_id, {}).items(),
+            key=lambda partner: (-partner[1], partner[0]),
+        )
+        if not partners:
+            return [CharacterDetailRow(*header, None, None, None, None)]
+
+        rows = []
+        for partner_id, line_count in partners:
+            partner_row = self.character_rows.get(partner_id)
+            if partner_row is None:
+                rows.append(CharacterDetailRow(*header, None, None, None, line_count))
+                continue
+            rows.append(
+                CharacterDetailRow(
+                    *header, partner_id, self.character_names[partner_row],
+                    self.character_genders[partner_row], line_count,
+                )
+            )
+        return rows
+
+    def line_totals(self, character_rows):
+        """(lines, lines by male characters, lines by female characters) of `character_rows`."""
+
+        lines = male_lines = female_lines = 0
+        for row in character_rows:
+            line_count = self.line_counts[row]
+            lines += line_count
+            if self.character_genders[row] == "M":
+                male_lines += line_count
+            elif self.character_genders[row] == "F":
+                female_lines += line_count
+        return lines, male_lines, female_lines
+
+    def movie_stats(self, movie_id):
+        row = self.movie_rows.get(movie_id)
+        if row is None:
+            return None
+        character_rows = self.movie_characters.get(movie_id, ())
+        lines, male_lines, female_lines = self.line_totals(character_rows)
+        return MovieStatsRow(
+            movie_id, self.movie_titles[row], len(character_rows), lines,
+            self.movie_conversation_counts[movie_id], male_lines, female_lines,
+        )
+
+    def corpus_stats(self):
+        character_rows = [
+            row for movie_id in self.movie_rows for row in self.movie_characters.get(movie_id, ())
+        ]
+        lines, male_lines, female_lines = self.line_totals(character_rows)
+        return CorpusStatsRow(
+            len(self.movie_rows), len(character_rows), lines,
+            sum(self.movie_conversation_counts[movie_id] for movie_id in self.movie_rows),
+            male_lines, female_lines,
+        )
+
+    def top_characters_overall(self, limit):
+        rows = [
+            row for row in range(len(self.character_ids))
+            if self.line_counts[row] > 0 and self.character_movies[row] in self.movie_rows
+        ]
+        rows.sort(key=lambda row: (-self.line_counts[row], self.character_ids[row]))
+        return [
+            CharacterRow(
+                self.character_ids[row], self.character_names[row],
+                self.movie_title(self.character_movies[row]), self.line_counts[row],
+            )
+            for row in rows[:limit]
+        ]
+
+    def top_pair(self, movie_id=None):
+        """
+        Returns the two characters with the most lines together, in `movie_id`
+        or in any movie, with the lower id first, or None if no one talks.
+        """
+
+        if movie_id is None:
+            character_ids = [
+                self.character_ids[row] for movie_id in self.movie_rows for row in self.movie_characters.get(movie_id, ())
+            ]
+        else:
+            character_ids = [self.character_ids[row] for row in self.movie_characters.get(movie_id, ())]
+
+        best = None
+        for character_id in character_ids:
+            for partner_id, line_count in self.partner_line_counts.get(character_id, {}).items():
+                if character_id < partner_id and partner_id in self.character_rows:
+                    candidate = (-line_count, character_id, partner_id)
+                    if best is None or candidate < best:
+                        best = candidate
+        if best is None:
+            return None
+
+        line_count, character_id, partner_id = best
+        return PairRow(
+            character_id, self.character_name(character_id), partner_id, self.character_name(partner_id),
+            self.movie_title(self.character_movies[self.character_rows[character_id]]), -line_count,
+        )
+
+    def character_movie_ids(self, character_ids):
+        """Maps each of `character_ids` that exists to its movie."""
+
+        return {
+            character_id: self.character_movies[self.character_rows[character_id]]
+            for character_id in character_ids
+            if character_id in self.character_rows
+        }
+
+    def line(self, line_id):
+        row = self.line_rows.get(line_id)
+        if row is None:
+            return None
+
+        character_id = self.line_characters[row]
+        name = self.character_name(character_id)
+        title = self.movie_title(self.line_movies[row])
+        if name is None or title is None:
+            return None
+
+        recipient = None
+        conversation_row = self.conversation_rows.get(self.line_conversations[row])
+        if conversation_row is not None:
+            recipient_id = self.conversation_character1s[conversation_row]
+            if recipient_id == character_id:
+                recipient_id = self.conversation_character2s[conversation_row]
+            recipient = self.character_name(recipient_id)
+
+        return LineDetailRow(
+            line_id, self.line_conversations[row], title, name, recipient, self.line_texts[row]
+        )
+
+    def conversation(self, conversation_id):
+        row = self.conversation_rows.get(conversation_id)
+        if row is None or self.conversation_movies[row] not in self.movie_rows:
+            return None
+        return ConversationRow(conversation_id, self.movie_title(self.conversation_movies[row]))
+
+    def lines_of(self, conversation_id):
+        return [
+            ConversationLineRow(
+                self.line_ids[row], self.character_name(self.line_characters[row]),
+                self.line_texts[row], self.line_sorts[row],
+            )
+            for row in self.conversation_lines.get(conversation_id, ())
+            if self.line_characters[row] in self.character_rows
+        ]
+
+    # Listings. Each ordering is a list of rows plus their sort keys, computed
+    # the first time it's asked for, so a page is a bisect to the cursor and a
+    # scan from there.
+
+    def ordering(self, name, rows, value, id, descending=False):
+        if name not in self.orders:
+            keyed = sorted((sort_key(value(row), id(row), descending), row) for row in rows)
+            self.orders[name] = ([key for key, row in keyed], [row for key, row in keyed])
+        return self.orders[name]
+
+    @staticmethod
+    def page(ordering, limit, offset, after, matches=None):
+        """
+        Returns up to `limit` rows of `ordering` that satisfy `matches`,
+        starting after the sort key `after` if given, otherwise skipping the
+        first `offset` matching rows.
+        """
+
+        keys, rows = ordering
+        if limit <= 0:
+            return []
+
+        start = bisect_right(keys, after) if after is not None else 0
+        skip = offset if after is None else 0
+        result = []
+        for row in rows[start:]:
+            if matches is not None and not matches(row):
+                continue
+            if skip > 0:
+                skip -= 1
+                continue
+            result.append(row)
+            if len(result) == limit:
+                break
+        return result
+
+    def characters(self, name, limit, offset, sort, cursor):
+        """
+        Lists the characters with lines, sorted by `sort` ("name", "title" or
+        "line_count"). `cursor` is a decoded `(value, id)` cursor or None.
+        """
+
+        descending = sort == "line_count"
+        value = {
+            "name": lambda row: self.character_names[row],
+            "title": lambda row: self.movie_title(self.character_movies[row]),
+            "line_count": lambda row: self.line_counts[row],
+        }[sort]
+        ordering = self.ordering(
+            ("characters", sort),
+            (
+                row for row in range(len(self.character_ids))
+                if self.line_counts[row] > 0 and self.character_movies[row] in self.movie_rows
+            ),
+            value,
+            lambda row: self.character_ids[row],
+            descending,
+        )
+
+        matches = None
+        if name != "":
+            query = name.lower()
+            matches = lambda row: contains(self.character_names[row], query)
+
+        after = sort_key(cursor[0], cursor[1], descending) if cursor is not None else None
+        return [
+            CharacterRow(
+                self.character_ids[row], self.character_names[row],
+                self.movie_title(self.character_movies[row]), self.line_counts[row],
+            )
+            for row in self.page(ordering, limit, offset, after, matches)
+        ]
+
+    def movies(self, name, limit, offset, sort, cursor):
+        """
+        Lists the movies sorted by `sort` ("title", "year" or "imdb_rating").
+        """
+
+        descending = sort == "imdb_rating"
+        value = {
+            "title": self.movie_titles,
+            "year": self.movie_years,
+            "imdb_rating": self.movie_ratings,
+        }[sort].__getitem__
+        ordering = self.ordering(
+            ("movies", sort), range(len(self.movie_ids)), value, self.movie_ids.__getitem__, descending
+        )
+
+        matches = None
+        if name != "":
+            query = name.lower()
+            matches = lambda row: contains(self.movie_titles[row], query)
+
+        after = sort_key(cursor[0], cursor[1], descending) if cursor is not None else None
+        return [self.movie(self.movie_ids[row]) for row in self.page(ordering, limit, offset, after, matches)]
+
+    def lines(self, text, name, search, limit, offset, sort, cursor):
+        """
+        Lists the lines sorted by `sort` ("title", "conversation_id", "name" or
+        "rank", which is relevance to `search`).
+        """
+
+        ranks = self.search(search) if search != "" else None
+        name = name.lower()
+        text = text.lower()
+
+        def matches(row):
+            if ranks is not None and row not in ranks:
+                return False
+            if name != "" and not contains(self.character_name(self.line_characters[row]), name):
+                return False
+            if text != "" and not contains(self.line_texts[row], text):
+                return False
+            return True
+
+        descending = sort == "rank"
+        if sort == "rank":
+            keyed = sorted((sort_key(rank, self.line_ids[row], True), row) for row, rank in ranks.items())
+            ordering = ([key for key, row in keyed], [row for key, row in keyed])
+        else:
+            value = {
+                "title": lambda row: self.movie_title(self.line_movies[row]),
+                "conversation_id": self.line_conversations.__getitem__,
+                "name": lambda row: self.character_name(self.line_characters[row]),
+            }[sort]
+            ordering = self.ordering(
+                ("lines", sort),
+                (
+                    row for row in range(len(self.line_ids))
+                    if self.line_movies[row] in self.movie_rows and self.line_characters[row] in self.character_rows
+                ),
+                value,
+                self.line_ids.__getitem__,
+            )
+
+        after = sort_key(cursor[0], cursor[1], descending) if cursor is not None else None
+        rows = []
+        for row in self.page(ordering, limit, offset, after, matches):
+            line = (
+                self.line_ids[row], self.line_conversations[row], self.movie_title(self.line_movies[row]),
+                self.character_name(self.line_characters[row]), self.line_texts[row],
+            )
+            rows.append(RankedLineRow(*line, ranks[row]) if sort == "rank" else LineRow(*line))
+        return rows
+
+    # Exports. These are generators, so nothing is copied up front.
+
+    def export_lines(self, text, name):
+        """Yields the lines matching the `text` and `name` filters, by id."""
+
+        text = text.lower()
+        name = name.lower()
+        keys, rows = self.ordering(
+            ("lines", "line_id"), range(len(self.line_ids)), self.line_ids.__getitem__, self.line_ids.__getitem__
+        )
+        for row in rows:
+            title = self.movie_title(self.line_movies[row])
+            character = self.character_name(self.line_characters[row])
+            if title is None or character is None:
+                continue
+            if name != "" and not contains(character, name):
+                continue
+            if text != "" and not contains(self.line_texts[row], text):
+                continue
+            yield LineRow(self.line_ids[row], self.line_conversations[row], title, character, self.line_texts[row])
+
+    def export_conversations(self, movie_id, name):
+        """
+        Yields one row per line of the conversations in `movie_id` (all if
+        None) that involve a character whose name contains `name`, ordered by
+        conversation then line. A conversation without lines gets a single row
+        with null line columns.
+        """
+
+        name = name.lower()
+        for conversation_id in sorted(self.conversation_rows):
+            row = self.conversation_rows[conversation_id]
+            if movie_id is not None and self.conversation_movies[row] != movie_id:
+                continue
+            title = self.movie_title(self.conversation_movies[row])
+            if title is None:
+                continue
+            if name != "" and not any(
+                contains(self.character_name(character_id), name)
+                for character_id in (self.conversation_character1s[row], self.conversation_character2s[row])
+            ):
+                continue
+
+            lines = self.lines_of(conversation_id)
+            if not lines:
+                yield ExportedConversationRow(conversation_id, title, None, None, None)
+            for line in lines:
+                yield ExportedConversationRow(conversation_id, title, line.line_id, line.name, line.line_text)
+
+    # Full-text search. Postgres stems words; here a query word matches any
+    # word that starts with it, which covers the common cases ("run" finds
+    # "running") without a stemmer. A line's rank is how many times its
+    # matching words occur.
+
+    def build_postings(self):
+        postings = defaultdict(list)
+        for row, text in enumerate(self.line_texts):
+            if text is not None:
+                for word in set(WORD.findall(text.lower())):
+                    postings[word].append(row)
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+
+    def prefixed(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def word_rows(self, prefix):
+        return {row for word in self.prefixed(prefix) for row in self.postings[word]}
+
+    def term_rows(self, words):
+        rows = set.intersection(*(self.word_rows(word) for word in words))
+        if len(words) == 1:
+            return rows
+
+        def has_phrase(row):
+            tokens = WORD.findall(self.line_texts[row].lower())
+            return any(
+                all(tokens[start + i].startswith(word) for i, word in enumerate(words))
+                for start in range(len(tokens) - len(words) + 1)
+            )
+
+        return {row for row in rows if has_phrase(row)}
+
+    def search(self, search):
+        """Maps each line matching `search` to its rank."""
+
+        if self.postings is None:
+            self.build_postings()
+
+        alternatives = parse_search(search)
+        matched = set()
+        for terms in alternatives:
+            included = [words for negated, words in terms if not negated]
+            excluded = [words for negated, words in terms if negated]
+            if included:
+                rows = set.intersection(*(self.term_rows(words) for words in included))
+            else:
+                rows = {row for row, text in enumerate(self.line_texts) if text is not None}
+            for words in excluded:
+                rows -= self.term_rows(words)
+            matched |= rows
+
+        prefixes = [word for terms in alternatives for negated, words in terms if not negated for word in words]
+        ranks = {}
+        for row in matched:
+            tokens = WORD.findall(self.line_texts[row].lower())
+            ranks[row] = float(sum(1 for token in tokens for prefix in prefixes if token.startswith(prefix)))
+        return ranks
+
+    # Writes
+
+    def add_conversations(self, movie_id, conversations):
+        """
+        Adds already validated conversations, each a
+        `(character1_id, character2_id, [(character_id, line_text), ...])`
+        tuple, and returns their new ids.
+        """
+
+        conversation_ids = []
+        for character1_id, character2_id, lines in conversations:
+            conversation_id = self.next_conversation_id
+            self.next_conversation_id += 1
+
+            row = len(self.conversation_ids)
+            self.conversation_rows[conversation_id] = row
+            self.conversation_ids.append(conversation_id)
+            self.conversation_character1s.append(character1_id)
+            self.conversation_character2s.append(character2_id)
+            self.conversation_movies.append(movie_id)
+
+            for line_sort, (character_id, line_text) in enumerate(lines, start=1):
+                self.append_line(self.next_line_id, character_id, movie_id, conversation_id, line_sort, line_text)
+                self.next_line_id += 1
+                self.line_counts[self.character_rows[character_id]] += 1
+
+            self.count_partners(row, len(lines))
+            self.movie_conversation_counts[movie_id] += 1
+            conversation_ids.append(conversation_id)
+
+        self.orders = {}
+        self.postings = None
+        self.vocabulary = None
+        return conversation_ids
+
+
+_dataset = None
+
+
+def dataset():
+    """Returns the dataset, loading it on first use."""
+
+    global _dataset
+    if _dataset is None:
+        _dataset = Dataset.load()
+    return _dataset
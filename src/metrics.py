@@ -0,0 +1,233 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# Request and SQL instrumentation. MetricsMiddleware (src/api/instrumentation.py)
+# times every request and keeps a RequestMetrics for it in `current`; the
+# SQLAlchemy hooks installed by instrument() count the statements and connection
+# checkouts made while it's set. Everything is aggregated in `registry` and
+# rendered in the Prometheus text format at /metrics. Configured from
+# environment variables:
+# * `METRICS`: set to off to disable the middleware and the hooks (default on).
+# * `METRICS_SLOW_STATEMENTS`: how many of the slowest statements to keep
+#   (default 10).
+
+SLOW_STATEMENTS = int(os.environ.get("METRICS_SLOW_STATEMENTS", 10))
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries / checkouts per request histogram buckets.
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 25, 50, 100)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket, plus one for values above the last.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, ending with +Inf."""
+
+        total = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestMetrics:
+    """What one request did, filled in by the SQLAlchemy hooks as it runs."""
+
+    __slots__ = ("route", "queries", "query_seconds", "checkouts")
+
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.checkouts = 0
+
+    def server_timing(self, elapsed):
+        """A Server-Timing header value for the request so far."""
+
+        return (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'pool;desc="{self.checkouts} checkouts"'
+        )
+
+
+current = ContextVar("request_metrics", default=None)
+
+
+class Registry:
+    def __init__(self, slow_statements=SLOW_STATEMENTS):
+        self.slow_statements = slow_statements
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.checkouts = {}
+        self.statement_latency = Histogram(LATENCY_BUCKETS)
+        # statement -> [slowest seconds, route it ran for, executions]
+        self.slowest = {}
+
+    def record_request(self, method, route, status, seconds, request):
+        with self._lock:
+            self.latency.setdefault((method, route, str(status)), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault((method, route), Histogram(COUNT_BUCKETS)).observe(request.queries)
+            self.checkouts.setdefault((method, route), Histogram(COUNT_BUCKETS)).observe(request.checkouts)
+
+    def record_statement(self, statement, seconds, route):
+        statement = WHITESPACE.sub(" ", statement).strip()
+        with self._lock:
+            self.statement_latency.observe(seconds)
+
+            slow = self.slowest.get(statement)
+            if slow is not None:
+                slow[2] += 1
+                if seconds > slow[0]:
+                    slow[0], slow[1] = seconds, route
+                return
+
+            if len(self.slowest) >= self.slow_statements:
+                fastest = min(self.slowest, key=lambda statement: self.slowest[statement][0])
+                if self.slowest[fastest][0] >= seconds:
+                    return
+                del self.slowest[fastest]
+            self.slowest[statement] = [seconds, route, 1]
+
+    def clear(self):
+        with self._lock:
+            self.latency.clear()
+            self.queries.clear()
+            self.checkouts.clear()
+            self.statement_latency = Histogram(LATENCY_BUCKETS)
+            self.slowest.clear()
+
+    def render(self, pool=None, cache=None):
+        """
+        The metrics in the Prometheus text exposition format, along with the
+        pool status (db.pool_status()) and cache stats (cache.backend.stats())
+        if given.
+        """
+
+        output = []
+        with self._lock:
+            render_histograms(
+                output, "movie_api_request_duration_seconds", "Request latency by route.",
+                ("method", "route", "status"), self.latency,
+            )
+            render_histograms(
+                output, "movie_api_request_queries", "SQL statements executed per request.",
+                ("method", "route"), self.queries,
+            )
+            render_histograms(
+                output, "movie_api_request_checkouts", "Connection pool checkouts per request.",
+                ("method", "route"), self.checkouts,
+            )
+            render_histograms(
+                output, "movie_api_statement_duration_seconds", "SQL statement latency.",
+                (), {(): self.statement_latency},
+            )
+
+            output.append("# HELP movie_api_slow_statement_seconds The slowest SQL statements seen.")
+            output.append("# TYPE movie_api_slow_statement_seconds gauge")
+            for statement, (seconds, route, executions) in sorted(self.slowest.items(), key=lambda item: -item[1][0]):
+                labels = format_labels(("statement", "route", "executions"), (statement, route or "", str(executions)))
+                output.append(f"movie_api_slow_statement_seconds{labels} {seconds:.6f}")
+
+        if pool is not None:
+            render_gauges(output, "movie_api_pool", pool)
+        if cache is not None:
+            render_gauges(output, "movie_api_cache", cache)
+
+        return "\n".join(output) + "\n"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render_histograms(output, name, help, label_names, histograms):
+    output.append(f"# HELP {name} {help}")
+    output.append(f"# TYPE {name} histogram")
+    for label_values, histogram in sorted(histograms.items()):
+        for bound, count in histogram.cumulative():
+            labels = format_labels((*label_names, "le"), (*label_values, format_bound(bound)))
+            output.append(f"{name}_bucket{labels} {count}")
+        labels = format_labels(label_names, label_values)
+        output.append(f"{name}_sum{labels} {histogram.sum:.6f}")
+        output.append(f"{name}_count{labels} {histogram.count}")
+
+
+def render_gauges(output, prefix, stats):
+    """One gauge per numeric value of a stats dict."""
+
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        output.append(f"# TYPE {prefix}_{key} gauge")
+        output.append(f"{prefix}_{key} {value}")
+
+
+registry = Registry()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["metrics_start"].pop()
+    request = current.get()
+    if request is not None:
+        request.queries += 1
+        request.query_seconds += seconds
+    registry.record_statement(statement, seconds, request.route if request is not None else None)
+
+
+def handle_error(exception_context):
+    # after_cursor_execute won't run for the failed statement.
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_start"):
+        conn.info["metrics_start"].pop()
+
+
+def checkout(dbapi_connection, connection_record, connection_proxy):
+    request = current.get()
+    if request is not None:
+        request.checkouts += 1
+
+
+def instrument(engine):
+    """
+    Installs the hooks on a (synchronous) engine. For an AsyncEngine, pass its
+    `sync_engine`.
+    """
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+    event.listen(engine, "checkout", checkout)
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+# Checkouts that wait at least this long are logged. Set from
+# DB_POOL_SLOW_CHECKOUT_MS by src/database.py before the engines are created.
+SLOW_CHECKOUT_MS = 100
+
+
+class PoolStats:
+    """
+    Running totals of how long requests waited to check a connection out of
+    one pool. Waiting here means every pooled connection was busy, so it's the
+    first number to look at when the pool is undersized.
+    """
+
+    def __init__(self, slow_checkout_ms=None):
+        self.slow_checkout_ms = slow_checkout_ms if slow_checkout_ms is not None else SLOW_CHECKOUT_MS
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def record(self, wait_ms, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+        if timed_out:
+            logger.warning("timed out after %.1fms waiting for a database connection", wait_ms)
+        elif wait_ms >= self.slow_checkout_ms:
+            logger.warning("waited %.1fms for a database connection", wait_ms)
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_total_ms': round(self.wait_total_ms, 3),
+                'wait_mean_ms': round(self.wait_total_ms / attempts, 3) if attempts else 0.0,
+                'wait_max_ms': round(self.wait_max_ms, 3),
+            }
+
+
+class TimedCheckout:
+    """
+    Pool mixin that records how long each checkout waited in the pool's own
+    `stats`, so the sync and async engines' figures are kept apart.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        # SQLAlchemy replaces the pool when the engine is disposed; the totals
+        # carry over.
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        self.stats.record((time.perf_counter() - start) * 1000)
+        return connection
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def status(engine, capacity):
+    """
+    Describes the current state of `engine`'s pool. `capacity` is the most
+    connections it may hold (pool size plus overflow), or None when pooling is
+    left to an external pooler.
+    """
+
+    pool = engine.pool
+    result = {'pool': type(pool).__name__, 'capacity': capacity}
+
+    if isinstance(pool, QueuePool):
+        checked_out = pool.checkedout()
+        result.update(
+            {
+                'checked_out': checked_out,
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'saturation': round(checked_out / capacity, 3) if capacity else None,
+            }
+        )
+
+    if isinstance(pool, TimedCheckout):
+        result.update(pool.stats.snapshot())
+    return result
@@ -0,0 +1,40 @@
+import os
+import pytest
+
+# The test modules share a TestClient that isn't used as a context manager, so
+# every request runs on a fresh event loop. asyncpg connections are tied to the
+# loop that opened them, so pooled connections can't be reused across requests
+# here; run the tests without an in-process pool.
+os.environ.setdefault("DB_SERVERLESS", "1")
+
+
+def memory_backend():
+    return os.environ.get("MOVIE_API_BACKEND", "postgres").strip().lower() == "memory"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: reads the database directly, so only runs against the Postgres backend")
+
+    # The endpoint tests check the full dataset, which isn't in the
+    # repository (lines.csv is missing), so say so up front rather than fail
+    # every test.
+    if memory_backend():
+        from src import memory
+
+        directory = os.environ.get("MEMORY_DATA_DIR")
+        if not directory:
+            raise pytest.UsageError("MOVIE_API_BACKEND=memory needs MEMORY_DATA_DIR, the directory with the dataset's CSVs.")
+        if memory.missing_files(directory):
+            raise pytest.UsageError(f"MEMORY_DATA_DIR ({directory}) is missing {', '.join(memory.missing_files(directory))}.")
+
+
+def pytest_collection_modifyitems(config, items):
+    # The endpoint tests run against whichever backend MOVIE_API_BACKEND
+    # selects, and check the same fixtures either way.
+    if not memory_backend():
+        return
+
+    skip = pytest.mark.skip(reason="needs the Postgres backend")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,164 @@
+from src import cache
+
+import asyncio
+import pytest
+
+
+class FakeRedis:
+    """
+    Local stand-in for a Redis server, implementing the commands RedisBackend
+    uses, with the async interface of redis.asyncio.Redis.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, name):
+        return self.data.get(name)
+
+    async def mget(self, *names):
+        return [self.data.get(name) for name in names]
+
+    async def set(self, name, value, ex=None, nx=False):
+        if nx and name in self.data:
+            return None
+        self.data[name] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def _incr(self, name):
+        self.data[name] = str(int(self.data.get(name, b"0")) + 1).encode()
+        return int(self.data[name])
+
+    async def incr(self, name):
+        return self._incr(name)
+
+    def pipeline(self):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.commands = []
+
+            def incr(self, name):
+                # Queued, as in a redis.asyncio pipeline; only execute() is awaited.
+                self.commands.append(name)
+                return self
+
+            async def execute(self):
+                return [redis._incr(name) for name in self.commands]
+
+        return Pipeline()
+
+
+def test_lru_eviction():
+    lru = cache.LRUCache(maxsize=2, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+
+    assert lru.get('b') is cache.MISSING
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+    assert lru.stats()['evictions'] == 1
+
+
+def test_ttl_expiry():
+    lru = cache.LRUCache(maxsize=10, ttl=-1)
+    lru.set('a', 1)
+    assert lru.get('a') is cache.MISSING
+
+
+def test_disabled():
+    lru = cache.LRUCache(maxsize=0, ttl=60)
+    lru.set('a', 1)
+    assert lru.get('a') is cache.MISSING
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, monkeypatch):
+    if request.param == "memory":
+        backend = cache.MemoryBackend(maxsize=100, ttl=60)
+    else:
+        backend = cache.RedisBackend(FakeRedis(), ttl=60)
+    monkeypatch.setattr(cache, "backend", backend)
+    return backend
+
+
+def test_round_trip(backend):
+    async def check():
+        key = await cache.key('characters', 'amy', 50, 0, scope='corpus')
+        assert await cache.get(key) is cache.MISSING
+
+        await cache.put(key, [[{'character_id': 1}], None])
+        assert await cache.get(key) == [[{'character_id': 1}], None]
+
+    asyncio.run(check())
+
+
+def test_keys_are_unambiguous(backend):
+    async def check():
+        assert await cache.key('lines', 'a:b', 'c', scope=None) != await cache.key('lines', 'a', 'b:c', scope=None)
+
+    asyncio.run(check())
+
+
+def test_invalidate_conversation(backend):
+    async def check():
+        movie = await cache.key('movie', 3, scope='movie:3')
+        character = await cache.key('character', 49, scope='character:49')
+        other_character = await cache.key('character', 50, scope='character:50')
+        other_movie = await cache.key('movie', 4, scope='movie:4')
+        listing = await cache.key('characters', '', 50, 0, scope='corpus')
+        for key in (movie, character, other_character, other_movie, listing):
+            await cache.put(key, {})
+
+        await cache.invalidate_conversation(3, [49, 55])
+
+        assert await cache.get(await cache.key('movie', 3, scope='movie:3')) is cache.MISSING
+        assert await cache.get(await cache.key('character', 49, scope='character:49')) is cache.MISSING
+        assert await cache.get(await cache.key('characters', '', 50, 0, scope='corpus')) is cache.MISSING
+        assert await cache.get(await cache.key('character', 50, scope='character:50')) == {}
+        assert await cache.get(await cache.key('movie', 4, scope='movie:4')) == {}
+
+    asyncio.run(check())
+
+
+def test_workers_share_invalidation():
+    redis = FakeRedis()
+    worker_1 = cache.RedisBackend(redis, ttl=60)
+    worker_2 = cache.RedisBackend(redis, ttl=60)
+
+    async def check():
+        key = f"movie:3@movie:3.{await worker_1.version('movie:3')}"
+        await worker_1.set(key, {'movie_id': 3})
+        assert await worker_2.get(key) == {'movie_id': 3}
+
+        await worker_2.bump(['movie:3'])
+        assert await worker_1.version('movie:3') == 1
+
+    asyncio.run(check())
+
+
+def test_version_token(backend):
+    async def check():
+        token = await backend.version_token('movie:3')
+        assert await backend.version_token('movie:3') == token
+
+        await cache.invalidate_conversation(3, [49, 55])
+        assert await backend.version_token('movie:3') != token
+
+    asyncio.run(check())
+
+
+def test_version_token_changes_when_redis_is_flushed():
+    redis = FakeRedis()
+    backend = cache.RedisBackend(redis, ttl=60)
+
+    async def check():
+        token = await backend.version_token('corpus')
+
+        redis.data.clear()
+        assert await backend.version_token('corpus') != token
+
+    asyncio.run(check())
@@ -3,6 +3,9 @@ from fastapi.testclient import TestClient
 from src.api.server import app
 
 import json
+from src import database as db
+import sqlalchemy as s
+import pytest
 
 client = TestClient(app)
 
@@ -57,3 +60,77 @@ def test_sort_filter_2():
 def test_404():
     response = client.get("/characters/400")
     assert response.status_code == 404
+
+def test_cursor():
+    response = client.get("/characters/?limit=30&sort=movie")
+    assert response.status_code == 200
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/characters/?limit=10&sort=movie&cursor={cursor}")
+    assert response.status_code == 200
+
+    with open(
+        "test/characters/characters-offset=30&limit=10&sort=movie.json",
+        encoding="utf-8",
+    ) as f:
+        assert response.json() == json.load(f)
+
+def test_cursor_wrong_sort():
+    response = client.get("/characters/?limit=30&sort=movie")
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/characters/?sort=character&cursor={cursor}")
+    assert response.status_code == 422
+
+def test_filter_is_literal():
+    response = client.get("/characters/?name=%25")
+    assert response.status_code == 200
+    assert response.json() == []
+
+@pytest.mark.postgres
+def test_get_character_single_query():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    s.event.listen(db.async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/characters/4")
+    finally:
+        s.event.remove(db.async_engine.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+def test_partners():
+    response = client.get("/characters/4/partners?limit=2")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"character_id": 9, "character": "PATRICK", "gender": "M", "number_of_lines_together": 32},
+        {"character_id": 7, "character": "MICHAEL", "gender": "M", "number_of_lines_together": 15},
+    ]
+
+def test_path():
+    response = client.get("/characters/4/path/9")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"character_id": 4, "character": "JOEY"},
+        {"character_id": 9, "character": "PATRICK"},
+    ]
+
+
+def test_batch():
+    response = client.post("/characters/batch", json={"ids": [4, 999999999, 7421]})
+    assert response.status_code == 200
+
+    with open("test/characters/4.json", encoding="utf-8") as f:
+        character_4 = json.load(f)
+    with open("test/characters/7421.json", encoding="utf-8") as f:
+        character_7421 = json.load(f)
+
+    assert response.json() == [
+        character_4,
+        {"status_code": 404, "detail": "character not found."},
+        character_7421,
+    ]
@@ -0,0 +1,112 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.api import compression
+from src.api.server import app as server_app
+
+import gzip
+import pytest
+
+app = FastAPI()
+app.add_middleware(compression.CompressionMiddleware, minimum_size=100)
+
+ROWS = [{'line_id': i, 'movie_title': 'airplane!', 'character': 'STRIKER'} for i in range(50)]
+
+
+@app.get("/large")
+async def large():
+    return ROWS
+
+
+@app.get("/small")
+async def small():
+    return ROWS[:1]
+
+
+@app.get("/stream")
+async def stream():
+    async def chunks():
+        for i in range(3):
+            yield b'{"chunk": %d}\n' % i * 20
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson", headers={"ETag": '"abc"'})
+
+
+@app.get("/small-stream")
+async def small_stream():
+    async def chunks():
+        for i in range(3):
+            yield b'{"chunk": %d}\n' % i
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+client = TestClient(app)
+
+
+def test_accepted_encodings():
+    assert compression.accepted_encodings("gzip, deflate, br;q=0") == {"gzip", "deflate"}
+    assert compression.choose_encoder("identity") is None
+    assert compression.choose_encoder("*") is compression.GzipEncoder
+
+
+def test_large_response_is_compressed():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == ROWS
+
+
+def test_small_response_is_not_compressed():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == ROWS[:1]
+
+
+def test_not_accepted():
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_streamed_response():
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert response.text == "".join('{"chunk": %d}\n' % i * 20 for i in range(3))
+
+
+def test_small_streamed_response_is_not_compressed():
+    response = client.get("/small-stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == "".join('{"chunk": %d}\n' % i for i in range(3))
+
+
+def test_server_app():
+    # Every response in the app is streamed through BaseHTTPMiddleware.
+    server_client = TestClient(server_app)
+
+    response = server_client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-length"] == str(len(response.content))
+    assert "Accept-Encoding" in response.headers["vary"]
+
+    response = server_client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["info"]["title"] == "Movie API"
+
+
+def test_gzip_encoder_flushes_each_chunk():
+    encoder = compression.GzipEncoder(level=6)
+    first = encoder.compress(b"hello " * 100, finish=False)
+    assert first != b""
+    assert gzip.decompress(first + encoder.compress(b"world", finish=True)) == b"hello " * 100 + b"world"
+
+
+def test_brotli():
+    pytest.importorskip("brotli")
+    response = client.get("/large", headers={"Accept-Encoding": "br"})
+    assert response.headers["content-encoding"] == "br"
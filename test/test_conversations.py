@@ -3,8 +3,11 @@ from fastapi.testclient import TestClient
 from src.api.server import app
 
 import json
+from concurrent.futures import ThreadPoolExecutor
+from scripts import migrate
 from src import database as db
 import sqlalchemy as s
+import pytest
 
 client = TestClient(app)
 
@@ -26,6 +29,22 @@ def test_404():
     response = client.get("/conversations/201")
     assert response.status_code == 404
 
+def test_batch():
+    response = client.post("/conversations/batch", json={"ids": [27564, 201, 16484]})
+    assert response.status_code == 200
+
+    with open("test/conversations/16484.json", encoding="utf-8") as f:
+        conversation_16484 = json.load(f)
+    with open("test/conversations/27564.json", encoding="utf-8") as f:
+        conversation_27564 = json.load(f)
+
+    assert response.json() == [
+        conversation_27564,
+        {"status_code": 404, "detail": "conversation not found."},
+        conversation_16484,
+    ]
+
+@pytest.mark.postgres
 def test_add_conversation():
     stmt = (s.select(db.conversations.c.conversation_id).order_by(s.desc('conversation_id')))
     with db.engine.connect() as conn:
@@ -44,7 +63,9 @@ def test_add_conversation():
         }
     )
     assert response.status_code == 200
-    assert response.json() == {'conversation_id': id}
+    # Ids come from a sequence, so they're increasing but may skip values.
+    assert response.json()['conversation_id'] >= id
+    id = response.json()['conversation_id']
 
     stmt = (s.select(db.conversations.c.conversation_id).where(db.conversations.c.conversation_id == id))
 
@@ -54,6 +75,7 @@ def test_add_conversation():
     conversation = conversations_result.first()
     assert conversation is not None
 
+@pytest.mark.postgres
 def test_add_conversation_2():
     stmt = (s.select(db.conversations.c.conversation_id).order_by(s.desc('conversation_id')))
     with db.engine.connect() as conn:
@@ -92,7 +114,9 @@ def test_add_conversation_2():
         }
     )
     assert response.status_code == 200
-    assert response.json() == {'conversation_id': id}
+    # Ids come from a sequence, so they're increasing but may skip values.
+    assert response.json()['conversation_id'] >= id
+    id = response.json()['conversation_id']
 
     stmt = (s.select(db.conversations.c.conversation_id).where(db.conversations.c.conversation_id == id))
 
@@ -131,3 +155,204 @@ def test_422():
         }
     )
     assert response.status_code == 422
+
+@pytest.mark.postgres
+def test_add_conversation_updates_stats():
+    def stats():
+        with db.engine.connect() as conn:
+            character = conn.execute(
+                s.select(db.character_stats.c.line_count, db.character_stats.c.conversation_count)
+                .where(db.character_stats.c.character_id == 49)
+            ).first()
+            pair = conn.execute(
+                s.select(db.character_pair_stats.c.line_count)
+                .where(db.character_pair_stats.c.character_id == 55)
+                .where(db.character_pair_stats.c.partner_id == 49)
+            ).first()
+        return character.line_count, character.conversation_count, pair.line_count if pair else 0
+
+    line_count, conversation_count, pair_line_count = stats()
+    movie_stats = client.get("/movies/3/stats").json()
+    response = client.post('movies/3/conversations/',
+        json={
+            'character_1_id': 49,
+            'character_2_id': 55,
+            'lines': [
+                {
+                    'character_id': 49,
+                    'line_text': 'Open the pod bay doors.'
+                },
+                {
+                    'character_id': 55,
+                    'line_text': "I'm afraid I can't do that."
+                }
+            ]
+        }
+    )
+    assert response.status_code == 200
+    assert stats() == (line_count + 1, conversation_count + 1, pair_line_count + 2)
+
+    response = client.get("/movies/3/stats")
+    assert response.json()["total_lines"] == movie_stats["total_lines"] + 2
+    assert response.json()["total_conversations"] == movie_stats["total_conversations"] + 1
+
+@pytest.mark.postgres
+def test_rebuild_aggregates():
+    def count(table):
+        return s.select(s.func.count()).select_from(table).scalar_subquery()
+
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            migrate.rebuild_aggregates(conn)
+            rebuilt = conn.execute(
+                s.select(
+                    s.select(s.func.count()).select_from(db.movie_stats).scalar_subquery(),
+                    s.select(s.func.sum(db.movie_stats.c.line_count)).scalar_subquery(),
+                    s.select(s.func.sum(db.movie_stats.c.conversation_count)).scalar_subquery(),
+                    s.select(s.func.sum(db.character_stats.c.line_count)).scalar_subquery(),
+                )
+            ).one()
+            expected = conn.execute(
+                s.select(count(db.movies), count(db.lines), count(db.conversations), count(db.lines))
+            ).one()
+            assert tuple(rebuilt) == tuple(expected)
+        finally:
+            transaction.rollback()
+
+@pytest.mark.postgres
+def test_concurrent_adds_get_distinct_ids():
+    def add(i):
+        # Half name the pair in the other order, so their aggregate upserts
+        # would lock the same rows in the opposite order if they weren't sorted.
+        character1_id, character2_id = (49, 55) if i % 2 == 0 else (55, 49)
+        return client.post('movies/3/conversations/',
+            json={
+                'character_1_id': character1_id,
+                'character_2_id': character2_id,
+                'lines': [
+                    {
+                        'character_id': character1_id,
+                        'line_text': f'concurrent test {i}'
+                    },
+                    {
+                        'character_id': character2_id,
+                        'line_text': f'concurrent reply {i}'
+                    }
+                ]
+            }
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(add, range(16)))
+
+    assert all(response.status_code == 200 for response in responses)
+    ids = [response.json()['conversation_id'] for response in responses]
+    assert len(set(ids)) == len(ids)
+
+    stmt = (
+        s.select(db.lines.c.conversation_id, s.func.count().label('line_count'), s.func.count(s.distinct(db.lines.c.line_id)).label('distinct_ids'))
+        .where(db.lines.c.conversation_id.in_(ids))
+        .group_by(db.lines.c.conversation_id)
+    )
+    with db.engine.connect() as conn:
+        rows = conn.execute(stmt).all()
+
+    assert len(rows) == len(ids)
+    assert all(row.line_count == 2 and row.distinct_ids == 2 for row in rows)
+
+@pytest.mark.postgres
+def test_bulk_add_conversations():
+    good = {
+        'character_1_id': 49,
+        'character_2_id': 55,
+        'lines': [
+            {
+                'character_id': 49,
+                'line_text': 'bulk test'
+            }
+        ]
+    }
+    wrong_movie = {
+        'character_1_id': 0,
+        'character_2_id': 55,
+        'lines': [
+            {
+                'character_id': 0,
+                'line_text': 'This line should never be uploaded!'
+            }
+        ]
+    }
+    response = client.post('movies/3/conversations/bulk', json=[good, wrong_movie, good])
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body['created'] == 2
+    assert body['failed'] == 1
+    assert body['results'][1] == {'status_code': 422, 'detail': 'movie_id given does not include one or both characters.'}
+
+    ids = [body['results'][0]['conversation_id'], body['results'][2]['conversation_id']]
+    stmt = (s.select(db.conversations.c.conversation_id).where(db.conversations.c.conversation_id.in_(ids)))
+    with db.engine.connect() as conn:
+        assert len(conn.execute(stmt).all()) == 2
+
+def test_bulk_add_conversations_ndjson():
+    body = '\n'.join([
+        json.dumps({'character_1_id': 49, 'character_2_id': 55, 'lines': [{'character_id': 55, 'line_text': 'ndjson test'}]}),
+        '{not json',
+    ])
+    response = client.post('movies/3/conversations/bulk', content=body, headers={'content-type': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.json()['created'] == 1
+    assert response.json()['results'][1]['status_code'] == 400
+
+def test_add_conversation_invalidates_cache():
+    before = client.get("/characters/49").json()
+    response = client.post('movies/3/conversations/',
+        json={
+            'character_1_id': 49,
+            'character_2_id': 55,
+            'lines': [
+                {
+                    'character_id': 49,
+                    'line_text': 'cache test'
+                }
+            ]
+        }
+    )
+    assert response.status_code == 200
+
+    after = client.get("/characters/49").json()
+    partner = next(c for c in after['top_conversations'] if c['character_id'] == 55)
+    partner_before = next((c for c in before['top_conversations'] if c['character_id'] == 55), {'number_of_lines_together': 0})
+    assert partner['number_of_lines_together'] == partner_before['number_of_lines_together'] + 1
+
+def test_add_conversation_changes_etag():
+    etag = client.get("/characters/49").headers["ETag"]
+    response = client.post('movies/3/conversations/',
+        json={
+            'character_1_id': 49,
+            'character_2_id': 55,
+            'lines': [
+                {
+                    'character_id': 49,
+                    'line_text': 'etag test'
+                }
+            ]
+        }
+    )
+    assert response.status_code == 200
+
+    response = client.get("/characters/49", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_export():
+    response = client.get("/conversations/export?movie_id=117")
+    assert response.status_code == 200
+
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert all(conversation["movie"] == "legally blonde" for conversation in exported)
+
+    with open("test/conversations/16484.json", encoding="utf-8") as f:
+        assert next(c for c in exported if c["conversation_id"] == 16484) == json.load(f)
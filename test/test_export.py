@@ -0,0 +1,67 @@
+from src.api import export
+
+import asyncio
+
+
+def run(response, disconnect_after=None, closed=None):
+    """
+    Sends `response`, returning its body chunks and what had been `closed` by
+    the time it returned (before asyncio.run() closes any generators left
+    open). The client disconnects once it has `disconnect_after` chunks.
+    """
+
+    chunks = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("more_body"):
+            chunks.append(message["body"])
+            if len(chunks) == disconnect_after:
+                disconnected.set()
+                await asyncio.sleep(1)
+
+    async def main():
+        await response({"type": "http", "method": "GET", "path": "/"}, receive, send)
+        return list(closed or [])
+
+    return chunks, asyncio.run(main())
+
+
+def test_abandoned_export_closes_its_source():
+    closed = []
+
+    async def rows():
+        try:
+            for i in range(10):
+                yield [{"id": i}]
+        finally:
+            closed.append("rows")
+
+    async def records():
+        source = rows()
+        try:
+            async for batch in source:
+                yield batch
+        finally:
+            await source.aclose()
+
+    response = export.response(records(), export.export_format.ndjson, [], "test")
+    chunks, closed_by_then = run(response, disconnect_after=2, closed=closed)
+    assert len(chunks) == 2
+    assert closed_by_then == ["rows"]
+
+
+def test_empty_batches_are_not_sent():
+    async def records():
+        for batch in [[], [{"id": 1}], [], [], [{"id": 2}], []]:
+            yield batch
+
+    chunks, _ = run(export.response(records(), export.export_format.ndjson, [], "test"))
+    assert chunks == [b'{"id": 1}\n', b'{"id": 2}\n']
+
+    chunks, _ = run(export.response(records(), export.export_format.csv, ["id"], "test"))
+    assert chunks == [b"id\r\n1\r\n", b"2\r\n"]
@@ -0,0 +1,52 @@
+from src import graph
+
+import asyncio
+
+
+def movie_graph():
+    movie_graph = graph.MovieGraph(0, "epoch.0", "heat", {i: (str(i), None) for i in range(6)}, {})
+    movie_graph.add_lines(0, 1, 5)
+    movie_graph.add_lines(1, 2, 3)
+    movie_graph.add_lines(0, 3, 2)
+    movie_graph.add_lines(3, 2, 7)
+    movie_graph.add_lines(0, 1, 1)
+    movie_graph.add_lines(4, 4, 9)
+    return movie_graph
+
+
+def test_top_partners():
+    assert movie_graph().top_partners(0, 5) == [(1, 6), (3, 2)]
+    assert movie_graph().top_partners(2, 1) == [(3, 7)]
+    assert movie_graph().top_partners(4, 5) == []
+
+
+def test_shortest_path():
+    assert movie_graph().shortest_path(0, 2) == [0, 1, 2]
+    assert movie_graph().shortest_path(2, 2) == [2]
+    assert movie_graph().shortest_path(0, 5) is None
+
+
+def test_edges():
+    assert movie_graph().edges() == [(0, 1, 6), (0, 3, 2), (1, 2, 3), (2, 3, 7)]
+
+
+def test_subgraphs_are_bounded():
+    class Graph(graph.InteractionGraph):
+        loads = 0
+
+        async def load_movie(self, movie_id, version):
+            self.loads += 1
+            return graph.MovieGraph(movie_id, version, str(movie_id), {}, {})
+
+    async def visit(interactions, movie_ids):
+        for movie_id in movie_ids:
+            assert (await interactions.movie(movie_id)).movie_id == movie_id
+
+    interactions = Graph(max_movies=2)
+    asyncio.run(visit(interactions, [0, 1, 0, 2]))
+    assert interactions.loads == 3
+    assert interactions.movies.stats()["entries"] == 2
+
+    # 1 was the least recently used, so it's the one that was dropped.
+    asyncio.run(visit(interactions, [0, 2, 1]))
+    assert interactions.loads == 4
@@ -2,7 +2,12 @@ from fastapi.testclient import TestClient
 
 from src.api.server import app
 
+import csv
+import io
 import json
+from src import database as db
+import sqlalchemy as s
+import pytest
 
 client = TestClient(app)
 
@@ -52,3 +57,88 @@ def test_sort_filter_2():
 def test_404():
     response = client.get("/lines/1")
     assert response.status_code == 404
+
+def test_cursor():
+    response = client.get("/lines/?text=said&limit=30&sort=conversation")
+    assert response.status_code == 200
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/lines/?text=said&limit=10&sort=conversation&cursor={cursor}")
+    assert response.status_code == 200
+
+    with open(
+        "test/lines/lines-text=said&offset=30&limit=10&sort=conversation.json",
+        encoding="utf-8",
+    ) as f:
+        assert response.json() == json.load(f)
+
+def test_search():
+    response = client.get("/lines/?search=shakespeare&limit=10&sort=relevance")
+    assert response.status_code == 200
+
+    lines = response.json()
+    assert 0 < len(lines) <= 10
+    for line in lines:
+        assert "shakespeare" in line["text"].lower()
+
+def test_relevance_requires_search():
+    response = client.get("/lines/?sort=relevance")
+    assert response.status_code == 422
+
+@pytest.mark.postgres
+def test_get_line_single_query():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    s.event.listen(db.async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/lines/133")
+    finally:
+        s.event.remove(db.async_engine.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+def test_export():
+    response = client.get("/lines/export?name=amy")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["line_id"] for line in exported] == sorted(line["line_id"] for line in exported)
+
+    by_id = {line.pop("line_id"): line for line in exported}
+    with open("test/lines/lines-name=amy&limit=10.json", encoding="utf-8") as f:
+        for line in json.load(f):
+            assert by_id[line["line_id"]]["text"] == line["text"]
+            assert by_id[line["line_id"]]["movie_title"] == line["movie_title"]
+
+def test_export_csv():
+    response = client.get("/lines/export?name=amy&text=smoking&format=csv")
+    assert response.status_code == 200
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert "6337" in [row["line_id"] for row in rows]
+    assert all("smoking" in row["text"].lower() for row in rows)
+
+def test_batch():
+    response = client.post("/lines/batch", json={"ids": [19757, 999999999, 133, 19757]})
+    assert response.status_code == 200
+
+    with open("test/lines/133.json", encoding="utf-8") as f:
+        line_133 = json.load(f)
+    with open("test/lines/19757.json", encoding="utf-8") as f:
+        line_19757 = json.load(f)
+
+    assert response.json() == [
+        line_19757,
+        {"status_code": 404, "detail": "line not found."},
+        line_133,
+        line_19757,
+    ]
+
+def test_batch_too_many():
+    response = client.post("/lines/batch", json={"ids": list(range(1001))})
+    assert response.status_code == 413
@@ -0,0 +1,238 @@
+from fastapi.testclient import TestClient
+
+from src.api.server import app
+from src import cache
+from src import database as db
+from src import graph
+from src import memory
+
+import json
+import pytest
+import sqlalchemy as s
+
+client = TestClient(app)
+
+MOVIES = [
+    {'movie_id': '0', 'title': 'heat', 'year': '1995', 'imdb_rating': '8.2', 'imdb_votes': '100', 'raw_script_url': ''},
+    {'movie_id': '1', 'title': 'alien', 'year': '1979', 'imdb_rating': '8.5', 'imdb_votes': '200', 'raw_script_url': ''},
+]
+CHARACTERS = [
+    {'character_id': '0', 'name': 'NEIL', 'movie_id': '0', 'gender': 'M', 'age': ''},
+    {'character_id': '1', 'name': 'VINCENT', 'movie_id': '0', 'gender': 'M', 'age': ''},
+    {'character_id': '2', 'name': 'EADY', 'movie_id': '0', 'gender': '', 'age': ''},
+    {'character_id': '3', 'name': 'RIPLEY', 'movie_id': '1', 'gender': 'F', 'age': ''},
+]
+CONVERSATIONS = [
+    {'conversation_id': '0', 'character1_id': '0', 'character2_id': '1', 'movie_id': '0'},
+    {'conversation_id': '1', 'character1_id': '2', 'character2_id': '0', 'movie_id': '0'},
+]
+LINES = [
+    {'line_id': '0', 'character_id': '0', 'movie_id': '0', 'conversation_id': '0', 'line_sort': '2', 'line_text': 'I am running.'},
+    {'line_id': '1', 'character_id': '1', 'movie_id': '0', 'conversation_id': '0', 'line_sort': '1', 'line_text': 'Stop right there.'},
+    {'line_id': '2', 'character_id': '0', 'movie_id': '0', 'conversation_id': '0', 'line_sort': '3', 'line_text': 'Walk away.'},
+    {'line_id': '3', 'character_id': '2', 'movie_id': '0', 'conversation_id': '1', 'line_sort': '1', 'line_text': 'Where do you run to?'},
+]
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    dataset = memory.Dataset(MOVIES, CHARACTERS, CONVERSATIONS, LINES)
+    monkeypatch.setattr(db, "backend", "memory")
+    monkeypatch.setattr(memory, "_dataset", dataset)
+    monkeypatch.setattr(cache, "backend", cache.MemoryBackend(0, 0))
+    monkeypatch.setattr(graph, "interactions", graph.InteractionGraph())
+    return dataset
+
+
+def test_aggregates(dataset):
+    assert dataset.top_characters(0, 5) == [(0, 'NEIL', 2), (1, 'VINCENT', 1), (2, 'EADY', 1)]
+    assert dataset.top_characters(1, 5) == []
+    assert [(row.partner_id, row.line_count) for row in dataset.character(0)] == [(1, 3), (2, 1)]
+    assert [(row.partner_id, row.line_count) for row in dataset.character(3)] == [(None, None)]
+
+
+def test_get_character(dataset):
+    response = client.get("/characters/0")
+    assert response.status_code == 200
+    assert response.json() == {
+        'character_id': 0,
+        'character': 'NEIL',
+        'movie': 'heat',
+        'gender': 'M',
+        'top_conversations': [
+            {'character_id': 1, 'character': 'VINCENT', 'gender': 'M', 'number_of_lines_together': 3},
+            {'character_id': 2, 'character': 'EADY', 'gender': None, 'number_of_lines_together': 1},
+        ],
+    }
+
+    assert client.get("/characters/99").status_code == 404
+
+
+def test_get_line_and_conversation(dataset):
+    assert client.get("/lines/3").json() == {
+        'line_id': 3,
+        'conversation_id': 1,
+        'movie': 'heat',
+        'character': 'EADY',
+        'recipient': 'NEIL',
+        'text': 'Where do you run to?',
+    }
+    assert [line['line_id'] for line in client.get("/conversations/0").json()['lines']] == [1, 0, 2]
+
+
+def test_list_characters_cursor(dataset):
+    response = client.get("/characters/?sort=number_of_lines&limit=2")
+    assert [character['character_id'] for character in response.json()] == [0, 1]
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f"/characters/?sort=number_of_lines&limit=2&cursor={cursor}")
+    assert [character['character_id'] for character in response.json()] == [2]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get("/characters/?name=n&sort=character")
+    assert [character['character_id'] for character in response.json()] == [0, 1]
+
+
+def test_list_movies(dataset):
+    response = client.get("/movies/?sort=rating")
+    assert [movie['movie_title'] for movie in response.json()] == ['alien', 'heat']
+    assert response.json()[0]['imdb_rating'] == 8.5
+
+
+def test_search(dataset):
+    response = client.get("/lines/?search=run")
+    assert [line['line_id'] for line in response.json()] == [0, 3]
+
+    response = client.get("/lines/?search=run -where")
+    assert [line['line_id'] for line in response.json()] == [0]
+
+    response = client.get('/lines/?search="walk away" or stop&sort=relevance')
+    assert [line['line_id'] for line in response.json()] == [2, 1]
+
+
+def test_add_conversation(dataset):
+    response = client.post('movies/0/conversations/',
+        json={
+            'character_1_id': 1,
+            'character_2_id': 2,
+            'lines': [
+                {'character_id': 1, 'line_text': 'Hello.'},
+                {'character_id': 2, 'line_text': 'Hi.'},
+            ]
+        }
+    )
+    assert response.status_code == 200
+    assert response.json() == {'conversation_id': 2}
+
+    assert [line['text'] for line in client.get("/conversations/2").json()['lines']] == ['Hello.', 'Hi.']
+    assert dataset.top_characters(0, 5)[1] == (1, 'VINCENT', 2)
+    assert [(row.partner_id, row.line_count) for row in dataset.character(2)] == [(1, 2), (0, 1)]
+    assert [line['line_id'] for line in client.get("/lines/?text=hi").json()] == [5]
+
+    response = client.post('movies/1/conversations/',
+        json={'character_1_id': 1, 'character_2_id': 2, 'lines': [{'character_id': 1, 'line_text': 'x'}]}
+    )
+    assert response.status_code == 422
+
+
+def test_graph_follows_writes(dataset):
+    assert client.get("/characters/1/path/2").json() == [
+        {'character_id': 1, 'character': 'VINCENT'},
+        {'character_id': 0, 'character': 'NEIL'},
+        {'character_id': 2, 'character': 'EADY'},
+    ]
+
+    response = client.post('movies/0/conversations/',
+        json={'character_1_id': 1, 'character_2_id': 2, 'lines': [{'character_id': 1, 'line_text': 'Hello.'}]}
+    )
+    assert response.status_code == 200
+
+    assert len(client.get("/characters/1/path/2").json()) == 2
+    assert client.get("/characters/2/partners").json()[1] == {
+        'character_id': 1, 'character': 'VINCENT', 'gender': 'M', 'number_of_lines_together': 1,
+    }
+    assert client.get("/movies/0/graph").json()['interactions'] == [
+        {'character_1_id': 0, 'character_2_id': 1, 'number_of_lines_together': 3},
+        {'character_1_id': 0, 'character_2_id': 2, 'number_of_lines_together': 1},
+        {'character_1_id': 1, 'character_2_id': 2, 'number_of_lines_together': 1},
+    ]
+    assert client.get("/characters/0/path/3").status_code == 404
+
+
+def test_export(dataset):
+    response = client.get("/lines/export?format=csv&name=neil")
+    assert response.text.splitlines() == [
+        'line_id,conversation_id,movie_title,character,text',
+        '0,0,heat,NEIL,I am running.',
+        '2,0,heat,NEIL,Walk away.',
+    ]
+
+    response = client.get("/conversations/export?name=eady")
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {'conversation_id': 1, 'movie': 'heat', 'lines': [{'line_id': 3, 'character': 'EADY', 'text': 'Where do you run to?'}]},
+    ]
+
+
+def test_batch(dataset):
+    response = client.post("/lines/batch", json={"ids": [3, 9, 0]})
+    assert [line.get('line_id') for line in response.json()] == [3, None, 0]
+    assert response.json()[1] == {'status_code': 404, 'detail': 'line not found.'}
+
+    response = client.post("/characters/batch", json={"ids": [3, 0]})
+    assert [character['character'] for character in response.json()] == ['RIPLEY', 'NEIL']
+    assert response.json()[1] == client.get("/characters/0").json()
+
+    response = client.post("/conversations/batch", json={"ids": [1, 5, 0]})
+    assert response.json()[1] == {'status_code': 404, 'detail': 'conversation not found.'}
+    assert [line['line_id'] for line in response.json()[2]['lines']] == [1, 0, 2]
+
+    assert client.post("/conversations/batch", json={"ids": [0] * 1001}).status_code == 413
+
+
+def test_stats(dataset):
+    response = client.get("/movies/0/stats")
+    assert response.json() == {
+        'movie_id': 0,
+        'title': 'heat',
+        'total_lines': 4,
+        'total_conversations': 2,
+        'average_conversation_length': 2,
+        'lines_by_gender': {'male': 3, 'female': 0, 'unknown': 1},
+        'lines_per_character': [
+            {'character_id': 0, 'character': 'NEIL', 'num_lines': 2},
+            {'character_id': 1, 'character': 'VINCENT', 'num_lines': 1},
+            {'character_id': 2, 'character': 'EADY', 'num_lines': 1},
+        ],
+        'most_talkative_pair': {
+            'character_1_id': 0, 'character_1': 'NEIL', 'character_2_id': 1, 'character_2': 'VINCENT',
+            'movie': 'heat', 'number_of_lines_together': 3,
+        },
+    }
+    assert client.get("/movies/1/stats").json()['most_talkative_pair'] is None
+    assert client.get("/movies/9/stats").status_code == 404
+
+    client.post('movies/0/conversations/',
+        json={'character_1_id': 1, 'character_2_id': 2, 'lines': [{'character_id': 2, 'line_text': 'Hi.'}]}
+    )
+    response = client.get("/stats")
+    assert response.json()['total_movies'] == 2
+    assert response.json()['total_characters'] == 4
+    assert response.json()['total_conversations'] == 3
+    assert response.json()['average_conversation_length'] == 1.67
+    assert response.json()['lines_by_gender'] == {'male': 3, 'female': 0, 'unknown': 2}
+    assert [character['character_id'] for character in response.json()['top_characters']] == [0, 2, 1]
+    assert client.get("/movies/0/stats").json()['total_lines'] == 5
+
+
+@pytest.mark.postgres
+def test_database_collates_by_code_point():
+    # The memory backend sorts names and titles by code point, so the
+    # database has to as well (COLLATE "C"). Under a locale collation such as
+    # en_US.UTF-8, "MR X" and "Mr. X" or "de niro" and "Dead" sort differently
+    # and the two backends' pages diverge.
+    import sqlalchemy as s
+
+    with db.engine.connect() as conn:
+        for column in (db.characters.c.name, db.movies.c.title):
+            values = conn.execute(s.select(column).where(column.is_not(None)).order_by(column)).scalars().all()
+            assert values == sorted(values)
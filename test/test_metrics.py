@@ -0,0 +1,76 @@
+from fastapi.testclient import TestClient
+
+from src.api.server import app
+from src import metrics
+
+import pytest
+import sqlalchemy as s
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry(slow_statements=2)
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def test_histogram_is_cumulative():
+    histogram = metrics.Histogram((1, 5))
+    for value in (0, 1, 3, 7):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative()) == [(1, 2), (5, 3), (float("inf"), 4)]
+    assert histogram.sum == 11
+
+
+def test_statements_are_counted_per_request(tmp_path, registry):
+    engine = s.create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics.instrument(engine)
+
+    request = metrics.RequestMetrics("/movies/{movie_id}")
+    token = metrics.current.set(request)
+    try:
+        with engine.connect() as conn:
+            conn.execute(s.text("select 1"))
+            conn.execute(s.text("select  2"))
+        with engine.connect() as conn:
+            conn.execute(s.text("select 1"))
+    finally:
+        metrics.current.reset(token)
+
+    assert request.queries == 3
+    assert request.checkouts == 2
+    assert registry.statement_latency.count == 3
+    assert registry.slowest.keys() == {"select 1", "select 2"}
+    assert registry.slowest["select 1"][1:] == ["/movies/{movie_id}", 2]
+
+    with engine.connect() as conn:
+        with pytest.raises(s.exc.OperationalError):
+            conn.execute(s.text("select * from missing"))
+        conn.execute(s.text("select 3"))
+    assert registry.statement_latency.count == 4
+
+
+def test_metrics_endpoint(registry):
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"].startswith("app;dur=")
+    assert 'db;dur=0.0;desc="0 queries"' in response.headers["Server-Timing"]
+
+    client.get("/movies/not-a-number")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    text = response.text
+    assert 'movie_api_request_duration_seconds_count{method="GET",route="/",status="200"} 1' in text
+    assert 'movie_api_request_duration_seconds_count{method="GET",route="/movies/{movie_id}",status="422"} 1' in text
+    assert 'movie_api_request_queries_bucket{method="GET",route="/",le="0"} 1' in text
+    assert "movie_api_cache_hits" in text
+
+
+def test_label_escaping():
+    assert metrics.format_labels(("statement",), ('where name = "a\\b"\n',)) == '{statement="where name = \\"a\\\\b\\"\\n"}'
@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
 
 from src.api.server import app
+from src.api import pagination
 
+import base64
 import json
 
 client = TestClient(app)
@@ -52,3 +54,85 @@ def test_sort_filter_2():
 def test_404():
     response = client.get("/movies/1")
     assert response.status_code == 404
+
+def test_cursor():
+    response = client.get("/movies/?limit=30&sort=rating")
+    assert response.status_code == 200
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/movies/?limit=10&sort=rating&cursor={cursor}")
+    assert response.status_code == 200
+
+    with open(
+        "test/movies/movies-offset=30&limit=10&sort=rating.json",
+        encoding="utf-8",
+    ) as f:
+        assert response.json() == json.load(f)
+
+def test_cursor_wrong_types():
+    def raw(payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+    for cursor in [
+        pagination.encode_cursor("rating", 7.5, "44"),
+        pagination.encode_cursor("rating", {"a": 1}, 44),
+        pagination.encode_cursor("rating", "7.5", 44),
+        pagination.encode_cursor("rating", 7.5, 2**40),
+        raw({"sort": "rating", "value": 7.5, "id": 44}),
+        raw(["rating", 7.5]),
+    ]:
+        response = client.get(f"/movies/?sort=rating&cursor={cursor}")
+        assert response.status_code == 422
+
+    response = client.get(f"/movies/?sort=rating&cursor={pagination.encode_cursor('rating', 8, 44)}")
+    assert response.status_code == 200
+
+def test_not_modified():
+    response = client.get("/movies/44")
+    etag = response.headers["ETag"]
+    assert "Cache-Control" in response.headers
+
+    response = client.get("/movies/44", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    response = client.get("/movies/0", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+def test_movie_graph():
+    response = client.get("/movies/0/graph")
+    assert response.status_code == 200
+    graph = response.json()
+    assert graph["title"] == "10 things i hate about you"
+    assert {"character_1_id": 4, "character_2_id": 9, "number_of_lines_together": 32} in graph["interactions"]
+
+    assert client.get("/movies/123456/graph").status_code == 404
+
+def test_movie_stats():
+    response = client.get("/movies/0/stats")
+    assert response.status_code == 200
+    stats = response.json()
+
+    with open("test/movies/0.json", encoding="utf-8") as f:
+        assert stats["lines_per_character"][:5] == json.load(f)["top_characters"]
+
+    assert stats["total_lines"] == sum(character["num_lines"] for character in stats["lines_per_character"])
+    assert sum(stats["lines_by_gender"].values()) == stats["total_lines"]
+    assert stats["average_conversation_length"] == round(stats["total_lines"] / stats["total_conversations"], 2)
+
+    pair = stats["most_talkative_pair"]
+    assert pair["number_of_lines_together"] >= 32
+    assert pair["character_1_id"] < pair["character_2_id"]
+
+    assert client.get("/movies/123456/stats").status_code == 404
+
+def test_corpus_stats():
+    response = client.get("/stats")
+    assert response.status_code == 200
+    stats = response.json()
+
+    assert stats["total_lines"] > client.get("/movies/0/stats").json()["total_lines"]
+    assert sum(stats["lines_by_gender"].values()) == stats["total_lines"]
+    assert len(stats["top_characters"]) == 10
+    assert stats["top_characters"][0]["num_lines"] >= 155
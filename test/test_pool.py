@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.api.server import app
+from src import database as db
+from src import pool
+
+import asyncio
+import pytest
+import sqlalchemy as s
+
+client = TestClient(app)
+
+
+@pytest.mark.postgres
+def test_pool_status():
+    response = client.get("/pool/")
+    assert response.status_code == 200
+    assert {"pool", "capacity"} <= response.json().keys()
+
+
+def test_checkout_timeout_is_recorded(tmp_path):
+    engine = s.create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=pool.TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+
+    with engine.connect():
+        assert pool.status(engine, 1)["saturation"] == 1.0
+        with pytest.raises(s.exc.TimeoutError):
+            engine.connect()
+
+    status = pool.status(engine, 1)
+    assert status["checkouts"] == 1
+    assert status["timeouts"] == 1
+    assert status["wait_max_ms"] >= 100
+
+
+def test_pooled_engines_keep_their_own_stats(tmp_path, monkeypatch):
+    # conftest.py turns pooling off for the app; the options it would use
+    # otherwise.
+    monkeypatch.delenv("DB_SERVERLESS", raising=False)
+    options = db.engine_options()
+    assert options["poolclass"] is pool.TimedQueuePool
+
+    engine = s.create_engine(f"sqlite:///{tmp_path / 'pool.db'}", **options)
+    other = s.create_engine(f"sqlite:///{tmp_path / 'other.db'}", **options)
+
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(s.text("select 1"))
+    with other.connect() as conn:
+        conn.execute(s.text("select 1"))
+
+    status = pool.status(engine, db.pool_capacity(options))
+    assert status["pool"] == "TimedQueuePool"
+    assert status["checkouts"] == 3
+    assert status["idle"] == 1
+    assert status["wait_total_ms"] >= 0
+    assert pool.status(other, db.pool_capacity(options))["checkouts"] == 1
+
+    # Disposing the engine replaces its pool, but not the totals.
+    engine.dispose()
+    assert pool.status(engine, db.pool_capacity(options))["checkouts"] == 3
+
+
+@pytest.mark.postgres
+def test_async_pool_stats(monkeypatch):
+    monkeypatch.delenv("DB_SERVERLESS", raising=False)
+    options = db.engine_options(asynchronous=True)
+    assert options["poolclass"] is pool.TimedAsyncAdaptedQueuePool
+
+    async def checkouts():
+        engine = create_async_engine(db.async_database_connection_url(), **options)
+        try:
+            for _ in range(2):
+                async with engine.connect() as conn:
+                    await conn.execute(s.text("select 1"))
+            return pool.status(engine, db.pool_capacity(options))
+        finally:
+            await engine.dispose()
+
+    status = asyncio.run(checkouts())
+    assert status["pool"] == "TimedAsyncAdaptedQueuePool"
+    assert status["checkouts"] == 2
+    assert status["idle"] == 1
@@ -0,0 +1,71 @@
+from collections import Counter
+
+from scripts import synthetic
+from src import memory
+
+
+def profile():
+    return synthetic.Profile(
+        movies=[
+            {"movie_id": "0", "title": "heat", "year": "1995", "imdb_rating": "8.2", "imdb_votes": "100"},
+            {"movie_id": "1", "title": "the thing", "year": "1982", "imdb_rating": "8.1", "imdb_votes": "90"},
+        ],
+        characters=[
+            {"character_id": "0", "name": "NEIL", "movie_id": "0", "gender": "M", "age": "2"},
+            {"character_id": "1", "name": "VINCENT", "movie_id": "0", "gender": "M", "age": "1"},
+            {"character_id": "2", "name": "EADY", "movie_id": "0", "gender": "F", "age": ""},
+            {"character_id": "3", "name": "MACREADY", "movie_id": "1", "gender": "M", "age": "1"},
+            {"character_id": "4", "name": "CHILDS", "movie_id": "1", "gender": "", "age": ""},
+        ],
+        conversations=[
+            {"conversation_id": "0", "character1_id": "0", "character2_id": "1", "movie_id": "0"},
+            {"conversation_id": "1", "character1_id": "0", "character2_id": "2", "movie_id": "0"},
+            {"conversation_id": "2", "character1_id": "3", "character2_id": "4", "movie_id": "1"},
+        ],
+        lines=[
+            {"conversation_id": "0", "line_text": "Cut to the chase."},
+            {"conversation_id": "0", "line_text": "Don't let yourself get attached."},
+            {"conversation_id": "1", "line_text": "Coffee."},
+            {"conversation_id": "2", "line_text": "Why don't we just wait here."},
+        ],
+    )
+
+
+def test_generated_movies_follow_a_template():
+    tables = {table.name: list(rows) for table, (_, rows) in synthetic.generate(profile(), 50).items()}
+
+    assert [movie[0] for movie in tables["movies"]] == list(range(50))
+    assert [line[0] for line in tables["lines"]] == list(range(len(tables["lines"])))
+
+    movie_of = {character[0]: character[2] for character in tables["characters"]}
+    characters = Counter(movie_of.values())
+    conversations = Counter(conversation[3] for conversation in tables["conversations"])
+    # Every movie is shaped like heat (3 characters, 2 conversations) or the
+    # thing (2 characters, 1 conversation).
+    assert {(characters[movie_id], conversations[movie_id]) for movie_id in range(50)} == {(3, 2), (2, 1)}
+
+    for conversation_id, character1_id, character2_id, movie_id in tables["conversations"]:
+        assert movie_of[character1_id] == movie_of[character2_id] == movie_id
+
+    lengths = Counter(line[3] for line in tables["lines"])
+    assert set(lengths.values()) <= {1, 2}
+    for line_id, character_id, movie_id, conversation_id, line_sort, text in tables["lines"]:
+        assert movie_of[character_id] == movie_id
+        assert 1 <= line_sort <= lengths[conversation_id]
+        assert 1 <= len(text.split()) <= 6
+
+
+def test_same_seed_same_corpus():
+    def corpus(random_seed):
+        return [list(rows) for _, rows in synthetic.generate(profile(), 10, random_seed).values()]
+
+    assert corpus(1) == corpus(1)
+    assert corpus(1) != corpus(2)
+
+
+def test_csvs_load_in_the_memory_backend(tmp_path):
+    counts = synthetic.write_csvs(tmp_path, synthetic.generate(profile(), 20))
+
+    dataset = memory.Dataset(*(memory.read_csv(tmp_path, filename) for filename in memory.DATA_FILES))
+    assert dataset.corpus_stats().movie_count == counts["movies"] == 20
+    assert dataset.corpus_stats().line_count == counts["lines"]